@@ -0,0 +1,179 @@
+"""Хранилище резервных копий прошивки
+
+Образ, выгружаемый с устройства, по мере приема сжимается gzip и хешируется,
+поэтому на диск сразу пишется итоговый файл backups/<sha256>.bin.gz без
+промежуточной несжатой копии. Одинаковые образы (например, повторная
+резервная копия перед повторной установкой) хранятся один раз.
+
+backups/index.json связывает идентификатор устройства (см. discovery.py) и
+версию его прошивки с образом, а также хранит для каждого устройства
+последнюю копию. Цель отката находится обращением к словарю, без просмотра
+каталога. Запись образа содержит только сведения о самом образе (размеры,
+время первого сохранения), а порт и версия хранятся в записях устройства:
+один и тот же образ может быть резервной копией нескольких устройств.
+"""
+
+import os
+import gzip
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+from integrity import IntegrityError
+from jsonfile import write_json
+from locking import FileLock
+
+INDEX_NAME = "index.json"
+LOCK_NAME = ".lock"
+SUFFIX = ".bin.gz"
+
+
+class BackupWriter:
+    """Прием образа с устройства: сжатие и хеширование по ходу записи
+
+    Используется как контекстный менеджер: при успешном выходе образ
+    добавляется в хранилище, при ошибке временный файл удаляется.
+    """
+
+    def __init__(self, store, identity, port, version):
+        self.store = store
+        self.identity = identity
+        self.port = port
+        self.version = version
+        self.size = 0
+        self.record = None
+        fd, self.tmp_path = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=store.root)
+        self._file = os.fdopen(fd, 'wb')
+        self._gzip = gzip.GzipFile(fileobj=self._file, mode='wb', mtime=0)
+        self._sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self._sha256.update(data)
+        self._gzip.write(data)
+        self.size += len(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._gzip.close()
+        self._file.close()
+        if exc_type is not None:
+            os.remove(self.tmp_path)
+            return False
+        self.record = self.store.add(self.tmp_path, self._sha256.hexdigest(), self.size,
+                                     self.identity, self.port, self.version)
+        return False
+
+
+class BackupStore:
+    """Сжатые образы прошивки и индекс по устройствам и версиям"""
+
+    def __init__(self, root, identify=None):
+        self.root = root
+        self.identify = identify or (lambda port: port)
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self.lock_path = os.path.join(root, LOCK_NAME)
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._index = self._load()
+
+    def path(self, sha256):
+        return os.path.join(self.root, f"{sha256}{SUFFIX}")
+
+    def writer(self, port, version=None):
+        """Приемник образа прошивки устройства на порту port"""
+        return BackupWriter(self, self.identify(port), port, version)
+
+    def add(self, tmp_path, sha256, size, identity, port, version=None):
+        """Регистрация принятого образа; совпадающий образ не сохраняется повторно"""
+        path = self.path(sha256)
+        with self._lock, FileLock(self.lock_path):
+            self._index = self._load()
+            image = self._index['backups'].get(sha256)
+            if image is not None and os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+            now = time.time()
+            self._index['backups'][sha256] = {
+                'sha256': sha256,
+                'size': size,
+                'stored': os.path.getsize(path),
+                'created': image.get('created', now) if image else now,
+            }
+            entry = {
+                'sha256': sha256,
+                'port': port,
+                'version': str(version) if version is not None else None,
+                'created': now,
+            }
+            device = self._index['devices'].setdefault(identity, {'latest': None, 'versions': {}})
+            device['latest'] = entry
+            if version is not None:
+                device['versions'][str(version)] = entry
+            self._save()
+            return self._record(identity, entry)
+
+    def latest(self, port):
+        """Последняя резервная копия устройства на порту port или None"""
+        identity = self.identify(port)
+        with self._lock, FileLock(self.lock_path):
+            self._index = self._load()
+            device = self._index['devices'].get(identity)
+            return self._record(identity, device['latest']) if device else None
+
+    def find(self, port, version):
+        """Резервная копия устройства с прошивкой версии version или None"""
+        identity = self.identify(port)
+        with self._lock, FileLock(self.lock_path):
+            self._index = self._load()
+            device = self._index['devices'].get(identity, {})
+            return self._record(identity, device.get('versions', {}).get(str(version)))
+
+    def open(self, record):
+        """Поток распакованного образа"""
+        return gzip.open(self.path(record['sha256']), 'rb')
+
+    def verify(self, record, check_cancelled=None):
+        """Проверка образа по SHA-256 перед восстановлением"""
+        sha256 = hashlib.sha256()
+        try:
+            with self.open(record) as stream:
+                for block in iter(lambda: stream.read(1024 * 1024), b''):
+                    if check_cancelled:
+                        check_cancelled()
+                    sha256.update(block)
+        except (OSError, EOFError) as e:
+            raise IntegrityError(f"Резервная копия повреждена: {e}")
+        if sha256.hexdigest() != record['sha256']:
+            raise IntegrityError("Контрольная сумма резервной копии не совпадает")
+
+    def _record(self, identity, entry):
+        """Резервная копия устройства: сведения об образе и о копии этого устройства"""
+        if entry is None:
+            return None
+        if isinstance(entry, str):
+            # Индекс прежнего формата: у устройства только SHA-256 образа,
+            # порт и версия - в записи образа
+            entry = {'sha256': entry}
+        image = self._index['backups'].get(entry['sha256'])
+        if image is None:
+            return None
+        record = {'port': None, 'version': None}
+        record.update(image)
+        record.update(entry)
+        record['identity'] = identity
+        return record
+
+    def _load(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'devices': {}, 'backups': {}}
+
+    def _save(self):
+        write_json(self.index_path, self._index, indent=1)
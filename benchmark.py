@@ -0,0 +1,287 @@
+"""Измерение производительности обновления на эмуляторах устройств
+
+Для каждого сочетания размера архива, числа файлов в нем и числа устройств
+публикуется релиз на локальном сервере (github_stub.py), запускаются
+эмуляторы устройств (emulator.py) с заданной скоростью линии, задержкой,
+временем записи во флеш и вероятностью ошибки бита, и выполняется полный
+цикл: проверка и загрузка релиза, резервная копия и установка (на
+несколько устройств - параллельно, как fleet).
+
+Каждый прогон выполняется в отдельном процессе, чтобы пиковый объем
+памяти (RSS) относился только к нему; эмуляторы и сервер работают
+в основном процессе. Время этапов берется из журнала событий прогона
+(metrics.py), для нескольких устройств оно суммируется по устройствам.
+Результаты сохраняются в JSON вместе с коммитом и параметрами запуска,
+--compare сравнивает их с результатами предыдущего запуска:
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import zipfile
+import tempfile
+import statistics
+import subprocess
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from emulator import DEFAULT_IMAGE_SIZE, MAX_BAUDRATE, VERSION_FILE, DeviceEmulator, \
+    firmware_image
+
+DEFAULT_SIZES = "256K,1M"
+DEFAULT_FILES = "1,50"
+DEFAULT_DEVICES = "1,4"
+RELEASE_TAG = "v2.0.0"
+DEVICE_VERSION = "1.0.0"
+
+SIZE_SUFFIXES = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+WORDS = [b"baud", b"timeout", b"sensor", b"channel", b"enabled", b"threshold", b"mode"]
+
+
+def parse_size(text):
+    """Размер вида 512, 256K или 4M в байтах"""
+    text = text.strip().upper()
+    if text[-1:] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def format_size(size):
+    for suffix, factor in sorted(SIZE_SUFFIXES.items(), key=lambda item: -item[1]):
+        if size >= factor and size % factor == 0:
+            return f"{size // factor}{suffix}"
+    return str(size)
+
+
+def make_archive(size, files, seed=0):
+    """ZIP-архив релиза: files файлов общим объемом около size байт
+
+    Половина каждого файла - случайные байты (как скомпилированный код),
+    половина - хорошо сжимаемый текст, чтобы сжатие при передаче работало
+    так же, как на реальных релизах.
+    """
+    rng = random.Random(seed)
+    file_size = max(1, size // files)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for index in range(files):
+            code = rng.randbytes(file_size // 2)
+            text = bytearray()
+            while len(text) < file_size - len(code):
+                text += rng.choice(WORDS) + b"=" + str(rng.randrange(1000)).encode() + b"\n"
+            name = "firmware.bin" if files == 1 else f"data/file{index:04d}.bin"
+            archive.writestr(name, code + bytes(text[:file_size - len(code)]))
+        archive.writestr(VERSION_FILE, RELEASE_TAG.lstrip('v'))
+    return buffer.getvalue()
+
+
+def peak_rss():
+    """Пиковый объем памяти процесса в байтах или None, если не поддерживается"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В Linux ru_maxrss в килобайтах, в macOS - в байтах
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def run_scenario(config):
+    """Один прогон в текущем процессе, возвращает результаты измерений"""
+    from core import UpdaterCore
+    from fleet import PortResult
+    from metrics import EVENTS_NAME
+
+    metrics_dir = os.path.join(config['data_dir'], "metrics")
+    core = UpdaterCore(config['data_dir'], api_url=config['api_url'], metrics_dir=metrics_dir)
+    ports = config['ports']
+
+    started = time.perf_counter()
+    release = core.fetch_release()
+    fetched = time.perf_counter()
+    if len(ports) == 1:
+        core.install(ports[0], release)
+    else:
+        failed = [result for result in core.fleet(ports, release)
+                  if result.status != PortResult.UPDATED]
+        if failed:
+            raise RuntimeError("; ".join(str(result) for result in failed))
+    finished = time.perf_counter()
+
+    phases = {}
+    serial = {'payload_bytes': 0, 'wire_bytes': 0, 'seconds': 0.0, 'retransmits': 0}
+    with open(os.path.join(metrics_dir, EVENTS_NAME), encoding='utf-8') as f:
+        for line in f:
+            event = json.loads(line)
+            if event['event'] == 'phase':
+                phases[event['phase']] = phases.get(event['phase'], 0.0) + event['seconds']
+            elif event['event'] == 'transfer' and event['direction'] == 'send':
+                serial['payload_bytes'] += event['bytes']
+                serial['wire_bytes'] += event['wire_bytes']
+                serial['seconds'] += event['seconds']
+                serial['retransmits'] += event['retransmits']
+    # Полезная скорость одного устройства и суммарная по всем во время установки
+    serial['goodput'] = serial['payload_bytes'] / serial['seconds'] if serial['seconds'] else 0.0
+    serial['aggregate_goodput'] = serial['payload_bytes'] / (finished - fetched)
+    return {
+        'seconds': {'total': finished - started, 'fetch': fetched - started,
+                    'install': finished - fetched},
+        'phases': phases,
+        'serial': serial,
+        'peak_rss': peak_rss(),
+    }
+
+
+def _median(runs, section):
+    keys = sorted({key for run in runs for key in run[section]})
+    return {key: statistics.median(run[section].get(key, 0) for run in runs) for key in keys}
+
+
+def benchmark(size, files, devices, args):
+    """Прогоны одного сочетания параметров с эмуляторами и сервером релизов
+
+    Возвращает медианы измерений по --repeat прогонам.
+    """
+    from github_stub import ReleaseServer
+
+    name = f"{format_size(size)}-{files}f-{devices}d"
+    archive = make_archive(size, files, args.seed)
+    runs = []
+    for _ in range(args.repeat):
+        data_dir = tempfile.mkdtemp(prefix="benchmark-")
+        emulators = [DeviceEmulator(DEVICE_VERSION, firmware_image(args.image_size, index),
+                                    baudrate=args.baud, latency=args.latency,
+                                    flash_delay=args.flash_delay, ber=args.ber,
+                                    seed=args.seed + index)
+                     for index in range(devices)]
+        try:
+            with ReleaseServer(max_rate=args.http_rate) as server:
+                server.add_release(RELEASE_TAG, {"update.zip": archive})
+                config = {
+                    'data_dir': data_dir,
+                    'api_url': server.api_url,
+                    'ports': [emulator.listen() for emulator in emulators],
+                }
+                child = subprocess.run([sys.executable, os.path.abspath(__file__),
+                                        "--run", json.dumps(config)],
+                                       capture_output=True, text=True)
+        finally:
+            for emulator in emulators:
+                emulator.close()
+            shutil.rmtree(data_dir, ignore_errors=True)
+        if child.returncode != 0:
+            lines = child.stderr.strip().splitlines()
+            error = lines[-1] if lines else f"код завершения {child.returncode}"
+            return {'name': name, 'archive_size': size, 'archive_bytes': len(archive),
+                    'files': files, 'devices': devices, 'error': error}
+        runs.append(json.loads(child.stdout))
+
+    rss = [run['peak_rss'] for run in runs if run['peak_rss'] is not None]
+    return {
+        'name': name,
+        'archive_size': size,
+        'archive_bytes': len(archive),
+        'files': files,
+        'devices': devices,
+        'runs': len(runs),
+        'seconds': _median(runs, 'seconds'),
+        'phases': _median(runs, 'phases'),
+        'serial': _median(runs, 'serial'),
+        'peak_rss': max(rss) if rss else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_result(result, previous=None):
+    if 'error' in result:
+        return f"{result['name']:<16} ошибка: {result['error']}"
+    seconds = result['seconds']
+    rss = f"{result['peak_rss'] / 1024 ** 2:6.1f}" if result['peak_rss'] else "     -"
+    line = (f"{result['name']:<16} {seconds['total']:8.2f} {seconds['fetch']:8.2f} "
+            f"{seconds['install']:8.2f} {result['serial']['goodput'] / 1024:9.1f} {rss}")
+    if previous and 'error' not in previous:
+        change = seconds['total'] / previous['seconds']['total'] - 1
+        line += f"   {previous['seconds']['total']:8.2f} ({change:+.1%})"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Измерение производительности обновления на эмуляторах устройств")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="объемы файлов релиза через запятую (K, M)")
+    parser.add_argument("--files", default=DEFAULT_FILES, help="число файлов в релизе")
+    parser.add_argument("--devices", default=DEFAULT_DEVICES,
+                        help="число одновременно обновляемых устройств")
+    parser.add_argument("--repeat", type=int, default=1, help="повторов каждого сочетания")
+    parser.add_argument("--baud", type=int, default=MAX_BAUDRATE,
+                        help="максимальная скорость порта устройства")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка линии, секунды")
+    parser.add_argument("--flash-delay", type=float, default=0.0,
+                        help="время записи 1 КБ во флеш, секунды")
+    parser.add_argument("--ber", type=float, default=0.0, help="вероятность ошибки бита")
+    parser.add_argument("--image-size", type=parse_size, default=DEFAULT_IMAGE_SIZE,
+                        help="размер образа прошивки для резервной копии")
+    parser.add_argument("--http-rate", type=parse_size,
+                        help="скорость отдачи архива сервером, байт/с (K, M)")
+    parser.add_argument("--seed", type=int, default=0, help="начальное значение генераторов")
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    parser.add_argument("--compare", help="JSON предыдущего запуска для сравнения")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run:
+        # Дочерний процесс одного прогона
+        print(json.dumps(run_scenario(json.loads(args.run))))
+        return 0
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = {result['name']: result for result in json.load(f)['results']}
+
+    report = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {key: getattr(args, key) for key in
+                     ('baud', 'latency', 'flash_delay', 'ber', 'image_size', 'http_rate',
+                      'repeat', 'seed')},
+        'results': [],
+    }
+    print(f"{'сценарий':<16} {'всего, с':>8} {'релиз':>8} {'прошивка':>8} {'КБ/с':>9} "
+          f"{'RSS, МБ':>6}", flush=True)
+    for size in (parse_size(size) for size in args.sizes.split(',')):
+        for files in (int(files) for files in args.files.split(',')):
+            for devices in (int(devices) for devices in args.devices.split(',')):
+                result = benchmark(size, files, devices, args)
+                report['results'].append(result)
+                print(format_result(result, previous.get(result['name'])), flush=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+    return 1 if any('error' in result for result in report['results']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Платы устройств и выбор архивов релиза для них
+
+Если прошивки для разных плат различаются, релиз содержит отдельный
+архив для каждой: "<имя>-<плата>.zip" (или через "_"), например
+firmware-uno.zip и firmware-mega.zip. Плата определяется по идентификатору
+USB (VID:PID) из таблицы BOARDS; для остальных USB-устройств идентификатор
+платы - "usb-<vid>-<pid>" в шестнадцатеричном виде, например
+firmware-usb-1a86-7523.zip. Без префикса usb окончание вида "2024-0115"
+(дата в имени) за идентификатор не принимается. Общий для всех плат архив
+называется без такого окончания.
+"""
+
+import re
+
+# Платы Arduino по VID:PID (у Leonardo, Micro и Due - и загрузчик, и скетч)
+BOARDS = {
+    '2341:0001': 'uno',
+    '2341:0043': 'uno',
+    '2341:0243': 'uno',
+    '2a03:0043': 'uno',
+    '2341:0010': 'mega',
+    '2341:0042': 'mega',
+    '2a03:0042': 'mega',
+    '2341:0036': 'leonardo',
+    '2341:8036': 'leonardo',
+    '2341:0037': 'micro',
+    '2341:8037': 'micro',
+    '2341:003d': 'due',
+    '2341:003e': 'due',
+}
+
+USB_ID_PATTERN = re.compile(r'^([0-9a-f]{4}):([0-9a-f]{4})(:|$)')
+BOARD_SUFFIX_PATTERN = re.compile(r'[-_](usb-[0-9a-f]{4}-[0-9a-f]{4})$')
+
+
+def board_id(identity):
+    """Идентификатор платы по идентификатору устройства "vid:pid:серийный номер"
+
+    Для портов без идентификатора USB возвращает None.
+    """
+    match = USB_ID_PATTERN.match(identity or "")
+    if match is None:
+        return None
+    usb_id = f"{match.group(1)}:{match.group(2)}"
+    return BOARDS.get(usb_id, f"usb-{match.group(1)}-{match.group(2)}")
+
+
+def asset_board(name, boards=()):
+    """Плата, для которой предназначен архив name, или None для общего архива"""
+    stem = name.lower()[:-len('.zip')] if name.lower().endswith('.zip') else name.lower()
+    match = BOARD_SUFFIX_PATTERN.search(stem)
+    if match is not None:
+        return match.group(1)
+    # Более длинные имена проверяются раньше, чтобы окончание имени одной
+    # платы не приняли за другую
+    for board in sorted(set(BOARDS.values()) | set(boards) - {None}, key=len, reverse=True):
+        if stem.endswith((f"-{board}", f"_{board}")):
+            return board
+    return None
+
+
+def select_assets(assets, boards=()):
+    """Архивы релиза для плат boards: {плата: ассет}, общий архив - под ключом None
+
+    Платы без своего архива и устройства без идентификатора USB (None
+    в boards) получают общий. Если плат нет (устройства не подключены),
+    выбирается общий архив, а если его нет - архивы всех плат: загрузить
+    заранее можно только их.
+    """
+    archives = [asset for asset in assets if asset['name'].lower().endswith('.zip')]
+    if not archives:
+        return {}
+    by_board = {}
+    generic = None
+    for asset in archives:
+        board = asset_board(asset['name'], boards)
+        if board is None:
+            generic = generic or asset
+        else:
+            by_board.setdefault(board, asset)
+
+    if not boards:
+        return {None: generic} if generic is not None else by_board
+    selected = {board: by_board[board] for board in boards if board in by_board}
+    if generic is not None and len(selected) < len(set(boards)):
+        selected[None] = generic
+    return selected
@@ -0,0 +1,208 @@
+"""Каталог всех релизов репозитория с постраничной загрузкой и кэшем
+
+Список релизов GitHub (/releases) загружается страницами по PER_PAGE и
+хранится в releases/catalog.json. Первая страница запрашивается условно
+(If-None-Match): ответ 304 означает, что новых релизов нет, и сеть больше
+не нужна. Иначе страницы запрашиваются до первой, на которой встретился
+уже известный и не изменившийся релиз: GitHub отдает релизы от новых
+к старым, поэтому более старые страницы повторно не загружаются.
+
+Все запросы к каталогу (версии по диапазону "SimpleSpec" вида
+">=1.2,<2", новейшая совместимая версия, кратчайший путь обновления)
+выполняются по локальным данным.
+
+Если версия требует промежуточного обновления, в описании релиза
+указывается строка "Requires: <диапазон>" - версии, с которых на нее
+можно обновиться напрямую, например "Requires: >=1.4.0".
+"""
+
+import re
+import json
+import threading
+
+from semantic_version import SimpleSpec, Version
+
+from jsonfile import write_json
+
+CATALOG_NAME = "catalog.json"
+PER_PAGE = 100
+
+REQUIRES_PATTERN = re.compile(r'^\s*Requires:\s*(.+?)\s*$', re.IGNORECASE | re.MULTILINE)
+
+
+def parse_requires(body):
+    """Диапазон версий из строки "Requires:" описания релиза или None"""
+    match = REQUIRES_PATTERN.search(body or "")
+    if match is None:
+        return None
+    try:
+        return str(SimpleSpec(match.group(1)))
+    except ValueError:
+        return None
+
+
+def _spec(spec):
+    return SimpleSpec(spec) if isinstance(spec, str) else spec
+
+
+class ReleaseCatalog:
+    """Локальный индекс релизов с инкрементальным обновлением"""
+
+    def __init__(self, http, url, path):
+        self.http = http
+        self.url = url
+        self.path = path
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Повторное чтение каталога (его мог обновить другой процесс)"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            releases, complete = data['releases'], data['complete']
+        except (OSError, ValueError, KeyError):
+            releases, complete = {}, False
+        with self._lock:
+            self._releases = releases
+            self._complete = complete
+
+    def refresh(self, full=False, check_cancelled=None):
+        """Загрузка новых и измененных релизов, возвращает число изменений
+
+        С full=True каталог загружается заново целиком, в том числе чтобы
+        убрать удаленные из репозитория релизы.
+        """
+        with self._lock:
+            known = {} if full else dict(self._releases)
+            complete = self._complete and not full
+        fetched = {}
+        page = 1
+        while True:
+            if check_cancelled:
+                check_cancelled()
+            url = f"{self.url}?per_page={PER_PAGE}&page={page}"
+            # Условный запрос имеет смысл только для первой страницы: остальные
+            # запрашиваются, лишь когда первая изменилась
+            body, changed = self.http.get_json(url, use_cache=page == 1)
+            if page == 1 and not changed and complete:
+                return 0
+
+            reached_known = False
+            for item in body:
+                entry = self._entry(item)
+                if entry is None:
+                    continue
+                key = entry['version']
+                fetched[key] = entry
+                reached_known = reached_known or known.get(key) == entry
+            if len(body) < PER_PAGE or (complete and reached_known):
+                break
+            page += 1
+
+        updated = sum(1 for key, entry in fetched.items() if known.get(key) != entry)
+        with self._lock:
+            if full:
+                self._releases = fetched
+            else:
+                self._releases.update(fetched)
+            self._complete = True
+            self._save()
+        return updated
+
+    @staticmethod
+    def _entry(item):
+        """Нужные для обновления поля релиза из ответа API; черновики и теги не по semver пропускаются"""
+        if item.get('draft'):
+            return None
+        try:
+            version = Version(item['tag_name'].lstrip('v'))
+        except ValueError:
+            return None
+        return {
+            'version': str(version),
+            'tag_name': item['tag_name'],
+            'prerelease': bool(item.get('prerelease')) or bool(version.prerelease),
+            'published_at': item.get('published_at'),
+            'requires': parse_requires(item.get('body')),
+            'assets': [{key: asset[key] for key in ('name', 'size', 'browser_download_url', 'digest')
+                        if key in asset}
+                       for asset in item.get('assets', [])],
+        }
+
+    def get(self, version):
+        """Данные релиза версии version или None"""
+        with self._lock:
+            return self._releases.get(str(version))
+
+    def versions(self, spec=None, prerelease=False):
+        """Версии каталога от новых к старым, подходящие под диапазон spec"""
+        with self._lock:
+            entries = list(self._releases.values())
+        versions = [Version(entry['version']) for entry in entries
+                    if prerelease or not entry['prerelease']]
+        if spec is not None:
+            versions = list(_spec(spec).filter(versions))
+        return sorted(versions, reverse=True)
+
+    def requires(self, version):
+        """Диапазон версий, с которых можно обновиться на version напрямую, или None"""
+        entry = self.get(version)
+        return SimpleSpec(entry['requires']) if entry and entry['requires'] else None
+
+    def can_upgrade(self, current, version):
+        """Можно ли обновиться с current на version напрямую"""
+        requires = self.requires(version)
+        return current < version and (requires is None or requires.match(current))
+
+    def newest(self, spec=None, current=None, prerelease=False):
+        """Новейшая версия из диапазона spec (для current - из тех, что ставятся напрямую)"""
+        for version in self.versions(spec, prerelease):
+            if current is None or self.can_upgrade(current, version):
+                return version
+        return None
+
+    def upgrade_path(self, current, target=None, prerelease=False):
+        """Кратчайшая цепочка версий для обновления с current до target
+
+        По умолчанию target - новейшая версия каталога. Возвращает список
+        версий для установки по порядку (пустой, если current не старше
+        target) или None, если до target не добраться. Из цепочек равной
+        длины выбирается та, где промежуточные версии новее.
+        """
+        if target is None:
+            target = self.newest(prerelease=prerelease)
+            if target is None:
+                return None
+        if current >= target:
+            return []
+
+        candidates = [target] + [v for v in self.versions(prerelease=prerelease)
+                                 if current < v < target]
+        requires = {v: self.requires(v) for v in candidates}
+        # Поиск в ширину от current; кандидаты перебираются от новых к старым,
+        # поэтому при равной длине пути выбираются более новые версии
+        previous = {current: None}
+        frontier = [current]
+        while frontier and target not in previous:
+            next_frontier = []
+            for version in frontier:
+                for candidate in candidates:
+                    if candidate in previous or candidate <= version:
+                        continue
+                    if requires[candidate] is None or requires[candidate].match(version):
+                        previous[candidate] = version
+                        next_frontier.append(candidate)
+            frontier = next_frontier
+
+        if target not in previous:
+            return None
+        path = []
+        version = target
+        while version != current:
+            path.append(version)
+            version = previous[version]
+        return path[::-1]
+
+    def _save(self):
+        write_json(self.path, {'complete': self._complete, 'releases': self._releases}, indent=1)
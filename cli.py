@@ -0,0 +1,323 @@
+"""Консольная версия программы обновления для CI и станций прошивки
+
+Использует ту же логику, что и графический интерфейс (core.py), но не
+импортирует PyQt6 и qt_material и не открывает диалоговых окон. Сообщения
+о ходе операции выводятся в stderr, результат - в stdout.
+
+Коды завершения: 0 - успешно, 1 - ошибка (для fleet - хотя бы на одном
+устройстве), 2 - неверные аргументы, 130 - операция прервана.
+"""
+
+import time
+
+_started = time.perf_counter()
+
+import sys
+import signal
+import argparse
+import threading
+
+from core import DEFAULT_REPO, Operation, UpdaterCore, describe_error
+from errors import OperationCancelled
+
+
+class ConsoleReporter:
+    """Вывод статуса и прогресса операции в stderr
+
+    В терминале прогресс обновляется в одной строке, при выводе в файл
+    или журнал CI печатаются только сообщения о статусе.
+    """
+
+    def __init__(self, stream=None, quiet=False):
+        self.stream = stream or sys.stderr
+        self.quiet = quiet
+        self.interactive = self.stream.isatty()
+        self.cancel_event = threading.Event()
+        self._last_value = None
+
+    def progress(self, value):
+        if self.quiet or not self.interactive or value == self._last_value:
+            return
+        self._last_value = value
+        self.stream.write(f"\r{value:3d}%")
+        self.stream.flush()
+
+    def status(self, message):
+        if self.quiet:
+            return
+        if self.interactive and self._last_value is not None:
+            self.stream.write("\r")
+        self.stream.write(f"{message}\n")
+        self.stream.flush()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise OperationCancelled()
+
+    def cancel(self, signum=None, frame=None):
+        """Первый Ctrl+C аккуратно останавливает операцию, второй прерывает сразу"""
+        self.status("Отмена операции...")
+        self.cancel_event.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    def operation(self):
+        return Operation(self.progress, self.status, self.check_cancelled)
+
+
+def cmd_ports(core, args, reporter):
+    """Список портов; версии всех устройств опрашиваются одновременно"""
+    ports = core.discovery.scan()
+    if args.no_probe:
+        for info in ports:
+            print(info)
+        return 0
+
+    reporter.status(f"Опрос {len(ports)} портов...")
+    for result in core.discovery.probe([info.port for info in ports]):
+        print(result)
+    return 0
+
+
+def cmd_watch(core, args, reporter):
+    """Вывод подключений и отключений устройств до Ctrl+C"""
+    from discovery import PortMonitor
+
+    def on_change(ports, added, removed):
+        for info in added:
+            print(f"+ {info}", flush=True)
+        for port in removed:
+            print(f"- {port}", flush=True)
+
+    def on_result(result):
+        print(f"  {result}", flush=True)
+
+    PortMonitor(core.discovery, on_change, on_result, args.interval) \
+        .run(should_stop=reporter.cancel_event.is_set)
+    return 0
+
+
+def format_path(path):
+    return " -> ".join(str(version) for version in path)
+
+
+def cmd_check(core, args, reporter):
+    """Только запрос к API: релиз не загружается"""
+    version, asset, _ = core.latest_release(reporter.operation(), args.spec)
+    print(f"Доступная версия: {version} ({asset['name']}, {asset.get('size', '?')} байт)")
+    if args.port:
+        current = core.read_version(args.port, reporter.operation())
+        print(f"Текущая версия на {args.port}: {current}")
+        if version > current:
+            print("Доступно обновление")
+            path = core.upgrade_path(current, args.spec)
+            if len(path) > 1:
+                print(f"Порядок обновления: {format_path(path)}")
+        else:
+            print("Установлена последняя версия")
+    return 0
+
+
+def cmd_download(core, args, reporter):
+    release = core.fetch_release(reporter.operation(), args.spec)
+    for part in release.parts():
+        board = f" для платы {part.board}" if part.board else ""
+        print(f"Версия {release.version}{board}: {len(part.files)} файлов, "
+              f"{part.total_size} байт, {part.source}")
+    return 0
+
+
+def cmd_releases(core, args, reporter):
+    """Версии в хранилище релизов или, с --available, все версии в репозитории"""
+    if args.available:
+        core.refresh_catalog(reporter.operation())
+        for version in core.catalog.versions(args.spec, core.prerelease):
+            entry = core.catalog.get(version)
+            marks = []
+            if entry['requires']:
+                marks.append(f"обновление с {entry['requires']}")
+            if core.store.get(version) is not None:
+                marks.append("загружена")
+            print(f"{version} ({', '.join(marks)})" if marks else version)
+        return 0
+
+    protected = core.protected_versions()
+    for version in core.store.versions():
+        entry = core.store.get(version)
+        mark = " (защищена)" if version in protected else ""
+        print(f"{version}: {entry['files']} файлов, {entry['size']} байт{mark}")
+    return 0
+
+
+def cmd_install(core, args, reporter):
+    """Установка новейшей версии из --spec, при необходимости через промежуточные"""
+    if args.force:
+        steps = [args.spec]
+    else:
+        current = core.read_version(args.port, reporter.operation())
+        core.refresh_catalog(reporter.operation())
+        path = core.upgrade_path(current, args.spec)
+        if not path:
+            print(f"{args.port}: установлена актуальная версия {current}")
+            return 0
+        if len(path) > 1:
+            reporter.status(f"Порядок обновления: {format_path(path)}")
+        steps = [str(version) for version in path]
+
+    for spec in steps:
+        release = core.fetch_release(reporter.operation(), spec)
+        stats = core.install(args.port, release, reporter.operation())
+        print(f"{args.port}: обновлено до {release.version}, передано {stats}")
+        print(stats.report())
+    return 0
+
+
+def cmd_rollback(core, args, reporter):
+    stats = core.rollback(args.port, reporter.operation(), args.version)
+    print(f"{args.port}: восстановлена резервная копия, передано {stats}")
+    print(stats.report())
+    return 0
+
+
+def cmd_prefetch(core, args, reporter):
+    """Загрузка новых релизов по расписанию до Ctrl+C (или однократно с --once)"""
+    from prefetch import Prefetcher
+
+    def on_staged(release):
+        print(f"Версия {release.version} готова к установке: "
+              f"{', '.join(str(part.source) for part in release.parts())}", flush=True)
+
+    max_rate = args.max_rate * 1024 if args.max_rate else None
+    prefetcher = Prefetcher(core, args.interval, args.jitter, max_rate, on_staged, reporter.status)
+    if args.once:
+        prefetcher.run_once()
+        return 0
+
+    def cancel(signum, frame):
+        reporter.cancel(signum, frame)
+        prefetcher.stop()
+
+    signal.signal(signal.SIGINT, cancel)
+    prefetcher.run()
+    return 0
+
+
+def cmd_fleet(core, args, reporter):
+    from fleet import PortResult
+
+    ports = [info.port for info in core.discovery.scan()] if args.all else args.ports
+    if not ports:
+        reporter.status("Не выбрано ни одного устройства")
+        return 1
+
+    release = core.fetch_release(reporter.operation(), args.spec)
+    results = core.fleet(ports, release, reporter.operation(), args.workers,
+                         on_port_status=lambda port, message: reporter.status(f"{port}: {message}"))
+    for result in results:
+        print(result)
+    return 1 if any(r.status == PortResult.FAILED for r in results) else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py", description="Обновление ПО устройств без графического интерфейса")
+    parser.add_argument("--data-dir", default=".",
+                        help="каталог с backups/, releases/ и temp/ (по умолчанию текущий)")
+    parser.add_argument("--repo", default=DEFAULT_REPO, help="репозиторий GitHub с релизами")
+    parser.add_argument("--api-url", help="адрес API списка релизов вместо GitHub")
+    parser.add_argument("--extract", action="store_true",
+                        help="собирать дерево файлов релиза в его каталоге")
+    parser.add_argument("--keep-releases", type=int, default=3,
+                        help="сколько последних использованных версий хранить")
+    parser.add_argument("--pre", action="store_true", help="учитывать предварительные версии")
+    parser.add_argument("--metrics-dir",
+                        help="каталог журнала событий и счетчиков (по умолчанию DATA_DIR/metrics)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="не выводить ход операции")
+    parser.add_argument("--timings", action="store_true",
+                        help="вывести время запуска и выполнения команды")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ports = commands.add_parser("ports", help="список портов и версий устройств")
+    ports.add_argument("--no-probe", action="store_true", help="не опрашивать устройства")
+    ports.set_defaults(run=cmd_ports)
+
+    watch = commands.add_parser("watch", help="следить за подключением устройств")
+    watch.add_argument("--interval", type=float, default=1.0,
+                       help="период проверки списка портов, секунды")
+    watch.set_defaults(run=cmd_watch)
+
+    check = commands.add_parser("check", help="проверить наличие новой версии")
+    check.add_argument("--port", help="сравнить с версией на устройстве")
+    check.add_argument("--spec", help="диапазон версий, например \">=1.2,<2\"")
+    check.set_defaults(run=cmd_check)
+
+    download = commands.add_parser("download", help="загрузить и проверить последний релиз")
+    download.add_argument("--spec", help="диапазон версий или точная версия")
+    download.set_defaults(run=cmd_download)
+
+    releases = commands.add_parser("releases", help="версии в хранилище релизов")
+    releases.add_argument("--available", action="store_true",
+                          help="все версии в репозитории (каталог релизов)")
+    releases.add_argument("--spec", help="только версии из диапазона")
+    releases.set_defaults(run=cmd_releases)
+
+    install = commands.add_parser("install", help="установить обновление на устройство")
+    install.add_argument("--port", required=True)
+    install.add_argument("--spec", help="новейшая версия из диапазона вместо последней")
+    install.add_argument("--force", action="store_true",
+                         help="устанавливать, даже если версия на устройстве не старше")
+    install.set_defaults(run=cmd_install)
+
+    rollback = commands.add_parser("rollback", help="восстановить последнюю резервную копию")
+    rollback.add_argument("--port", required=True)
+    rollback.add_argument("--version", help="восстановить копию прошивки этой версии")
+    rollback.set_defaults(run=cmd_rollback)
+
+    prefetch = commands.add_parser("prefetch", help="загружать новые релизы в фоне")
+    prefetch.add_argument("--interval", type=float, default=3600,
+                          help="период проверки, секунды")
+    prefetch.add_argument("--jitter", type=float, default=0.1,
+                          help="случайное отклонение периода, доля от него")
+    prefetch.add_argument("--max-rate", type=int, help="ограничение скорости загрузки, КБ/с")
+    prefetch.add_argument("--once", action="store_true", help="проверить один раз и выйти")
+    prefetch.set_defaults(run=cmd_prefetch)
+
+    fleet = commands.add_parser("fleet", help="обновить несколько устройств параллельно")
+    targets = fleet.add_mutually_exclusive_group(required=True)
+    targets.add_argument("--ports", nargs="+", metavar="PORT")
+    targets.add_argument("--all", action="store_true", help="все найденные порты")
+    fleet.add_argument("--spec", help="новейшая версия из диапазона вместо последней")
+    fleet.add_argument("--workers", type=int, default=None,
+                       help="число одновременно обновляемых устройств")
+    fleet.set_defaults(run=cmd_fleet)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    reporter = ConsoleReporter(quiet=args.quiet)
+    core = UpdaterCore(args.data_dir, args.repo, args.api_url, args.extract, args.keep_releases,
+                       args.pre, args.metrics_dir)
+
+    signal.signal(signal.SIGINT, reporter.cancel)
+    started = time.perf_counter()
+    try:
+        code = args.run(core, args, reporter)
+    except OperationCancelled:
+        reporter.status("Операция отменена")
+        code = 130
+    except KeyboardInterrupt:
+        reporter.status("Операция прервана")
+        code = 130
+    except Exception as e:
+        print(f"Ошибка: {describe_error(e)}", file=sys.stderr)
+        code = 1
+    core.flush_metrics()
+
+    if args.timings:
+        print(f"Запуск: {(started - _started) * 1000:.0f} мс, "
+              f"выполнение: {(time.perf_counter() - started) * 1000:.0f} мс", file=sys.stderr)
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
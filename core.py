@@ -0,0 +1,582 @@
+"""Логика обновления, резервного копирования и отката без зависимости от Qt
+
+UpdaterCore используется и графическим интерфейсом (через фоновые потоки
+в workers.py), и консольной утилитой cli.py. Модули, нужные только части
+команд (HTTP-клиент, работа с портами), импортируются по мере
+необходимости, чтобы не замедлять запуск.
+"""
+
+import os
+import time
+import zipfile
+
+from errors import OperationCancelled, UpdateError
+
+DEFAULT_REPO = "SkvorikovCode/software-update-controller"
+
+
+class Operation:
+    """Обратные вызовы длительной операции: прогресс, статус и отмена
+
+    Все вызовы необязательны; прогресс передается в процентах.
+    """
+
+    def __init__(self, progress=None, status=None, check_cancelled=None):
+        self._progress = progress
+        self._status = status
+        self._check_cancelled = check_cancelled
+
+    def report_progress(self, value):
+        if self._progress:
+            self._progress(value)
+
+    def report_fraction(self, done, total, start=0, span=100):
+        """Прогресс этапа, занимающего span процентов начиная со start"""
+        if total:
+            self.report_progress(start + done * span // total)
+
+    def status(self, message):
+        if self._status:
+            self._status(message)
+
+    def check_cancelled(self):
+        if self._check_cancelled:
+            self._check_cancelled()
+
+
+def describe_error(error, prefix=""):
+    """Текст сообщения об ошибке для пользователя"""
+    from http_client import HttpError
+    from integrity import IntegrityError
+    import requests
+
+    if isinstance(error, UpdateError):
+        return str(error)
+    if isinstance(error, (requests.exceptions.RequestException, HttpError)):
+        return f"Ошибка сети: {error}"
+    if isinstance(error, IntegrityError):
+        return f"Ошибка проверки целостности: {error}"
+    return f"{prefix}{error}"
+
+
+class UpdaterCore:
+    """Операции обновления ПО устройств
+
+    Все данные хранятся в каталоге data_dir: backups/ - резервные копии
+    с индексом по устройствам, releases/ - загруженные релизы, temp/ -
+    временные файлы, metrics/ (или metrics_dir) - время этапов и счетчики.
+    """
+
+    def __init__(self, data_dir=".", github_repo=DEFAULT_REPO, api_url=None, extract=False,
+                 keep_releases=3, prerelease=False, metrics_dir=None):
+        self.data_dir = data_dir
+        self.backup_path = os.path.join(data_dir, "backups")
+        self.temp_path = os.path.join(data_dir, "temp")
+        self.releases_path = os.path.join(data_dir, "releases")
+        self.lock_path = os.path.join(self.releases_path, ".lock")
+        self.metrics_path = metrics_dir or os.path.join(data_dir, "metrics")
+        self.github_repo = github_repo
+        # Раньше указывался адрес последнего релиза; теперь нужен список релизов
+        api_url = api_url[:-len("/latest")] if api_url and api_url.endswith("/latest") else api_url
+        self.github_api_url = api_url or f"https://api.github.com/repos/{github_repo}/releases"
+        self.extract = extract
+        self.keep_releases = keep_releases
+        self.prerelease = prerelease
+        self._http = None
+        self._catalog = None
+        self._metrics = None
+        self._discovery = None
+        self._store = None
+        self._backups = None
+
+        # Создаем необходимые директории
+        for path in [self.backup_path, self.temp_path, self.releases_path]:
+            os.makedirs(path, exist_ok=True)
+
+    @property
+    def http(self):
+        """Общий HTTP-клиент с кэшем ответов GitHub"""
+        if self._http is None:
+            from http_client import HttpClient
+            self._http = HttpClient(os.path.join(self.releases_path, "http_cache.json"))
+        return self._http
+
+    @property
+    def metrics(self):
+        """Время этапов, счетчики и журнал событий"""
+        if self._metrics is None:
+            from metrics import Metrics
+            self._metrics = Metrics(self.metrics_path)
+        return self._metrics
+
+    def flush_metrics(self):
+        """Выгрузка счетчиков, если в этом запуске что-то измерялось"""
+        if self._metrics is not None:
+            self._metrics.flush()
+
+    @property
+    def catalog(self):
+        """Каталог всех релизов репозитория"""
+        if self._catalog is None:
+            from catalog import CATALOG_NAME, ReleaseCatalog
+            self._catalog = ReleaseCatalog(self.http, self.github_api_url,
+                                           os.path.join(self.releases_path, CATALOG_NAME))
+        return self._catalog
+
+    @property
+    def store(self):
+        """Хранилище релизов с адресацией по содержимому"""
+        if self._store is None:
+            from store import ReleaseStore
+            self._store = ReleaseStore(self.releases_path)
+        return self._store
+
+    @property
+    def backups(self):
+        """Сжатые резервные копии с индексом по устройствам и версиям"""
+        if self._backups is None:
+            from backups import BackupStore
+            self._backups = BackupStore(
+                self.backup_path, lambda port: self.discovery.port_info(port).key)
+        return self._backups
+
+    @property
+    def discovery(self):
+        """Обнаружение устройств с кэшем версий по идентификатору USB"""
+        if self._discovery is None:
+            from discovery import DEVICES_NAME, Discovery, IdentityCache
+            self._discovery = Discovery(IdentityCache(os.path.join(self.data_dir, DEVICES_NAME)))
+        return self._discovery
+
+    def releases_lock(self, operation=None, blocking=True, shared=False):
+        """Блокировка хранилища релизов, общая для всех процессов с этим каталогом данных
+
+        Загрузка релиза (с вытеснением старых версий) берет ее
+        исключительно, установка на устройства - разделяемой (shared=True)
+        на время чтения файлов релиза, чтобы другой процесс не удалил их
+        посреди прошивки. С blocking=False при занятой блокировке
+        выбрасывается locking.LockBusy.
+        """
+        from locking import FileLock
+
+        operation = operation or Operation()
+        return FileLock(self.lock_path, blocking, operation.check_cancelled, shared)
+
+    def refresh_catalog(self, operation=None):
+        """Загрузка новых релизов в каталог"""
+        from http_client import HttpStatusError, RateLimitError
+
+        operation = operation or Operation()
+        operation.status("Запрос информации о релизах...")
+        try:
+            with self.metrics.phase('api'):
+                self.catalog.refresh(check_cancelled=operation.check_cancelled)
+        except RateLimitError:
+            raise
+        except HttpStatusError as e:
+            if e.status_code == 404:
+                raise UpdateError("Репозиторий не найден или нет публичных релизов")
+            raise UpdateError(f"Ошибка при получении данных с GitHub: {e.status_code}")
+
+    def latest_release(self, operation=None, spec=None):
+        """Новейший релиз из диапазона версий spec: (версия, zip-ассет, данные релиза)
+
+        spec - строка вида ">=1.2,<2" или точная версия; без него выбирается
+        новейший релиз.
+        """
+        self.refresh_catalog(operation)
+        version = self.catalog.newest(spec, prerelease=self.prerelease)
+        if version is None:
+            if spec is not None:
+                raise UpdateError(f"Нет релизов, подходящих под {spec}")
+            raise UpdateError("В репозитории нет релизов")
+        release_data = self.catalog.get(version)
+
+        # Ищем zip архив обновления
+        asset = next((a for a in release_data['assets'] if a['name'].endswith('.zip')), None)
+        if asset is None:
+            raise UpdateError("В релизе не найден архив обновления (.zip)")
+        return version, asset, release_data
+
+    def fetch_release(self, operation=None, spec=None, max_rate=None, blocking=True, boards=None):
+        """Проверка и загрузка новейшего релиза из диапазона версий spec
+
+        Архив загружается, только если этой версии еще нет в хранилище
+        релизов или ее архив перевыпущен с другим содержимым. Файлы архива
+        переносятся в хранилище, сам архив после этого удаляется. С
+        extract=True дерево файлов версии собирается в ее каталоге из ссылок
+        на файлы хранилища. max_rate ограничивает скорость загрузки, байт/с.
+
+        Если в релизе есть архивы для отдельных плат, загружаются только
+        архивы плат boards (по умолчанию - подключенных и ранее опрошенных
+        устройств, см. boards.py), одновременно.
+
+        Выполняется под блокировкой каталога релизов: если другой процесс
+        уже загружает релиз, загрузка ждет его и использует результат
+        (с blocking=False сразу выбрасывается locking.LockBusy).
+        """
+        operation = operation or Operation()
+        with self.metrics.operation('fetch_release'), self.releases_lock(operation, blocking):
+            # Хранилище и каталог могли измениться в другом процессе
+            self.store.reload()
+            self.catalog.reload()
+            return self._fetch_release(operation, spec, max_rate, boards)
+
+    def _fetch_release(self, operation, spec, max_rate, boards):
+        """Загрузка релиза под блокировкой (см. fetch_release)"""
+        from boards import select_assets
+        from integrity import IntegrityError, expected_checksum
+        from release import BlobSource, Release
+        from store import release_key
+
+        operation.report_progress(0)
+        version, _, release_data = self.latest_release(operation, spec)
+        if boards is None:
+            boards = self.discovery.boards()
+        assets = select_assets(release_data['assets'], boards)
+        if not assets:
+            names = sorted(board or "без идентификатора USB" for board in boards)
+            raise UpdateError(f"В релизе {version} нет архивов для плат: {', '.join(names)}")
+
+        # Архивы релиза по платам (None - общий): (ассет, SHA-256 или None)
+        store = self.store
+        archives = {}
+        manifests = {}
+        for board, asset in assets.items():
+            expected_sha256 = expected_checksum(asset, release_data['assets'],
+                                                self.http.get_text)
+            archives[board] = (asset, expected_sha256)
+            entry = store.get(release_key(version, board))
+            if entry is not None and expected_sha256 in (None, entry['archive_sha256']):
+                manifest = store.manifest(release_key(version, board))
+                if manifest is not None:
+                    manifests[board] = manifest
+        # Шкала прогресса делится между этапами по их средней длительности
+        plan = self.metrics.plan(operation, ['api', 'hash', 'extract']
+                                 if len(manifests) == len(archives)
+                                 else ['api', 'download', 'hash', 'extract'])
+        plan.finish('api')
+        if manifests:
+            operation.status("Проверка файлов релиза...")
+            for board in list(manifests):
+                try:
+                    with self.metrics.phase('hash'):
+                        store.verify(manifests[board], operation.check_cancelled)
+                except IntegrityError:
+                    del manifests[board]
+            if len(manifests) == len(archives):
+                plan.finish('hash')
+            else:
+                plan = self.metrics.plan(operation, ['api', 'download', 'hash', 'extract'])
+        missing = {board: archive for board, archive in archives.items()
+                   if board not in manifests}
+        if missing:
+            for board in missing:
+                store.forget(release_key(version, board))
+            manifests.update(self._download_release(version, missing, operation, plan,
+                                                    max_rate))
+        if not all(manifest['files'] for manifest in manifests.values()):
+            raise UpdateError("Архив обновления пуст")
+
+        if self.extract:
+            operation.status("Сборка каталога релиза...")
+            with self.metrics.phase('extract'):
+                for board, manifest in manifests.items():
+                    store.materialize(release_key(version, board), manifest,
+                                      replace=board in missing)
+
+        for board in manifests:
+            store.touch(release_key(version, board))
+        evicted = store.evict(self.keep_releases, self.protected_versions(version))
+        if evicted:
+            operation.status(f"Удалены старые версии: {', '.join(evicted)}")
+
+        releases = {}
+        for board, manifest in manifests.items():
+            release_dir = store.release_dir(release_key(version, board))
+            source = BlobSource(store, release_dir, manifest)
+            releases[board] = Release(version, release_dir, source, source.list_files(),
+                                      manifest, store, board)
+        operation.report_progress(100)
+        release = releases.pop(None, None) or \
+            Release(version, store.release_dir(version), None, [], store=store)
+        release.bundles = releases
+        return release
+
+    def _download_release(self, version, archives, operation, plan, max_rate=None):
+        """Загрузка архивов версии и перенос их файлов в хранилище
+
+        archives - {плата: (ассет, SHA-256 или None)}, plan - деление шкалы
+        прогресса (metrics.ProgressPlan) между этапами download, hash
+        и extract. Возвращает манифесты {плата: манифест}.
+        """
+        from release import ArchiveSource
+        from store import release_key
+
+        paths = {}
+        for board, (asset, expected_sha256) in archives.items():
+            release_dir = self.store.release_dir(release_key(version, board))
+            os.makedirs(release_dir, exist_ok=True)
+            paths[board] = (asset, os.path.join(release_dir, asset['name']), expected_sha256)
+        checksums = self._fetch_archives(paths, operation, plan, max_rate)
+        plan.finish('hash')
+
+        operation.status("Перенос файлов в хранилище релизов...")
+        manifests = {}
+        for index, (board, (asset, zip_path, _)) in enumerate(paths.items()):
+            def report_storing(done, total, index=index):
+                operation.check_cancelled()
+                plan.report('extract', index * total + done, len(paths) * total)
+
+            source = ArchiveSource(zip_path)
+            try:
+                with self.metrics.phase('extract'):
+                    manifests[board] = self.store.add_archive(
+                        release_key(version, board), source, asset['name'], checksums[board],
+                        report_storing)
+            except zipfile.BadZipFile:
+                # Поврежденный архив удаляем, чтобы следующая проверка загрузила его заново
+                source.close()
+                os.remove(zip_path)
+                raise UpdateError(f"Архив обновления {asset['name']} поврежден")
+            source.close()
+            os.remove(zip_path)
+        return manifests
+
+    def protected_versions(self, current=None):
+        """Версии, которые нельзя вытеснять из хранилища релизов
+
+        Это версии, установленные на известных устройствах, ближайшие
+        предшествующие им (цели отката) и текущая версия.
+        """
+        installed = self.discovery.cache.versions()
+        stored = self.store.versions()
+        protected = set(installed)
+        for version in installed:
+            older = [v for v in stored if v < version]
+            if older:
+                protected.add(max(older))
+        if current is not None:
+            protected.add(current)
+        return protected
+
+    def _fetch_archives(self, archives, operation, plan, max_rate=None):
+        """Одновременная загрузка архивов с проверкой, возвращает {плата: SHA-256}
+
+        archives - {плата: (ассет, путь архива, SHA-256 или None)}. Без
+        опубликованной контрольной суммы проверяются CRC файлов архива;
+        если не прошел проверку уже лежавший на диске архив, он загружается
+        заново.
+        """
+        from integrity import IntegrityError, check_archive_members
+
+        checksums = {}
+        pending = dict(archives)
+        while pending:
+            operation.status("Загрузка обновления...")
+            items = [(asset['browser_download_url'], zip_path, asset.get('size'), expected_sha256)
+                     for asset, zip_path, expected_sha256 in pending.values()]
+            started = time.perf_counter()
+            with self.metrics.phase('download'):
+                results = self.http.download_many(
+                    items, progress=plan.callback('download'),
+                    check_cancelled=operation.check_cancelled, max_rate=max_rate)
+            results = dict(zip(pending, results))
+            size = sum(os.path.getsize(pending[board][1])
+                       for board, (downloaded, _) in results.items() if downloaded)
+            if size:
+                self.metrics.record_download(size, time.perf_counter() - started)
+
+            retry = {}
+            for board, (downloaded, sha256) in results.items():
+                asset, zip_path, expected_sha256 = pending[board]
+                if expected_sha256 is None:
+                    operation.status("Проверка архива...")
+                    try:
+                        with self.metrics.phase('hash'):
+                            check_archive_members(zip_path,
+                                                  check_cancelled=operation.check_cancelled)
+                    except IntegrityError:
+                        os.remove(zip_path)
+                        if downloaded:
+                            raise
+                        retry[board] = pending[board]
+                        continue
+                checksums[board] = sha256
+            pending = retry
+        return checksums
+
+    def read_version(self, port, operation=None):
+        """Чтение текущей версии ПО с устройства"""
+        operation = operation or Operation()
+        operation.status(f"Чтение версии с {port}...")
+        result = self.discovery.probe_port(port)
+        if result.error is not None:
+            raise result.error
+        return result.version
+
+    def install(self, port, release, operation=None):
+        """Резервное копирование и установка обновления на устройство"""
+        operation = operation or Operation()
+        with self.metrics.operation('install', port):
+            return self._install(port, release, operation)
+
+    def _install(self, port, release, operation):
+        from device import Device
+
+        release = release.for_board(self.discovery.port_info(port).board)
+        metrics = self.metrics
+        device = Device(port, check_cancelled=operation.check_cancelled)
+        progress = metrics.plan(operation, ['backup', 'hash', 'device_verify', 'transfer'])
+        operation.report_progress(0)
+        current = self._current_version(port)
+        self.check_compatible(current, release.version)
+        operation.status("Создание резервной копии...")
+        try:
+            with metrics.phase('backup', port):
+                record, backup_stats = device.create_backup(
+                    self.backups, current, progress.callback('backup'))
+        except OperationCancelled:
+            raise
+        except Exception as e:
+            raise UpdateError(f"Ошибка создания резервной копии: {e}")
+        metrics.record_transfer(port, backup_stats, 'receive')
+        operation.status(f"Резервная копия: {record['size']} байт, "
+                         f"на диске {record['stored']} байт")
+        progress.finish('backup')
+        operation.check_cancelled()
+
+        with self.releases_lock(operation, shared=True):
+            if not os.path.exists(str(release.source)):
+                raise UpdateError("Файлы обновления не найдены. Проверьте обновления снова.")
+            if not release.files:
+                raise UpdateError("Список файлов для обновления пуст")
+
+            operation.status("Проверка целостности обновления...")
+            with metrics.phase('hash'):
+                release.verify(operation.check_cancelled)
+            progress.finish('hash')
+
+            operation.status("Сравнение файлов на устройстве...")
+            with metrics.phase('device_verify', port):
+                plan = device.plan_update(release.files, release.manifest)
+            progress.finish('device_verify')
+            operation.status(f"Установка обновления: {plan}")
+            with metrics.phase('transfer', port):
+                stats = device.install(plan, release.source, progress.callback('transfer'))
+        metrics.record_transfer(port, stats)
+        self.discovery.forget_version(port)
+        operation.report_progress(100)
+        operation.status(f"Передано {stats}")
+        return stats
+
+    def upgrade_path(self, current, spec=None):
+        """Версии для установки по порядку, чтобы обновиться с current до новейшей из spec
+
+        Запросов к сети не выполняет: используется каталог релизов.
+        """
+        target = self.catalog.newest(spec, prerelease=self.prerelease)
+        if target is None:
+            return []
+        path = self.catalog.upgrade_path(current, target, self.prerelease)
+        if path is None:
+            raise UpdateError(f"Не найден путь обновления с {current} до {target}")
+        return path
+
+    def check_compatible(self, current, version):
+        """Проверка, что version можно установить поверх current напрямую"""
+        if current is None or current >= version or self.catalog.can_upgrade(current, version):
+            return
+        requires = self.catalog.requires(version)
+        try:
+            path = " -> ".join(str(v) for v in self.upgrade_path(current, str(version)))
+            hint = f"; порядок обновления: {path}"
+        except UpdateError:
+            hint = ""
+        raise UpdateError(f"Версия {version} устанавливается только поверх {requires}, "
+                          f"на устройстве {current}{hint}")
+
+    def _current_version(self, port):
+        """Версия устройства из последнего опроса или, если ее нет, прочитанная заново"""
+        version = self.discovery.known_version(port)
+        if version is None:
+            version = self.discovery.probe_port(port).version
+        return version
+
+    def latest_backup(self, port):
+        """Запись о последней резервной копии устройства на порту или None"""
+        return self.backups.latest(port)
+
+    def rollback(self, port, operation=None, version=None):
+        """Восстановление резервной копии этого устройства
+
+        По умолчанию восстанавливается последняя копия, с version - копия,
+        снятая с прошивки этой версии.
+        """
+        operation = operation or Operation()
+        with self.metrics.operation('rollback', port):
+            return self._rollback(port, operation, version)
+
+    def _rollback(self, port, operation, version):
+        from device import Device
+
+        metrics = self.metrics
+        progress = metrics.plan(operation, ['hash', 'transfer'])
+        if version is None:
+            record = self.latest_backup(port)
+            if record is None:
+                raise UpdateError("Резервные копии этого устройства не найдены")
+        else:
+            record = self.backups.find(port, version)
+            if record is None:
+                raise UpdateError(f"Резервная копия версии {version} для этого устройства не найдена")
+
+        operation.status("Проверка резервной копии...")
+        with metrics.phase('hash'):
+            self.backups.verify(record, operation.check_cancelled)
+        progress.finish('hash')
+        version = f" версии {record['version']}" if record['version'] else ""
+        operation.status(f"Восстановление резервной копии{version}...")
+        device = Device(port, check_cancelled=operation.check_cancelled)
+        with metrics.phase('transfer', port), self.backups.open(record) as stream:
+            stats = device.restore(stream, record['size'], progress.callback('transfer'),
+                                   f"backup {record['sha256'][:12]}")
+        metrics.record_transfer(port, stats)
+        self.discovery.forget_version(port)
+        operation.report_progress(100)
+        operation.status(f"Передано {stats}")
+        return stats
+
+    def fleet(self, ports, release, operation=None, max_workers=None,
+              on_port_progress=None, on_port_status=None):
+        """Параллельное обновление нескольких устройств, возвращает список PortResult"""
+        operation = operation or Operation()
+        with self.metrics.operation('fleet'):
+            return self._fleet(ports, release, operation, max_workers, on_port_progress,
+                               on_port_status)
+
+    def _fleet(self, ports, release, operation, max_workers, on_port_progress, on_port_status):
+        from fleet import DEFAULT_MAX_WORKERS, FleetUpdater, PortResult
+
+        if not release.files and not release.bundles:
+            raise UpdateError("Список файлов для обновления пуст")
+        boards = {port: self.discovery.port_info(port).board for port in ports}
+
+        operation.report_progress(0)
+        with self.releases_lock(operation, shared=True):
+            operation.status("Проверка целостности обновления...")
+            with self.metrics.phase('hash'):
+                release.verify(operation.check_cancelled)
+            operation.status(f"Обновление {len(ports)} устройств...")
+            fleet = FleetUpdater(ports, release, self.backups,
+                                 max_workers or DEFAULT_MAX_WORKERS,
+                                 requires=self.catalog.requires(release.version),
+                                 on_progress=on_port_progress, on_status=on_port_status,
+                                 check_cancelled=operation.check_cancelled,
+                                 metrics=self.metrics, boards=boards)
+            results = fleet.run()
+        for result in results:
+            if result.status == PortResult.UPDATED:
+                self.discovery.forget_version(result.port)
+        operation.report_progress(100)
+        return results
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+
+from semantic_version import Version
+
+from manifest import plan_update
+from transfer import SerialTransfer, TransferError, open_port
+
+
+def _no_progress(done, total):
+    pass
+
+
+class Device:
+    """Операции с устройством, подключенным к одному последовательному порту
+
+    Класс не зависит от Qt и может использоваться из любых потоков: каждый
+    экземпляр открывает свой порт только на время операции.
+    """
+
+    def __init__(self, port, check_cancelled=None):
+        self.port = port
+        self.check_cancelled = check_cancelled
+
+    def read_version(self, timeout=1):
+        """Чтение текущей версии ПО"""
+        return self.probe([timeout])[0]
+
+    def probe(self, timeouts=(1,)):
+        """Версия ПО и время ответа на запрос (без открытия и закрытия порта)
+
+        Запрос повторяется с каждым временем ожидания из timeouts в одном
+        сеансе: открытие порта переключает DTR и перезагружает большинство
+        плат Arduino, поэтому порт между попытками не переоткрывается. Время
+        ответа отсчитывается от первого запроса, чтобы поздний ответ на него
+        не занизил оценку задержки. Если устройство не ответило ни на одну
+        попытку, выбрасывается TimeoutError.
+        """
+        response = ""
+        waited = 0
+        with open_port(self.port) as ser:
+            started = time.monotonic()
+            for timeout in timeouts:
+                ser.timeout = timeout
+                ser.write(b"version\n")
+                response = ser.readline().decode().strip()
+                waited += timeout
+                if response:
+                    break
+            rtt = time.monotonic() - started
+        if not response:
+            raise TimeoutError(f"устройство не ответило за {waited:.2f} с")
+        return Version(response), rtt
+
+    def create_backup(self, backups, version=None, progress=None):
+        """Выгрузка текущего ПО в хранилище резервных копий (backups.BackupStore)
+
+        После согласования скорости хост отправляет "ready", устройство
+        отвечает размером образа в кадре заголовка и передает образ кадрами
+        протокола. Образ сжимается и хешируется по мере приема, не сохраняясь
+        на диск целиком. version - версия ПО на устройстве для индекса копий.
+        progress вызывается с числом принятых байт и общим объемом. Возвращает
+        запись о копии и статистику приема.
+        """
+        progress = progress or _no_progress
+        with open_port(self.port) as ser:
+            ser.write(b"backup\n")
+            link = SerialTransfer(ser, check_cancelled=self.check_cancelled)
+            link.negotiate_baudrate()
+            ser.write(b"ready\n")
+            reply = link.receive_header().strip()
+            if not reply.isdigit():
+                raise TransferError("Устройство не передало размер образа прошивки")
+            size = int(reply)
+            with backups.writer(self.port, version) as writer:
+                stats = link.receive_file(writer, size, lambda done: progress(done, size))
+            link.wait_close()
+        return writer.record, stats
+
+    def read_hashes(self):
+        """Состояние установленных файлов в формате манифеста
+
+        Возвращает None, если устройство не поддерживает команду "hashes"
+        или прислало некорректный ответ - тогда обновление будет полным.
+        """
+        with open_port(self.port) as ser:
+            ser.write(b"hashes\n")
+            response = ser.readline().decode(errors='replace').strip()
+        try:
+            state = json.loads(response)
+        except ValueError:
+            return None
+        return state if isinstance(state, dict) else None
+
+    def plan_update(self, files, manifest=None):
+        """План обновления с учетом файлов, уже установленных на устройстве"""
+        device_state = self.read_hashes() if manifest is not None else None
+        return plan_update(files, manifest, device_state)
+
+    def install(self, plan, source, progress=None):
+        """Передача на устройство файлов и участков из плана обновления
+
+        Файлы читаются потоком из источника релиза source (каталог или архив).
+        Число файлов и заголовки файлов передаются кадрами FRAME_HEADER.
+        Для файла целиком заголовок имеет вид "<путь>\\t<размер>", для
+        изменившихся блоков - "<путь>\\t<размер>\\tpatch". Если устройство
+        поддерживает сжатие, кадры передаются сжатыми. progress вызывается
+        с числом переданных байт и общим объемом. Возвращает статистику
+        передачи с отчетом по каждому файлу.
+        """
+        progress = progress or _no_progress
+        total_size = plan.transfer_size
+        with open_port(self.port) as ser:
+            ser.write(b"update\n")
+            link = SerialTransfer(ser, check_cancelled=self.check_cancelled)
+            link.negotiate_compression()
+            link.negotiate_baudrate()
+
+            # Отправляем количество файлов
+            link.send_header(str(len(plan.entries)))
+
+            # Отправляем каждый файл: заголовок с именем и размером, затем кадры
+            sent = 0
+
+            def report(done):
+                progress(sent + done, total_size)
+
+            for entry in plan.entries:
+                if self.check_cancelled:
+                    self.check_cancelled()
+                header = f"{entry.rel_path}\t{entry.size}"
+                if entry.ranges is not None:
+                    header += "\tpatch"
+                link.send_header(header)
+                with source.open(entry.rel_path) as f:
+                    stats = link.send_file(f, entry.size, report, entry.ranges, entry.crc32)
+                link.stats.files.append((entry.rel_path, stats))
+                sent += entry.transfer_size
+            link.close()
+        return link.stats
+
+    def restore(self, stream, size, progress=None, name="backup"):
+        """Восстановление резервной копии из потока образа размером size байт
+
+        Возвращает статистику передачи.
+        """
+        progress = progress or _no_progress
+        with open_port(self.port) as ser:
+            ser.write(b"restore\n")
+            link = SerialTransfer(ser, check_cancelled=self.check_cancelled)
+            link.negotiate_compression()
+            link.negotiate_baudrate()
+            link.send_header(str(size))
+            stats = link.send_file(stream, size, lambda done: progress(done, size))
+            link.stats.files.append((name, stats))
+            link.close()
+        return link.stats
+
+    @property
+    def safe_name(self):
+        """Имя порта, пригодное для использования в имени файла"""
+        return "".join(c if c.isalnum() else "_" for c in os.path.basename(self.port))
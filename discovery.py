@@ -0,0 +1,340 @@
+"""Обнаружение устройств: параллельный опрос портов и отслеживание подключений
+
+Все порты опрашиваются одновременно командой "version". Время ожидания
+ответа подстраивается под измеренную задержку каждого устройства (как
+таймаут повторной передачи в TCP) и увеличивается вдвое при повторной
+попытке. Повторы идут в одном сеансе, без переоткрытия порта, которое
+перезагрузило бы плату. Результаты хранятся в devices.json по идентификатору USB
+(VID:PID:серийный номер), поэтому устройство, переподключенное к другому
+порту (/dev/ttyUSB0 -> /dev/ttyUSB1), сохраняет известную версию и задержку.
+
+pyserial не сообщает о подключении устройств, поэтому PortMonitor
+периодически сравнивает список портов с предыдущим и опрашивает новые.
+"""
+
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import serial.tools.list_ports
+from semantic_version import Version
+
+from boards import board_id
+from device import Device
+from jsonfile import write_json
+from locking import FileLock
+
+DEVICES_NAME = "devices.json"
+DEFAULT_MAX_WORKERS = 16
+
+# Время ожидания ответа на "version", секунды
+INITIAL_TIMEOUT = 0.3
+MIN_TIMEOUT = 0.1
+MAX_TIMEOUT = 1.0
+PROBE_ATTEMPTS = 3
+
+SCAN_INTERVAL = 1.0
+
+
+class PortInfo:
+    """Порт и идентификатор подключенного к нему устройства
+
+    identity равен None, если порт не является USB-устройством; тогда
+    результаты опроса хранятся по имени порта.
+    """
+
+    def __init__(self, port, identity=None, description=None):
+        self.port = port
+        self.identity = identity
+        self.description = description
+
+    @classmethod
+    def from_comport(cls, info):
+        identity = None
+        if info.vid is not None:
+            # Без серийного номера устройство различается по месту подключения в USB
+            identity = f"{info.vid:04x}:{info.pid:04x}:{info.serial_number or info.location}"
+        description = info.description if info.description not in (None, "n/a") else None
+        return cls(info.device, identity, description)
+
+    @property
+    def key(self):
+        return self.identity or self.port
+
+    @property
+    def board(self):
+        """Идентификатор платы (см. boards.py) или None, если порт не USB"""
+        return board_id(self.identity)
+
+    def __str__(self):
+        return f"{self.port} ({self.description})" if self.description else self.port
+
+
+class ProbeResult:
+    """Итог опроса одного порта"""
+
+    def __init__(self, info, version=None, rtt=None, error=None):
+        self.info = info
+        self.version = version
+        self.rtt = rtt
+        self.error = error
+
+    @property
+    def port(self):
+        return self.info.port
+
+    def __str__(self):
+        if self.error is not None:
+            return f"{self.info}: нет ответа - {self.error}"
+        return f"{self.info}: версия {self.version}, ответ за {self.rtt * 1000:.0f} мс"
+
+
+class AdaptiveTimeout:
+    """Время ожидания ответа по сглаженной задержке и ее разбросу"""
+
+    def __init__(self, srtt=None, rttvar=None):
+        self.srtt = srtt
+        self.rttvar = rttvar
+        self._backoff = 1
+
+    @property
+    def value(self):
+        if self.srtt is None:
+            base = INITIAL_TIMEOUT
+        else:
+            base = max(MIN_TIMEOUT, self.srtt + 4 * self.rttvar)
+        return min(MAX_TIMEOUT, base * self._backoff)
+
+    def update(self, rtt):
+        """Учет измеренной задержки ответа"""
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self._backoff = 1
+
+    def backoff(self):
+        """Увеличение времени ожидания после попытки без ответа"""
+        self._backoff *= 2
+
+    def attempts(self, count):
+        """Время ожидания для count попыток, вдвое больше после каждой"""
+        for attempt in range(count):
+            if attempt:
+                self.backoff()
+            yield self.value
+
+
+class IdentityCache:
+    """Известные устройства в JSON-файле: версия, последний порт и задержка"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def version(self, key):
+        with self._lock:
+            version = self._entries.get(key, {}).get('version')
+        return Version(version) if version else None
+
+    def versions(self):
+        """Версии, установленные на известных устройствах"""
+        with self._lock:
+            return {Version(entry['version']) for entry in self._entries.values()
+                    if entry.get('version')}
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def timeout(self, key):
+        with self._lock:
+            entry = self._entries.get(key, {})
+        return AdaptiveTimeout(entry.get('srtt'), entry.get('rttvar'))
+
+    def update(self, key, port, version, timeout):
+        with self._lock, FileLock(self.lock_path):
+            self._entries = self._load()
+            self._entries[key] = {
+                'port': port,
+                'version': str(version),
+                'srtt': timeout.srtt,
+                'rttvar': timeout.rttvar,
+                'seen': time.time(),
+            }
+            self._save()
+
+    def forget_version(self, key):
+        """Версия устройства изменилась (после установки или отката)"""
+        with self._lock, FileLock(self.lock_path):
+            self._entries = self._load()
+            entry = self._entries.get(key)
+            if entry is not None and entry.pop('version', None) is not None:
+                self._save()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        write_json(self.path, self._entries, indent=1)
+
+
+class Discovery:
+    """Список портов и параллельный опрос версий подключенных устройств"""
+
+    def __init__(self, cache, max_workers=DEFAULT_MAX_WORKERS):
+        self.cache = cache
+        self.max_workers = max_workers
+        self._ports = {}
+        self._lock = threading.Lock()
+
+    def scan(self):
+        """Список подключенных портов [PortInfo, ...]"""
+        ports = [PortInfo.from_comport(info) for info in serial.tools.list_ports.comports()]
+        with self._lock:
+            self._ports = {info.port: info for info in ports}
+        return ports
+
+    def port_info(self, port):
+        with self._lock:
+            info = self._ports.get(port)
+        if info is None:
+            info = next((i for i in self.scan() if i.port == port), None) or PortInfo(port)
+        return info
+
+    def boards(self):
+        """Платы подключенных и ранее опрошенных устройств
+
+        None среди них - подключено устройство без идентификатора USB,
+        ему нужен общий архив релиза.
+        """
+        boards = {info.board for info in self.scan()}
+        boards.update(board for board in map(board_id, self.cache.keys()) if board is not None)
+        return boards
+
+    def known_version(self, port):
+        """Версия, полученная при последнем опросе этого устройства на любом порту"""
+        return self.cache.version(self.port_info(port).key)
+
+    def forget_version(self, port):
+        self.cache.forget_version(self.port_info(port).key)
+
+    def probe_port(self, port):
+        """Чтение версии с повторами в одном сеансе и адаптивным временем ожидания"""
+        info = self.port_info(port)
+        timeout = self.cache.timeout(info.key)
+        try:
+            version, rtt = Device(port).probe(timeout.attempts(PROBE_ATTEMPTS))
+        except Exception as e:
+            return ProbeResult(info, error=e)
+        timeout.update(rtt)
+        self.cache.update(info.key, port, version, timeout)
+        return ProbeResult(info, version, rtt)
+
+    def probe(self, ports, on_result=None):
+        """Одновременный опрос портов, возвращает ProbeResult в порядке портов"""
+        if not ports:
+            return []
+        results = {}
+        workers = max(1, min(self.max_workers, len(ports)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="probe") as pool:
+            futures = [pool.submit(self.probe_port, port) for port in ports]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result.port] = result
+                if on_result:
+                    on_result(result)
+        return [results[port] for port in ports]
+
+
+class PortMonitor:
+    """Отслеживание подключения и отключения устройств
+
+    on_change(ports, added, removed) вызывается при изменении списка портов,
+    on_result(ProbeResult) - по завершении опроса каждого нового порта.
+    Обратные вызовы выполняются в потоках монитора. Пока монитор
+    приостановлен (например, на время прошивки), новые порты только
+    запоминаются и опрашиваются после возобновления.
+    """
+
+    def __init__(self, discovery, on_change, on_result, interval=SCAN_INTERVAL):
+        self.discovery = discovery
+        self.on_change = on_change
+        self.on_result = on_result
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._known = set()
+        self._pending = set()
+        self._probing = set()
+        self._paused = False
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+
+    def request_probe(self, ports=None):
+        """Повторный опрос портов (всех подключенных, если ports не задан)"""
+        with self._lock:
+            self._pending.update(ports if ports is not None else self._known)
+        self._wake_event.set()
+
+    def pause(self):
+        with self._lock:
+            self._paused = True
+
+    def resume(self):
+        with self._lock:
+            self._paused = False
+        self._wake_event.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def run(self, should_stop=None):
+        """Цикл опроса списка портов до вызова stop() или should_stop()"""
+        known = None
+        with ThreadPoolExecutor(max_workers=self.discovery.max_workers,
+                                thread_name_prefix="probe") as pool:
+            while not self._stop_event.is_set() and not (should_stop and should_stop()):
+                ports = self.discovery.scan()
+                current = {info.port for info in ports}
+                if current != known:
+                    added = [info for info in ports if known is None or info.port not in known]
+                    removed = sorted(known - current) if known is not None else []
+                    known = current
+                    self.on_change(ports, added, removed)
+                    with self._lock:
+                        self._known = current
+                        self._pending.update(info.port for info in added)
+                        self._pending.difference_update(removed)
+
+                for port in self._take_pending(current):
+                    pool.submit(self._probe, port)
+
+                self._wake_event.wait(self.interval)
+                self._wake_event.clear()
+
+    def _take_pending(self, current):
+        with self._lock:
+            if self._paused:
+                return []
+            ports = sorted((self._pending & current) - self._probing)
+            self._pending.difference_update(ports)
+            self._probing.update(ports)
+        return ports
+
+    def _probe(self, port):
+        try:
+            result = self.discovery.probe_port(port)
+        finally:
+            with self._lock:
+                self._probing.discard(port)
+        if not self._stop_event.is_set():
+            self.on_result(result)
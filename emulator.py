@@ -0,0 +1,506 @@
+"""Эмулятор устройства для отладки и измерения производительности без Arduino
+
+DeviceEmulator отвечает на те же команды, что и прошивка устройства
+(version, hashes, backup, update, restore, а внутри них - baud и codec),
+и принимает и передает файлы кадрами из transfer.py. Подключение - через
+pyserial по адресу socket://127.0.0.1:<порт> (listen) или через
+псевдотерминал /dev/pts/N (open_pty, только Unix), поэтому с эмулятором
+работают и консольная версия, и графический интерфейс.
+
+Моделируется линия 8N1: данные в обе стороны идут не быстрее согласованной
+скорости порта, каждый байт приходит с задержкой latency, запись каждого
+килобайта во флеш занимает flash_delay секунд, а ber задает вероятность
+искажения каждого бита. Ошибки вносятся только после согласования
+скорости, когда все данные идут кадрами с CRC32: текстовые команды
+передаются на низкой скорости, где ошибок на реальной линии почти нет.
+
+Если среди установленных файлов есть version.txt, его содержимое становится
+версией устройства.
+
+Запуск отдельно: python emulator.py --pty (или --listen 127.0.0.1:5000).
+"""
+
+import io
+import os
+import json
+import math
+import time
+import zlib
+import queue
+import random
+import socket
+import argparse
+import threading
+from collections import deque
+
+from manifest import build_manifest
+from transfer import (CAN, COMPRESSED_BLOCK_SIZE, COMPRESSION_CODECS, DEFAULT_BAUDRATE,
+                      END_PAYLOAD, FRAME_DATA, FRAME_DEFLATE, FRAME_END, SerialTransfer,
+                      TransferError, encode_reply)
+
+VERSION_FILE = "version.txt"
+DEFAULT_IMAGE_SIZE = 256 * 1024
+# Объем флеш-памяти: файл или образ большего размера устройство не принимает
+FLASH_SIZE = 32 * 1024 * 1024
+MAX_BAUDRATE = 921600
+
+# Порция данных, которая передается по линии целиком
+LINE_CHUNK = 64
+
+
+def firmware_image(size=DEFAULT_IMAGE_SIZE, seed=0):
+    """Образ прошивки: код (случайные байты) и незанятая флеш-память (0xFF)"""
+    code = random.Random(seed).randbytes(size // 2)
+    return code + b'\xff' * (size - len(code))
+
+
+class _Line:
+    """Сторона устройства на линии связи с интерфейсом, как у serial.Serial
+
+    recv(n) и send(data) читают и пишут транспорт (сокет или псевдотерминал).
+    Принятые данные становятся доступны через время передачи по линии
+    и latency, отправляемые - доставляются фоновым потоком с той же
+    задержкой, поэтому кадры окна передаются конвейером.
+    """
+
+    def __init__(self, recv, send, latency=0.0, ber=0.0, rng=None):
+        self.baudrate = DEFAULT_BAUDRATE
+        self.latency = latency
+        self.ber = ber
+        self.noisy = False
+        self.timeout = None
+        self.eof = False
+        self._recv = recv
+        self._send = send
+        self._rng = rng or random.Random()
+        self._buffer = bytearray()
+        self._incoming = deque()
+        self._outgoing = queue.Queue()
+        self._cond = threading.Condition()
+        self._rx_free = 0.0
+        self._tx_free = 0.0
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    def line_time(self, size):
+        """Время передачи size байт по линии 8N1"""
+        return size * 10 / self.baudrate
+
+    @property
+    def in_waiting(self):
+        with self._cond:
+            self._collect()
+            return len(self._buffer)
+
+    def read(self, size=1):
+        """До size байт; меньше, если за timeout больше не пришло
+
+        После закрытия подключения хостом и приема всех данных выбрасывает EOFError.
+        """
+        self._wait(lambda: len(self._buffer) >= size)
+        with self._cond:
+            if self.eof and not self._buffer and not self._incoming:
+                raise EOFError("Хост закрыл подключение")
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return self._corrupt(data) if self.noisy else data
+
+    def readline(self):
+        self._wait(lambda: b'\n' in self._buffer)
+        with self._cond:
+            end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+            data = bytes(self._buffer[:end])
+            del self._buffer[:end]
+        return data
+
+    def write(self, data):
+        if self.noisy:
+            data = self._corrupt(data)
+        for start in range(0, len(data), LINE_CHUNK):
+            piece = data[start:start + LINE_CHUNK]
+            self._tx_free = max(time.monotonic(), self._tx_free) + self.line_time(len(piece))
+            self._outgoing.put((self._tx_free + self.latency, piece))
+        return len(data)
+
+    def flush(self):
+        """Ожидание доставки всех отправленных данных"""
+        self._outgoing.join()
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._buffer.clear()
+            self._incoming.clear()
+
+    def close(self):
+        self._outgoing.put(None)
+
+    def _read_loop(self):
+        while True:
+            try:
+                data = self._recv(4096)
+            except OSError:
+                data = b''
+            with self._cond:
+                if not data:
+                    self.eof = True
+                    self._cond.notify_all()
+                    return
+                # Байты идут по линии друг за другом, приход делится на порции
+                for start in range(0, len(data), LINE_CHUNK):
+                    piece = data[start:start + LINE_CHUNK]
+                    self._rx_free = max(time.monotonic(), self._rx_free) + \
+                        self.line_time(len(piece))
+                    self._incoming.append((self._rx_free + self.latency, piece))
+                self._cond.notify_all()
+
+    def _write_loop(self):
+        while True:
+            item = self._outgoing.get()
+            try:
+                if item is None:
+                    return
+                deliver_at, data = item
+                delay = deliver_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                self._send(data)
+            except OSError:
+                pass
+            finally:
+                self._outgoing.task_done()
+
+    def _collect(self):
+        """Перенос в буфер пришедших данных; возвращает время прихода следующих"""
+        now = time.monotonic()
+        while self._incoming and self._incoming[0][0] <= now:
+            self._buffer += self._incoming.popleft()[1]
+        return self._incoming[0][0] if self._incoming else None
+
+    def _wait(self, ready):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                next_at = self._collect()
+                if ready() or (self.eof and next_at is None):
+                    return
+                now = time.monotonic()
+                wait = None if deadline is None else deadline - now
+                if wait is not None and wait <= 0:
+                    return
+                if next_at is not None:
+                    wait = next_at - now if wait is None else min(wait, next_at - now)
+                self._cond.wait(wait)
+
+    def _corrupt(self, data):
+        """Инверсия каждого бита с вероятностью ber"""
+        if not self.ber or not data:
+            return data
+        data = bytearray(data)
+        bits = len(data) * 8
+        # Число неискаженных бит до следующей ошибки распределено геометрически
+        position = self._error_gap()
+        while position < bits:
+            data[position // 8] ^= 1 << position % 8
+            position += 1 + self._error_gap()
+        return bytes(data)
+
+    def _error_gap(self):
+        return int(math.log(1.0 - self._rng.random()) / math.log(1.0 - self.ber))
+
+
+class _MemorySource:
+    """Файлы устройства в памяти как источник для build_manifest"""
+
+    def __init__(self, files):
+        self.files = files
+
+    def open(self, rel_path):
+        return io.BytesIO(self.files[rel_path])
+
+
+class DeviceEmulator:
+    """Эмулятор устройства с настраиваемой линией и временем записи во флеш
+
+    baudrate - максимальная скорость, на которую устройство соглашается;
+    image - образ прошивки, выгружаемый командой backup; files - уже
+    установленные файлы {путь: содержимое}. compression и hashes включают
+    поддержку сжатия и команды hashes. seed делает ошибки на линии
+    воспроизводимыми.
+    """
+
+    def __init__(self, version="1.0.0", image=None, files=None, baudrate=MAX_BAUDRATE,
+                 latency=0.0, flash_delay=0.0, ber=0.0, compression=True, hashes=True,
+                 seed=None):
+        if not 0 <= ber < 1:
+            raise ValueError("Вероятность ошибки бита должна быть в диапазоне [0, 1)")
+        self.version = version
+        self.image = firmware_image() if image is None else image
+        self.files = dict(files or {})
+        self.baudrate = baudrate
+        self.latency = latency
+        self.flash_delay = flash_delay
+        self.ber = ber
+        self.compression = compression
+        self.hashes = hashes
+        self.port = None
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._pty = None
+        self._closed = threading.Event()
+        self._commands = {
+            'version': self._version,
+            'hashes': self._hashes,
+            'backup': self._backup,
+            'update': self._update,
+            'restore': self._restore,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def listen(self, host='127.0.0.1', port=0):
+        """Прием подключений pyserial socket://; возвращает адрес порта"""
+        self._server = socket.create_server((host, port))
+        host, port = self._server.getsockname()[:2]
+        self.port = f"socket://{host}:{port}"
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self.port
+
+    def open_pty(self):
+        """Псевдотерминал, который открывается как обычный порт; возвращает его путь"""
+        import tty
+
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        # Дескриптор slave остается открытым, чтобы закрытие порта хостом
+        # не завершало сеанс
+        self._pty = (master, slave)
+        self.port = os.ttyname(slave)
+        line = self._line(lambda size: os.read(master, size),
+                          lambda data: _write_all(master, data))
+        threading.Thread(target=self._serve, args=(line, True), daemon=True).start()
+        return self.port
+
+    def close(self):
+        self._closed.set()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        if self._pty is not None:
+            for fd in self._pty:
+                os.close(fd)
+            self._pty = None
+
+    def _line(self, recv, send):
+        return _Line(recv, send, self.latency, self.ber, random.Random(self._rng.random()))
+
+    def _accept_loop(self):
+        # Как у реального порта, одновременно обслуживается одно подключение
+        while not self._closed.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            try:
+                with conn:
+                    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    line = self._line(conn.recv, conn.sendall)
+                    self._serve(line, False)
+                    line.flush()
+                    line.close()
+            except OSError:
+                # Хост закрыл подключение раньше, чем ушел ответ
+                continue
+
+    def _serve(self, line, persistent):
+        """Выполнение команд до закрытия подключения
+
+        Для псевдотерминала (persistent) ошибка команды не завершает сеанс.
+        Любая ошибка при разборе или выполнении команды (в том числе от
+        неверных полей запроса) прерывает только эту команду, но не прием
+        следующих подключений.
+        """
+        while not self._closed.is_set():
+            # После каждой команды устройство возвращается на исходную скорость
+            line.baudrate = DEFAULT_BAUDRATE
+            line.timeout = None
+            line.noisy = False
+            try:
+                request = line.readline()
+            except (EOFError, OSError):
+                return
+            if not request:
+                return
+            # Команда - последнее слово строки: остатки прерванного обмена
+            # перед ней пропускаются
+            words = request.decode(errors='replace').split()
+            handler = self._commands.get(words[-1]) if words else None
+            if handler is None:
+                continue
+            try:
+                with self._lock:
+                    handler(line)
+            except Exception:
+                if not persistent:
+                    return
+                line.reset_input_buffer()
+
+    def _version(self, line):
+        line.write(f"{self.version}\n".encode())
+
+    def _hashes(self, line):
+        if not self.hashes:
+            line.write(b"unknown command\n")
+            return
+        files = [(path, len(data)) for path, data in self.files.items()]
+        state = build_manifest(_MemorySource(self.files), files)
+        line.write((json.dumps(state) + "\n").encode())
+
+    def _backup(self, line):
+        self._negotiate_baudrate(line)
+        line.timeout = 1
+        if line.readline().strip() != b"ready":
+            raise TransferError("Хост не подтвердил готовность к приему")
+        line.noisy = True
+        link = SerialTransfer(line)
+        link.send_header(str(len(self.image)))
+        link.send_file(io.BytesIO(self.image), len(self.image))
+        link.close()
+
+    def _update(self, line):
+        codec = self._negotiate_compression(line)
+        self._negotiate_baudrate(line)
+        line.noisy = True
+        link = SerialTransfer(line)
+        count = link.receive_header()
+        if not count.isdigit():
+            raise TransferError(f"Неверное число файлов: {count!r}")
+        for _ in range(int(count)):
+            fields = link.receive_header().split('\t')
+            if len(fields) not in (2, 3) or not fields[0] or not fields[1].isdigit() or \
+                    int(fields[1]) > FLASH_SIZE or fields[2:] not in ([], ['patch']):
+                raise TransferError(f"Неверный заголовок файла: {fields!r}")
+            rel_path, size = fields[0], int(fields[1])
+            base = self.files.get(rel_path, b'') if fields[2:] == ['patch'] else b''
+            self.files[rel_path] = self._receive(link, size, codec, base)
+        if VERSION_FILE in self.files:
+            self.version = self.files[VERSION_FILE].decode(errors='replace').strip()
+        link.wait_close()
+
+    def _restore(self, line):
+        codec = self._negotiate_compression(line)
+        self._negotiate_baudrate(line)
+        line.noisy = True
+        link = SerialTransfer(line)
+        size = link.receive_header()
+        if not size.isdigit() or int(size) > FLASH_SIZE:
+            raise TransferError(f"Неверный размер образа: {size!r}")
+        self.image = self._receive(link, int(size), codec)
+        link.wait_close()
+
+    def _negotiate_baudrate(self, line):
+        line.timeout = 1
+        request = line.readline().decode(errors='replace').split()
+        offered = [int(b) for b in request[1].split(',') if b.isdigit()] \
+            if len(request) == 2 and request[0] == 'baud' else []
+        supported = [b for b in offered if b <= self.baudrate]
+        if not supported:
+            line.write(b"no\n")
+            return
+        line.write(f"ok {max(supported)}\n".encode())
+        # Ответ уходит на прежней скорости, затем обе стороны переключаются
+        line.flush()
+        line.baudrate = max(supported)
+
+    def _negotiate_compression(self, line):
+        line.timeout = 1
+        request = line.readline().decode(errors='replace').split()
+        offered = request[1].split(',') if len(request) == 2 and request[0] == 'codec' else []
+        codec = next((c for c in offered if c in COMPRESSION_CODECS), None) \
+            if self.compression else None
+        line.write(f"ok {codec}\n".encode() if codec else b"no\n")
+        return codec
+
+    def _receive(self, link, size, codec=None, base=b''):
+        """Прием файла кадрами с записью по смещениям, как во флеш-память
+
+        base - текущее содержимое файла для передачи изменившихся участков.
+        """
+        data = bytearray(base[:size])
+        data += bytes(size - len(data))
+        line = link.ser
+        while True:
+            frame_type, seq, offset, payload = link.read_frame(link.stats)
+            if frame_type == FRAME_DEFLATE and codec is not None:
+                payload = _inflate(payload, int(codec.split(':')[1]))
+                frame_type = FRAME_DATA
+            if frame_type == FRAME_DATA and offset + len(payload) <= size:
+                data[offset:offset + len(payload)] = payload
+                if self.flash_delay:
+                    time.sleep(self.flash_delay * len(payload) / 1024)
+                link.ack(frame_type, seq)
+            elif frame_type == FRAME_END and payload == END_PAYLOAD.pack(size, zlib.crc32(data)):
+                link.ack(frame_type, seq)
+                return bytes(data)
+            else:
+                line.write(encode_reply(CAN, seq))
+                raise TransferError("Файл принят с ошибкой")
+
+
+def _inflate(payload, wbits):
+    inflater = zlib.decompressobj(-wbits)
+    data = inflater.decompress(payload, COMPRESSED_BLOCK_SIZE)
+    if not inflater.eof:
+        raise zlib.error("Сжатый кадр больше буфера устройства")
+    return data
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Эмулятор устройства для отладки без Arduino")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--pty", action="store_true", help="открыть псевдотерминал")
+    target.add_argument("--listen", default="127.0.0.1:0", metavar="HOST:PORT",
+                        help="адрес для подключения по socket:// (по умолчанию свободный порт)")
+    parser.add_argument("--version", default="1.0.0", help="версия ПО устройства")
+    parser.add_argument("--image-size", type=int, default=DEFAULT_IMAGE_SIZE,
+                        help="размер образа прошивки для backup, байт")
+    parser.add_argument("--baud", type=int, default=MAX_BAUDRATE, help="максимальная скорость")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка линии, секунды")
+    parser.add_argument("--flash-delay", type=float, default=0.0,
+                        help="время записи 1 КБ во флеш, секунды")
+    parser.add_argument("--ber", type=float, default=0.0, help="вероятность ошибки бита")
+    parser.add_argument("--no-compression", action="store_true", help="не поддерживать сжатие")
+    args = parser.parse_args(argv)
+
+    emulator = DeviceEmulator(args.version, firmware_image(args.image_size), baudrate=args.baud,
+                              latency=args.latency, flash_delay=args.flash_delay, ber=args.ber,
+                              compression=not args.no_compression)
+    if args.pty:
+        port = emulator.open_pty()
+    else:
+        host, _, port = args.listen.rpartition(':')
+        port = emulator.listen(host or '127.0.0.1', int(port))
+    print(f"Устройство {args.version} доступно на порту {port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,6 @@
+class UpdateError(Exception):
+    """Ошибка, текст которой показывается пользователю как есть"""
+
+
+class OperationCancelled(Exception):
+    """Операция прервана пользователем"""
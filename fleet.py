@@ -0,0 +1,134 @@
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from device import Device
+from errors import OperationCancelled, UpdateError
+
+DEFAULT_MAX_WORKERS = 8
+
+
+class PortResult:
+    """Итог обновления одного устройства"""
+
+    UPDATED = "updated"
+    UP_TO_DATE = "up-to-date"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, port, status, version=None, backup_file=None, stats=None, error=None):
+        self.port = port
+        self.status = status
+        self.version = version
+        self.backup_file = backup_file
+        self.stats = stats
+        self.error = error
+
+    def __str__(self):
+        if self.status == self.UPDATED:
+            return f"{self.port}: обновлено с {self.version}, передано {self.stats}"
+        if self.status == self.UP_TO_DATE:
+            return f"{self.port}: установлена актуальная версия {self.version}"
+        if self.status == self.CANCELLED:
+            return f"{self.port}: отменено"
+        return f"{self.port}: ошибка - {self.error}"
+
+
+class FleetUpdater:
+    """Параллельное обновление нескольких устройств
+
+    Релиз загружается и распаковывается один раз, все потоки только читают
+    его файлы. Каждый порт обслуживается отдельным потоком пула ограниченного
+    размера: чтение версии, резервная копия и установка. Ошибка на одном
+    устройстве не прерывает обновление остальных. Устройства с версией
+    вне диапазона requires (SimpleSpec) не обновляются: им нужна
+    промежуточная версия. Если передан metrics (metrics.Metrics), этапы
+    и передача по каждому порту измеряются. boards - платы устройств
+    {порт: плата}, по ним выбираются архивы релиза.
+    """
+
+    def __init__(self, ports, release, backups, max_workers=DEFAULT_MAX_WORKERS,
+                 on_progress=None, on_status=None, check_cancelled=None, requires=None,
+                 metrics=None, boards=None):
+        self.ports = list(ports)
+        self.release = release
+        self.backups = backups
+        self.max_workers = max_workers
+        self.on_progress = on_progress or (lambda port, done, total: None)
+        self.on_status = on_status or (lambda port, message: None)
+        self.check_cancelled = check_cancelled
+        self.requires = requires
+        self.metrics = metrics
+        self.boards = boards or {}
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        """Остановка обновления на всех портах"""
+        self._cancel_event.set()
+
+    def run(self):
+        """Обновление всех портов, возвращает список PortResult в порядке портов"""
+        results = {}
+        workers = max(1, min(self.max_workers, len(self.ports)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fleet") as pool:
+            futures = {pool.submit(self.update_port, port): port for port in self.ports}
+            for future in as_completed(futures):
+                result = future.result()
+                results[result.port] = result
+                if self.metrics is not None:
+                    self.metrics.event('port_result', port=result.port, status=result.status,
+                                       version=result.version,
+                                       error=str(result.error) if result.error else None)
+        return [results[port] for port in self.ports]
+
+    def update_port(self, port):
+        """Полный цикл обновления одного устройства"""
+        device = Device(port, check_cancelled=self._check_cancelled)
+        version = None
+        try:
+            self._check_cancelled()
+            release = self.release.for_board(self.boards.get(port))
+            self.on_status(port, "Чтение версии...")
+            version = device.read_version()
+            if version >= self.release.version:
+                self.on_progress(port, 1, 1)
+                return PortResult(port, PortResult.UP_TO_DATE, version)
+            if self.requires is not None and not self.requires.match(version):
+                raise UpdateError(f"версия {self.release.version} устанавливается только "
+                                  f"поверх {self.requires}, нужна промежуточная версия")
+
+            self.on_status(port, "Резервная копия...")
+            with self._phase('backup', port):
+                record, backup_stats = device.create_backup(self.backups, version)
+            self._record_transfer(port, backup_stats, 'receive')
+            backup_file = self.backups.path(record['sha256'])
+
+            with self._phase('device_verify', port):
+                plan = device.plan_update(release.files, release.manifest)
+            self.on_status(port, f"Установка: {plan}")
+            with self._phase('transfer', port):
+                stats = device.install(plan, release.source,
+                                       lambda done, total: self.on_progress(port, done, total))
+            self._record_transfer(port, stats)
+            return PortResult(port, PortResult.UPDATED, version, backup_file, stats)
+        except OperationCancelled:
+            return PortResult(port, PortResult.CANCELLED, version)
+        except Exception as e:
+            return PortResult(port, PortResult.FAILED, version, error=e)
+
+    def _phase(self, name, port):
+        return nullcontext() if self.metrics is None else self.metrics.phase(name, port)
+
+    def _record_transfer(self, port, stats, direction='send'):
+        if self.metrics is not None:
+            self.metrics.record_transfer(port, stats, direction)
+
+    def _check_cancelled(self):
+        if self.check_cancelled:
+            try:
+                self.check_cancelled()
+            except OperationCancelled:
+                self._cancel_event.set()
+                raise
+        if self._cancel_event.is_set():
+            raise OperationCancelled()
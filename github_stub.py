@@ -0,0 +1,217 @@
+"""Локальная замена GitHub для отладки и измерения производительности
+
+ReleaseServer отдает список релизов в формате GitHub REST API
+(/repos/<владелец>/<репозиторий>/releases?per_page=&page=) с ETag
+и ответом 304 на условный запрос, заголовками лимита запросов
+X-RateLimit-*, и сами ассеты с поддержкой HEAD, Range и If-Range.
+Для ассетов публикуется поле digest (sha256:...), как у GitHub.
+
+Скорость отдачи ассетов (max_rate, байт/с на соединение) и задержка
+ответа (latency) настраиваются, число запросов и отданных байт
+учитывается в requests и bytes_sent.
+
+    with ReleaseServer() as server:
+        server.add_release("v2.0.0", {"update.zip": data})
+        core = UpdaterCore(api_url=server.api_url)
+"""
+
+import json
+import time
+import hashlib
+import threading
+from urllib.parse import parse_qs, urlsplit, quote, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core import DEFAULT_REPO
+
+DEFAULT_RATE_LIMIT = 5000
+SEND_CHUNK = 64 * 1024
+
+
+class ReleaseServer:
+    """HTTP-сервер с релизами в памяти
+
+    rate_limit - число запросов к API до отказа 403 (None - без ограничения).
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, repo=DEFAULT_REPO, max_rate=None, latency=0.0,
+                 rate_limit=None):
+        self.repo = repo
+        self.max_rate = max_rate
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.requests = 0
+        self.bytes_sent = 0
+        self._releases = []
+        self._assets = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        host, port = self._server.server_address[:2]
+        self.url = f"http://{host}:{port}"
+        self.api_url = f"{self.url}/repos/{repo}/releases"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_release(self, tag, assets, body="", prerelease=False, draft=False, digest=True):
+        """Публикация релиза с ассетами {имя: содержимое}; новые релизы идут первыми"""
+        items = []
+        for name, data in assets.items():
+            path = f"/{self.repo}/releases/download/{quote(tag)}/{quote(name)}"
+            item = {'name': name, 'size': len(data), 'browser_download_url': self.url + path}
+            if digest:
+                item['digest'] = "sha256:" + hashlib.sha256(data).hexdigest()
+            items.append(item)
+            etag = '"' + hashlib.md5(data).hexdigest() + '"'
+            with self._lock:
+                self._assets[unquote(path)] = (data, etag)
+        release = {
+            'tag_name': tag,
+            'name': tag,
+            'body': body,
+            'draft': draft,
+            'prerelease': prerelease,
+            'published_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'assets': items,
+        }
+        with self._lock:
+            self._releases.insert(0, release)
+        return release
+
+    def releases_page(self, per_page, page):
+        with self._lock:
+            return self._releases[(page - 1) * per_page:page * per_page]
+
+    def asset(self, path):
+        with self._lock:
+            return self._assets.get(path)
+
+    def count_request(self, api):
+        """Учет запроса; для API возвращает остаток лимита или None без лимита"""
+        with self._lock:
+            self.requests += 1
+            if not api or self.rate_limit is None:
+                return None
+            self.rate_limit -= 1
+            return self.rate_limit
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle(send_body=True)
+
+    def do_HEAD(self):
+        self._handle(send_body=False)
+
+    def _handle(self, send_body):
+        stub = self.server.stub
+        if stub.latency:
+            time.sleep(stub.latency)
+        url = urlsplit(self.path)
+        if url.path == f"/repos/{stub.repo}/releases":
+            self._releases(stub, parse_qs(url.query), send_body)
+            return
+        stub.count_request(api=False)
+        asset = stub.asset(unquote(url.path))
+        if asset is None:
+            self._reply(404, b'{"message": "Not Found"}', send_body=send_body)
+            return
+        self._asset(stub, *asset, send_body)
+
+    def _releases(self, stub, query, send_body):
+        remaining = stub.count_request(api=True)
+        headers = {}
+        if remaining is not None:
+            headers['X-RateLimit-Limit'] = str(DEFAULT_RATE_LIMIT)
+            headers['X-RateLimit-Remaining'] = str(max(0, remaining))
+            headers['X-RateLimit-Reset'] = str(int(time.time()) + 3600)
+            if remaining < 0:
+                self._reply(403, b'{"message": "API rate limit exceeded"}', headers, send_body)
+                return
+        per_page = int(query.get('per_page', ['30'])[0])
+        page = int(query.get('page', ['1'])[0])
+        body = json.dumps(stub.releases_page(per_page, page)).encode()
+        headers['ETag'] = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == headers['ETag']:
+            self._reply(304, b'', headers, send_body)
+            return
+        headers['Content-Type'] = 'application/json'
+        self._reply(200, body, headers, send_body)
+
+    def _asset(self, stub, data, etag, send_body):
+        start, end = 0, len(data) - 1
+        status = 200
+        headers = {'ETag': etag, 'Accept-Ranges': 'bytes',
+                   'Content-Type': 'application/octet-stream'}
+        requested = _parse_range(self.headers.get('Range'), len(data))
+        if requested is not None and self.headers.get('If-Range', etag) == etag:
+            if requested is False:
+                headers['Content-Range'] = f"bytes */{len(data)}"
+                self._reply(416, b'', headers, send_body)
+                return
+            start, end = requested
+            status = 206
+            headers['Content-Range'] = f"bytes {start}-{end}/{len(data)}"
+        self._reply(status, memoryview(data)[start:end + 1], headers, send_body,
+                    max_rate=stub.max_rate)
+
+    def _reply(self, status, body, headers=None, send_body=True, max_rate=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not send_body:
+            return
+        started = time.monotonic()
+        sent = 0
+        try:
+            for offset in range(0, len(body), SEND_CHUNK):
+                chunk = body[offset:offset + SEND_CHUNK]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if max_rate:
+                    delay = sent / max_rate - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+        except OSError:
+            self.close_connection = True
+        finally:
+            stub = self.server.stub
+            with stub._lock:
+                stub.bytes_sent += sent
+
+
+def _parse_range(header, size):
+    """(начало, конец) из "bytes=a-b", None без заголовка, False для недопустимого"""
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes='):].partition('-')
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            start = max(0, size - int(last))
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return False
+    return start, min(end, size - 1)
@@ -0,0 +1,506 @@
+import sys
+from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
+                           QHBoxLayout, QComboBox, QPushButton, QLabel,
+                           QProgressBar, QMessageBox, QFrame, QSpacerItem,
+                           QSizePolicy, QListWidget, QListWidgetItem)
+from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QFont, QIcon
+from qt_material import apply_stylesheet
+from core import UpdaterCore
+from fleet import PortResult
+from workers import (CheckUpdatesWorker, FleetWorker, InstallWorker, PortMonitorWorker,
+                     PrefetchWorker, RollbackWorker)
+
+class CustomFrame(QFrame):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFrameShape(QFrame.Shape.StyledPanel)
+        self.setFrameShadow(QFrame.Shadow.Raised)
+        self.setStyleSheet("""
+            CustomFrame {
+                background-color: rgba(255, 255, 255, 0.05);
+                border-radius: 10px;
+                padding: 15px;
+                margin: 5px;
+            }
+        """)
+
+class SoftwareUpdater(QMainWindow):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Обновление программного обеспечения")
+        self.setMinimumSize(900, 600)
+        
+        # Установка иконки приложения
+        self.setWindowIcon(QIcon("icons/app.svg"))
+        
+        # Инициализация переменных
+        self.current_version = None
+        self.latest_version = None
+        self.release = None
+        self.worker = None
+        self.fleet_items = {}
+        self.fleet_workers = 8
+        # Фоновая загрузка релизов: период проверки (с) и ограничение скорости (байт/с)
+        self.prefetch_interval = 3600
+        self.prefetch_max_rate = 512 * 1024
+        
+        # Логика обновления, общая с консольной версией (cli.py)
+        self.core = UpdaterCore()
+        
+        # Создаем центральный виджет
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        main_layout = QVBoxLayout(central_widget)
+        main_layout.setSpacing(20)
+        main_layout.setContentsMargins(20, 20, 20, 20)
+        
+        # Заголовок
+        title_frame = CustomFrame()
+        title_layout = QVBoxLayout(title_frame)
+        title_label = QLabel("Система обновления ПО")
+        title_label.setFont(QFont("Segoe UI", 16, QFont.Weight.Bold))
+        title_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        title_layout.addWidget(title_label)
+        
+        # Информация о версиях
+        version_frame = CustomFrame()
+        version_layout = QVBoxLayout(version_frame)
+        version_layout.setSpacing(10)
+        
+        self.current_version_label = QLabel("Текущая версия: Проверка...")
+        self.latest_version_label = QLabel("Доступная версия: Проверка...")
+        self.current_version_label.setFont(QFont("Segoe UI", 11))
+        self.latest_version_label.setFont(QFont("Segoe UI", 11))
+        
+        version_layout.addWidget(self.current_version_label)
+        version_layout.addWidget(self.latest_version_label)
+        
+        # COM порты
+        port_frame = CustomFrame()
+        port_layout = QHBoxLayout(port_frame)
+        port_layout.setSpacing(15)
+        
+        self.port_label = QLabel("USB порт:")
+        self.port_label.setFont(QFont("Segoe UI", 11))
+        self.port_combo = QComboBox()
+        self.port_combo.setMinimumWidth(200)
+        self.port_combo.setFont(QFont("Segoe UI", 10))
+        self.port_combo.currentTextChanged.connect(self.show_port_version)
+        
+        self.refresh_button = QPushButton("Обновить список")
+        self.refresh_button.setFont(QFont("Segoe UI", 10))
+        self.refresh_button.clicked.connect(self.update_ports)
+        self.refresh_button.setMinimumWidth(150)
+        
+        # Добавляем иконки для кнопок
+        self.refresh_button.setIcon(QIcon("icons/refresh.svg"))
+        
+        port_layout.addWidget(self.port_label)
+        port_layout.addWidget(self.port_combo)
+        port_layout.addWidget(self.refresh_button)
+        port_layout.addStretch()
+        
+        # Групповое обновление
+        fleet_frame = CustomFrame()
+        fleet_layout = QVBoxLayout(fleet_frame)
+        
+        fleet_label = QLabel("Групповое обновление:")
+        fleet_label.setFont(QFont("Segoe UI", 11))
+        self.fleet_list = QListWidget()
+        self.fleet_list.setFont(QFont("Segoe UI", 10))
+        self.fleet_list.setMaximumHeight(150)
+        
+        fleet_buttons_layout = QHBoxLayout()
+        fleet_buttons_layout.setSpacing(15)
+        self.select_all_button = QPushButton("Выбрать все")
+        self.fleet_button = QPushButton("Установить на выбранные")
+        self.fleet_button.setIcon(QIcon("icons/install.svg"))
+        for button in [self.select_all_button, self.fleet_button]:
+            button.setFont(QFont("Segoe UI", 10))
+            button.setMinimumWidth(150)
+            fleet_buttons_layout.addWidget(button)
+        fleet_buttons_layout.addStretch()
+        
+        self.select_all_button.clicked.connect(self.select_all_ports)
+        self.fleet_button.clicked.connect(self.fleet_update)
+        self.fleet_button.setEnabled(False)
+        
+        fleet_layout.addWidget(fleet_label)
+        fleet_layout.addWidget(self.fleet_list)
+        fleet_layout.addLayout(fleet_buttons_layout)
+        
+        # Прогресс бар
+        progress_frame = CustomFrame()
+        progress_layout = QVBoxLayout(progress_frame)
+        
+        progress_label = QLabel("Прогресс операции:")
+        progress_label.setFont(QFont("Segoe UI", 11))
+        self.progress = QProgressBar()
+        self.progress.setMinimumHeight(25)
+        self.progress.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.progress.setFont(QFont("Segoe UI", 10))
+        self.progress.setStyleSheet("""
+            QProgressBar {
+                border-radius: 5px;
+                text-align: center;
+            }
+            QProgressBar::chunk {
+                border-radius: 5px;
+            }
+        """)
+        
+        progress_layout.addWidget(progress_label)
+        progress_layout.addWidget(self.progress)
+        
+        # Кнопки управления
+        button_frame = CustomFrame()
+        button_layout = QHBoxLayout(button_frame)
+        button_layout.setSpacing(15)
+        
+        self.check_updates_button = QPushButton("Проверить обновления")
+        self.install_button = QPushButton("Установить")
+        self.rollback_button = QPushButton("Откатить к предыдущей версии")
+        self.cancel_button = QPushButton("Отмена")
+        
+        # Добавляем иконки для кнопок
+        self.check_updates_button.setIcon(QIcon("icons/check.svg"))
+        self.install_button.setIcon(QIcon("icons/install.svg"))
+        self.rollback_button.setIcon(QIcon("icons/rollback.svg"))
+        
+        for button in [self.check_updates_button, self.install_button, self.rollback_button,
+                       self.cancel_button]:
+            button.setFont(QFont("Segoe UI", 10))
+            button.setMinimumHeight(40)
+            button.setMinimumWidth(200)
+        
+        self.check_updates_button.clicked.connect(self.check_updates)
+        self.install_button.clicked.connect(self.install_update)
+        self.rollback_button.clicked.connect(self.rollback_version)
+        self.cancel_button.clicked.connect(self.cancel_operation)
+        
+        self.install_button.setEnabled(False)
+        self.rollback_button.setEnabled(False)
+        self.cancel_button.setEnabled(False)
+        
+        button_layout.addWidget(self.check_updates_button)
+        button_layout.addWidget(self.install_button)
+        button_layout.addWidget(self.rollback_button)
+        button_layout.addWidget(self.cancel_button)
+        
+        # Добавляем все фреймы в главный layout
+        main_layout.addWidget(title_frame)
+        main_layout.addWidget(version_frame)
+        main_layout.addWidget(port_frame)
+        main_layout.addWidget(fleet_frame)
+        main_layout.addWidget(progress_frame)
+        main_layout.addWidget(button_frame)
+        main_layout.addStretch()
+        
+        # Статус бар
+        self.statusBar().showMessage("Готов к работе")
+        self.statusBar().setFont(QFont("Segoe UI", 10))
+        
+        # Отслеживание подключения устройств: новые порты опрашиваются
+        # автоматически, все одновременно
+        self.port_monitor = PortMonitorWorker(self.core.discovery, self)
+        self.port_monitor.ports_changed.connect(self.on_ports_changed)
+        self.port_monitor.probed.connect(self.on_port_probed)
+        self.port_monitor.start()
+        
+        # Новые релизы загружаются заранее, чтобы установка начиналась сразу
+        self.prefetch = PrefetchWorker(self.core, self.prefetch_interval,
+                                       max_rate=self.prefetch_max_rate, parent=self)
+        self.prefetch.staged.connect(self.on_release_staged)
+        self.prefetch.start()
+    
+    def update_ports(self):
+        """Повторный опрос всех подключенных устройств"""
+        self.port_monitor.request_probe()
+    
+    def on_ports_changed(self, ports, added, removed):
+        """Обновление списка портов при подключении и отключении устройств"""
+        current_port = self.port_combo.currentText()
+        checked = set(self.selected_ports())
+        
+        self.port_combo.blockSignals(True)
+        self.port_combo.clear()
+        self.port_combo.addItems([info.port for info in ports])
+        if current_port in [info.port for info in ports]:
+            self.port_combo.setCurrentText(current_port)
+        self.port_combo.blockSignals(False)
+        
+        self.fleet_list.clear()
+        self.fleet_items = {}
+        for info in ports:
+            item = QListWidgetItem()
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(Qt.CheckState.Checked if info.port in checked
+                               else Qt.CheckState.Unchecked)
+            self.fleet_list.addItem(item)
+            self.fleet_items[info.port] = item
+            self.show_fleet_item(info.port, info)
+        
+        if added:
+            self.statusBar().showMessage(
+                "Подключено: " + ", ".join(str(info) for info in added))
+        elif removed:
+            self.statusBar().showMessage("Отключено: " + ", ".join(removed))
+        self.show_port_version(self.port_combo.currentText())
+    
+    def show_fleet_item(self, port, info=None):
+        """Порт в списке группового обновления с известной версией устройства"""
+        version = self.core.discovery.known_version(port)
+        text = str(info) if info is not None else port
+        if version is not None:
+            text += f" — версия {version}"
+        self.set_fleet_text(port, text)
+    
+    def set_fleet_text(self, port, text):
+        # Порт мог быть отключен, пока шла операция
+        if port in self.fleet_items:
+            self.fleet_items[port].setText(text)
+    
+    def on_port_probed(self, result):
+        if result.error is None:
+            self.show_fleet_item(result.port, result.info)
+        else:
+            self.set_fleet_text(result.port, f"{result.info} — нет ответа")
+        if result.port == self.port_combo.currentText():
+            if result.error is None:
+                self.show_port_version(result.port)
+            else:
+                self.current_version = None
+                self.current_version_label.setText("Текущая версия: Ошибка чтения")
+                self.update_install_button()
+    
+    def show_port_version(self, port):
+        """Версия устройства на выбранном порту из последнего опроса"""
+        self.current_version = self.core.discovery.known_version(port) if port else None
+        if self.current_version is not None:
+            self.current_version_label.setText(f"Текущая версия: {self.current_version}")
+        else:
+            self.current_version_label.setText("Текущая версия: Проверка...")
+        self.update_install_button()
+    
+    def update_install_button(self):
+        self.install_button.setEnabled(self.worker is None and self.can_install())
+        self.rollback_button.setEnabled(self.worker is None and self.can_rollback())
+    
+    def select_all_ports(self):
+        """Отметка всех портов для группового обновления"""
+        for item in self.fleet_items.values():
+            item.setCheckState(Qt.CheckState.Checked)
+    
+    def selected_ports(self):
+        return [port for port, item in self.fleet_items.items()
+                if item.checkState() == Qt.CheckState.Checked]
+    
+    def start_worker(self, worker, on_success, critical=False):
+        """Запуск фоновой операции с блокировкой кнопок на время ее выполнения"""
+        self.worker = worker
+        worker.progress.connect(self.progress.setValue)
+        worker.status.connect(self.statusBar().showMessage)
+        worker.succeeded.connect(on_success)
+        if critical:
+            worker.failed.connect(lambda message: QMessageBox.critical(self, "Ошибка", message))
+        else:
+            worker.failed.connect(lambda message: QMessageBox.warning(self, "Ошибка", message))
+        worker.cancelled.connect(lambda: self.statusBar().showMessage("Операция отменена"))
+        worker.finished.connect(lambda: self.on_worker_finished(worker))
+        worker.finished.connect(worker.deleteLater)
+        
+        self.set_busy(True)
+        if critical:
+            # Во время прошивки порты не опрашиваются и релизы не загружаются
+            self.port_monitor.pause()
+            self.prefetch.pause()
+        worker.start()
+    
+    def set_busy(self, busy):
+        """Переключение кнопок между режимами ожидания и выполнения операции"""
+        self.check_updates_button.setEnabled(not busy)
+        self.refresh_button.setEnabled(not busy)
+        self.port_combo.setEnabled(not busy)
+        self.fleet_list.setEnabled(not busy)
+        self.select_all_button.setEnabled(not busy)
+        self.fleet_button.setEnabled(not busy and self.release is not None)
+        self.install_button.setEnabled(not busy and self.can_install())
+        self.rollback_button.setEnabled(not busy and self.can_rollback())
+        self.cancel_button.setEnabled(busy)
+    
+    def can_install(self):
+        return (self.release is not None and self.current_version is not None
+                and self.latest_version > self.current_version)
+    
+    def can_rollback(self):
+        port = self.port_combo.currentText()
+        return bool(port) and self.core.latest_backup(port) is not None
+    
+    def cancel_operation(self):
+        """Отмена текущей фоновой операции"""
+        if self.worker is not None:
+            self.cancel_button.setEnabled(False)
+            self.statusBar().showMessage("Отмена операции...")
+            self.worker.cancel()
+    
+    def on_worker_finished(self, worker):
+        self.worker = None
+        self.progress.setValue(0)
+        self.set_busy(False)
+        self.port_monitor.resume()
+        self.prefetch.resume()
+        if not worker.isInterruptionRequested():
+            self.statusBar().showMessage("Готов к работе")
+    
+    def check_updates(self):
+        """Проверка наличия обновлений на GitHub"""
+        self.start_worker(CheckUpdatesWorker(self.core, self),
+                          self.on_updates_checked)
+    
+    def on_release_staged(self, release):
+        """Релиз загружен в фоне: установку можно начинать без проверки обновлений"""
+        if self.worker is not None:
+            return
+        self.release = release
+        self.latest_version = release.version
+        self.latest_version_label.setText(f"Доступная версия: {self.latest_version}")
+        self.update_install_button()
+        self.statusBar().showMessage(f"Версия {release.version} загружена и готова к установке")
+    
+    def on_updates_checked(self, release):
+        self.release = release
+        self.latest_version = release.version
+        self.latest_version_label.setText(f"Доступная версия: {self.latest_version}")
+        
+        if self.current_version and self.latest_version > self.current_version:
+            files_list = "\n".join(
+                (f"Файлы для платы {part.board}:\n" if part.board else "Файлы для обновления:\n")
+                + "".join(f"- {rel_path}\n" for rel_path, _ in part.files)
+                + f"Сохранены в: {part.source}"
+                for part in release.parts())
+            QMessageBox.information(self, "Обновление доступно", 
+                                 f"Доступна новая версия: {self.latest_version}\n"
+                                 f"{files_list}")
+        else:
+            QMessageBox.information(self, "Обновления не требуются", 
+                                 "У вас установлена последняя версия")
+    
+    def install_update(self):
+        """Установка обновления"""
+        if self.release is None:
+            QMessageBox.warning(self, "Ошибка", "Сначала проверьте наличие обновлений")
+            return
+        
+        port = self.port_combo.currentText()
+        self.start_worker(InstallWorker(self.core, port, self.release, self),
+                          lambda stats: self.on_update_installed(port, stats), critical=True)
+    
+    def on_update_installed(self, port, stats):
+        self.port_monitor.request_probe([port])
+        self.show_transfer_report("Обновление успешно установлено", stats)
+    
+    def rollback_version(self):
+        """Откат к предыдущей версии"""
+        port = self.port_combo.currentText()
+        self.start_worker(RollbackWorker(self.core, port, self),
+                          lambda stats: self.on_rollback_finished(port, stats), critical=True)
+    
+    def on_rollback_finished(self, port, stats):
+        self.port_monitor.request_probe([port])
+        self.show_transfer_report("Восстановление завершено успешно", stats)
+    
+    def show_transfer_report(self, message, stats):
+        """Итог передачи; сжатие и время по каждому файлу - в подробностях"""
+        box = QMessageBox(QMessageBox.Icon.Information, "Успех", f"{message}\nПередано {stats}",
+                          parent=self)
+        box.setDetailedText(stats.report())
+        box.exec()
+    
+    def fleet_update(self):
+        """Параллельная установка обновления на все выбранные устройства"""
+        if self.release is None:
+            QMessageBox.warning(self, "Ошибка", "Сначала проверьте наличие обновлений")
+            return
+        
+        ports = self.selected_ports()
+        if not ports:
+            QMessageBox.warning(self, "Ошибка", "Не выбрано ни одного устройства")
+            return
+        
+        for port in ports:
+            self.set_fleet_text(port, f"{port} — ожидание")
+        worker = FleetWorker(self.core, ports, self.release, self.fleet_workers, self)
+        worker.port_status.connect(
+            lambda port, message: self.set_fleet_text(port, f"{port} — {message}"))
+        worker.port_progress.connect(
+            lambda port, value: self.set_fleet_text(port, f"{port} — установка {value}%"))
+        self.start_worker(worker, self.on_fleet_finished, critical=True)
+    
+    def on_fleet_finished(self, results):
+        for result in results:
+            self.set_fleet_text(result.port, str(result))
+        self.port_monitor.request_probe(
+            [r.port for r in results if r.status == PortResult.UPDATED])
+        
+        updated = sum(r.status == PortResult.UPDATED for r in results)
+        failed = sum(r.status == PortResult.FAILED for r in results)
+        summary = "\n".join(str(r) for r in results)
+        message = (f"Обновлено устройств: {updated} из {len(results)}, ошибок: {failed}\n\n"
+                   f"{summary}")
+        if failed:
+            QMessageBox.warning(self, "Групповое обновление", message)
+        else:
+            QMessageBox.information(self, "Групповое обновление", message)
+    
+    def closeEvent(self, event):
+        """Корректное завершение фоновой операции при закрытии окна"""
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker.wait()
+        self.port_monitor.stop()
+        self.prefetch.stop()
+        self.port_monitor.wait()
+        self.prefetch.wait()
+        self.core.flush_metrics()
+        super().closeEvent(event)
+
+def main():
+    app = QApplication(sys.argv)
+    apply_stylesheet(app, theme='dark_teal.xml', invert_secondary=True)
+    
+    # Дополнительные стили для темной темы
+    app.setStyleSheet("""
+        QMainWindow {
+            background-color: #1e1e1e;
+        }
+        QMessageBox {
+            background-color: #2d2d2d;
+        }
+        QMessageBox QLabel {
+            color: #ffffff;
+            font-size: 11pt;
+        }
+        QMessageBox QPushButton {
+            min-width: 100px;
+            min-height: 30px;
+            font-size: 10pt;
+        }
+        QComboBox {
+            padding: 5px;
+            min-height: 25px;
+        }
+        QPushButton {
+            padding: 5px 15px;
+        }
+        QLabel {
+            color: #ffffff;
+        }
+    """)
+    
+    window = SoftwareUpdater()
+    window.show()
+    sys.exit(app.exec())
+
+if __name__ == '__main__':
+    main() 
\ No newline at end of file
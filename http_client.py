@@ -0,0 +1,508 @@
+"""HTTP-доступ к GitHub: общий пул соединений, условные запросы и докачка
+
+Ответы API кэшируются на диске вместе с ETag/Last-Modified; повторный
+запрос отправляется с If-None-Match, и ответ 304 (не расходующий лимит
+запросов GitHub) возвращает сохраненные данные. Остаток лимита запросов
+из заголовков X-RateLimit-* запоминается, а отказ по лимиту выбрасывается
+как RateLimitError со временем, через которое можно повторить запрос. Файлы загружаются во
+временный файл .part, прерванная загрузка продолжается запросом Range.
+SHA-256 загружаемого файла считается по ходу загрузки, без отдельного
+прохода чтения.
+
+Большие файлы (от SEGMENTED_MIN_SIZE) загружаются частями по нескольким
+соединениям пула одновременно: файл .part сразу создается нужного размера,
+и каждая часть пишется по своему смещению (os.pwrite), без общей позиции
+файла. Границы и ход загрузки частей сохраняются в .part.json сразу и
+затем через каждые STATE_SAVE_INTERVAL байт, поэтому загрузка, прерванная
+в том числе аварийным завершением процесса, продолжается с тех же мест. Хеш такого файла
+считается после загрузки. Несколько файлов (например, архивы для разных
+плат) загружаются одновременно с общим прогрессом.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from integrity import IntegrityError, file_sha256
+from jsonfile import write_json
+
+USER_AGENT = "software-update-controller"
+DEFAULT_TIMEOUT = 15
+CHUNK_SIZE = 64 * 1024
+
+# Загрузка частями: порог размера файла, минимальный размер части и число соединений
+SEGMENTED_MIN_SIZE = 8 * 1024 * 1024
+MIN_SEGMENT_SIZE = 2 * 1024 * 1024
+DEFAULT_CONNECTIONS = 4
+# Повторы части после обрыва соединения (с места обрыва)
+SEGMENT_RETRIES = 3
+# Ход загрузки частей сохраняется на диск через каждые столько байт
+STATE_SAVE_INTERVAL = 4 * 1024 * 1024
+DEFAULT_PARALLEL_DOWNLOADS = 4
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class HttpError(Exception):
+    """Ошибка загрузки по HTTP"""
+
+
+class HttpStatusError(HttpError):
+    """Неожиданный код ответа HTTP"""
+
+    def __init__(self, status_code, url):
+        super().__init__(f"HTTP {status_code}: {url}")
+        self.status_code = status_code
+        self.url = url
+
+
+class DownloadInterrupted(HttpError):
+    """Соединение оборвалось до конца загружаемых данных"""
+
+
+class RateLimitError(HttpStatusError):
+    """Исчерпан лимит запросов к API; retry_after - секунды до повтора"""
+
+    def __init__(self, status_code, url, retry_after):
+        super().__init__(status_code, url)
+        self.retry_after = retry_after
+
+    def __str__(self):
+        return f"превышен лимит запросов GitHub, повтор через {self.retry_after:.0f} с"
+
+
+def get_session(pool_size=16):
+    """Общая для всего приложения сессия с пулом соединений и повторами"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                          allowed_methods=frozenset({'GET', 'HEAD'}))
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.headers['User-Agent'] = USER_AGENT
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+class MetadataCache:
+    """Кэш ответов и заголовков HTTP в JSON-файле"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def get(self, url):
+        with self._lock:
+            return self._entries.get(url)
+
+    def put(self, url, entry):
+        with self._lock:
+            self._entries[url] = entry
+            self._save()
+
+    def _save(self):
+        # Запись через временный файл, чтобы кэш не повредился при сбое
+        write_json(self.path, self._entries)
+
+
+class HttpClient:
+    """Условные запросы к API и загрузка файлов с докачкой"""
+
+    def __init__(self, cache_path, session=None, timeout=DEFAULT_TIMEOUT):
+        self.cache = MetadataCache(cache_path)
+        self.session = session or get_session()
+        self.timeout = timeout
+        # Остаток лимита запросов и время его сброса (Unix time) по последнему ответу API
+        self.rate_limit_remaining = None
+        self.rate_limit_reset = None
+
+    def get_json(self, url, use_cache=True):
+        """Данные JSON по url и признак того, что они изменились с прошлого запроса
+
+        С use_cache=False запрос не условный и ответ не сохраняется в кэше.
+        """
+        cached = self.cache.get(url) if use_cache else None
+        headers = {'Accept': 'application/vnd.github+json'}
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        self._check_rate_limit(response, url)
+        if response.status_code == 304 and cached:
+            return cached['body'], False
+        if response.status_code != 200:
+            raise HttpStatusError(response.status_code, url)
+
+        body = response.json()
+        if not use_cache:
+            return body, True
+        self.cache.put(url, {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'body': body,
+        })
+        return body, True
+
+    def _check_rate_limit(self, response, url):
+        """Учет заголовков лимита запросов; при отказе по лимиту - RateLimitError"""
+        headers = response.headers
+        if 'X-RateLimit-Remaining' in headers:
+            self.rate_limit_remaining = int(headers['X-RateLimit-Remaining'])
+            self.rate_limit_reset = int(headers.get('X-RateLimit-Reset', 0)) or None
+        if response.status_code not in (403, 429):
+            return
+        if 'Retry-After' in headers:
+            raise RateLimitError(response.status_code, url, float(headers['Retry-After']))
+        if self.rate_limit_remaining == 0 and self.rate_limit_reset:
+            raise RateLimitError(response.status_code, url,
+                                 max(0.0, self.rate_limit_reset - time.time()))
+
+    def get_text(self, url):
+        """Небольшой текстовый файл, например список контрольных сумм"""
+        response = self.session.get(url, timeout=self.timeout)
+        if response.status_code != 200:
+            raise HttpStatusError(response.status_code, url)
+        return response.text
+
+    def download(self, url, dest, expected_size=None, expected_sha256=None, progress=None,
+                 check_cancelled=None, max_rate=None, connections=DEFAULT_CONNECTIONS):
+        """Загрузка url в файл dest, возвращает (загружался ли файл, SHA-256)
+
+        Если dest уже существует и совпадает по размеру с expected_size
+        и по хешу с expected_sha256, загрузка пропускается. Данные пишутся
+        в dest.part; если он остался от прерванной загрузки, запрашивается
+        только недостающая часть (Range + If-Range по сохраненному ETag).
+        Файл от SEGMENTED_MIN_SIZE загружается частями по connections
+        соединениям, если сервер поддерживает Range.
+        progress вызывается с числом загруженных байт и общим размером.
+        max_rate ограничивает скорость загрузки (байт/с). При несовпадении
+        SHA-256 файл удаляется и выбрасывается IntegrityError.
+        """
+        if expected_size is not None and os.path.exists(dest) \
+                and os.path.getsize(dest) == expected_size:
+            sha256 = file_sha256(dest, check_cancelled)
+            if expected_sha256 in (None, sha256):
+                return False, sha256
+            os.remove(dest)
+
+        part_path = f"{dest}.part"
+        # Остаток обычной загрузки продолжается обычной, загрузки частями - частями
+        if connections > 1 and expected_size and expected_size >= SEGMENTED_MIN_SIZE and \
+                (os.path.exists(f"{part_path}.json") or not os.path.exists(part_path)):
+            sha256 = self._download_segmented(url, part_path, expected_size, connections,
+                                              progress, check_cancelled, max_rate)
+            if sha256 is not None:
+                return self._finish_download(part_path, dest, sha256, expected_sha256)
+
+        cached = self.cache.get(url) or {}
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {}
+        if offset and cached.get('etag'):
+            headers['Range'] = f"bytes={offset}-"
+            headers['If-Range'] = cached['etag']
+        elif offset:
+            offset = 0
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416 and offset == expected_size:
+                # Предыдущая загрузка завершилась, но не была переименована
+                return self._finish_download(part_path, dest, file_sha256(part_path), expected_sha256)
+            if response.status_code == 416 or \
+                    (response.status_code == 206 and _range_start(response) != offset):
+                # Остаток .part не соответствует файлу на сервере - загружаем заново
+                os.remove(part_path)
+                return self.download(url, dest, expected_size, expected_sha256, progress,
+                                     check_cancelled, max_rate)
+            if response.status_code == 206:
+                mode = 'ab'
+            elif response.status_code == 200:
+                mode, offset = 'wb', 0
+            else:
+                raise HttpStatusError(response.status_code, url)
+
+            etag = response.headers.get('ETag')
+            if etag:
+                self.cache.put(url, {'etag': etag})
+            total_size = expected_size or offset + int(response.headers.get('content-length', 0))
+
+            # При докачке хеш уже загруженной части считается один раз перед продолжением
+            sha256 = hashlib.sha256()
+            if offset:
+                with open(part_path, 'rb') as f:
+                    for block in iter(lambda: f.read(CHUNK_SIZE * 16), b''):
+                        sha256.update(block)
+
+            downloaded = offset
+            started = time.monotonic()
+            with open(part_path, mode) as f:
+                for data in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if check_cancelled:
+                        check_cancelled()
+                    f.write(data)
+                    sha256.update(data)
+                    downloaded += len(data)
+                    if progress:
+                        progress(downloaded, total_size)
+                    if max_rate:
+                        # Пауза, пока средняя скорость не опустится до max_rate
+                        delay = (downloaded - offset) / max_rate - (time.monotonic() - started)
+                        if delay > 0:
+                            time.sleep(delay)
+
+        if expected_size is not None and downloaded != expected_size:
+            raise HttpError(f"Загрузка прервана: получено {downloaded} из {expected_size} байт")
+        return self._finish_download(part_path, dest, sha256.hexdigest(), expected_sha256)
+
+    def download_many(self, items, progress=None, check_cancelled=None, max_rate=None,
+                      max_workers=DEFAULT_PARALLEL_DOWNLOADS):
+        """Одновременная загрузка нескольких файлов с общим прогрессом
+
+        items - список (url, dest, expected_size, expected_sha256). progress
+        вызывается с суммарным числом загруженных байт и общим объемом,
+        max_rate делится между одновременными загрузками поровну. Возвращает
+        результаты download в порядке items. Ошибка одной загрузки
+        останавливает остальные.
+        """
+        if len(items) <= 1:
+            return [self.download(url, dest, size, sha256, progress, check_cancelled, max_rate)
+                    for url, dest, size, sha256 in items]
+
+        workers = min(max_workers, len(items))
+        rate = max_rate / workers if max_rate else None
+        done = [0] * len(items)
+        totals = [size or 0 for _, _, size, _ in items]
+        lock = threading.Lock()
+        failed = threading.Event()
+
+        def check():
+            if failed.is_set():
+                raise DownloadInterrupted("Загрузка остановлена из-за ошибки другого файла")
+            if check_cancelled:
+                check_cancelled()
+
+        def report(index, value, total):
+            with lock:
+                done[index] = value
+                totals[index] = total or totals[index]
+                if progress:
+                    progress(sum(done), sum(totals))
+
+        results = [None] * len(items)
+        error = None
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download") as pool:
+            futures = {
+                pool.submit(self.download, url, dest, size, sha256,
+                            lambda value, total, index=index: report(index, value, total),
+                            check, rate): index
+                for index, (url, dest, size, sha256) in enumerate(items)
+            }
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except BaseException as e:
+                    # Первая ошибка - причина, остальные загрузки ею остановлены
+                    if error is None:
+                        error = e
+                        failed.set()
+        if error is not None:
+            raise error
+        return results
+
+    def _download_segmented(self, url, part_path, size, connections, progress, check_cancelled,
+                            max_rate, restarted=False):
+        """Параллельная загрузка частями в заранее выделенный файл
+
+        Возвращает SHA-256 файла или None, если сервер не поддерживает
+        запросы Range: тогда файл загружается одним соединением. Если файл
+        на сервере изменился во время загрузки (If-Range не совпал),
+        загрузка один раз начинается заново.
+        """
+        state_path = f"{part_path}.json"
+        response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+        etag = response.headers.get('ETag')
+        if response.status_code != 200 or response.headers.get('Accept-Ranges') != 'bytes' \
+                or response.headers.get('Content-Length') != str(size) or not etag:
+            for path in (part_path, state_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return None
+
+        state = _load_state(state_path)
+        if state is None or state.get('etag') != etag or state.get('size') != size \
+                or not os.path.exists(part_path):
+            segment_size = max(MIN_SEGMENT_SIZE, -(-size // connections))
+            # Часть: [начало, конец (не включая), загружено до]
+            state = {'etag': etag, 'size': size,
+                     'segments': [[start, min(start + segment_size, size), start]
+                                  for start in range(0, size, segment_size)]}
+            # Состояние записывается до создания .part: файл .part без
+            # состояния был бы принят за остаток загрузки одним соединением
+            write_json(state_path, state)
+            _preallocate(part_path, size)
+        segments = state['segments']
+
+        lock = threading.Lock()
+        failed = threading.Event()
+        initial = sum(position - start for start, _, position in segments)
+        counters = {'done': initial, 'saved': initial}
+        started = time.monotonic()
+
+        def on_data(length):
+            with lock:
+                counters['done'] += length
+                downloaded = counters['done']
+                if downloaded - counters['saved'] >= STATE_SAVE_INTERVAL:
+                    # Сначала данные, затем состояние, которое на них ссылается
+                    os.fsync(fd)
+                    write_json(state_path, state)
+                    counters['saved'] = downloaded
+                if progress:
+                    progress(downloaded, size)
+            if max_rate:
+                delay = (downloaded - initial) / max_rate - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+        def check():
+            if failed.is_set():
+                raise DownloadInterrupted("Загрузка остановлена из-за ошибки другой части")
+            if check_cancelled:
+                check_cancelled()
+
+        fd = os.open(part_path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+        error = None
+        try:
+            with ThreadPoolExecutor(max_workers=len(segments),
+                                    thread_name_prefix="segment") as pool:
+                futures = [pool.submit(self._fetch_segment, url, fd, segment, etag, on_data,
+                                       check)
+                           for segment in segments if segment[2] < segment[1]]
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except BaseException as e:
+                        if error is None:
+                            error = e
+                            failed.set()
+        finally:
+            os.close(fd)
+            if error is None:
+                if os.path.exists(state_path):
+                    os.remove(state_path)
+            elif isinstance(error, HttpStatusError) and error.status_code == 200:
+                # Файл на сервере изменился: загруженные части не годятся
+                os.remove(part_path)
+                if os.path.exists(state_path):
+                    os.remove(state_path)
+            else:
+                write_json(state_path, state)
+        if isinstance(error, HttpStatusError) and error.status_code == 200:
+            if restarted:
+                # Сервер снова не продолжил часть: загрузка одним соединением
+                return None
+            return self._download_segmented(url, part_path, size, connections, progress,
+                                            check_cancelled, max_rate, restarted=True)
+        if error is not None:
+            raise error
+        return file_sha256(part_path, check_cancelled)
+
+    def _fetch_segment(self, url, fd, segment, etag, on_data, check):
+        """Загрузка одной части с повтором с места обрыва соединения"""
+        for attempt in range(SEGMENT_RETRIES + 1):
+            start, end, position = segment
+            headers = {'Range': f"bytes={position}-{end - 1}", 'If-Range': etag}
+            try:
+                with self.session.get(url, headers=headers, stream=True,
+                                      timeout=self.timeout) as response:
+                    if response.status_code != 206 or _range_start(response) != position:
+                        raise HttpStatusError(response.status_code, url)
+                    for data in response.iter_content(chunk_size=CHUNK_SIZE):
+                        check()
+                        data = data[:end - position]
+                        _pwrite(fd, data, position)
+                        position += len(data)
+                        segment[2] = position
+                        on_data(len(data))
+                if position < end:
+                    raise DownloadInterrupted(f"Соединение оборвалось на {position} из {end} байт")
+                return
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    DownloadInterrupted):
+                check()
+                if attempt == SEGMENT_RETRIES:
+                    raise
+
+    def _finish_download(self, part_path, dest, sha256, expected_sha256):
+        if expected_sha256 is not None and sha256 != expected_sha256:
+            os.remove(part_path)
+            raise IntegrityError(f"Контрольная сумма {os.path.basename(dest)} не совпадает "
+                                 "с опубликованной, файл удален")
+        os.replace(part_path, dest)
+        return True, sha256
+
+
+def _preallocate(path, size):
+    """Файл размером size; место на диске по возможности резервируется сразу"""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, size)
+                return
+            except OSError:
+                pass
+        os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+_seek_lock = threading.Lock()
+
+
+def _pwrite(fd, data, offset):
+    """Запись по смещению; без os.pwrite (Windows) - через seek под блокировкой"""
+    if hasattr(os, 'pwrite'):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+        return
+    with _seek_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+
+
+def _load_state(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _range_start(response):
+    """Начальное смещение из заголовка Content-Range: bytes <start>-<end>/<size>"""
+    try:
+        return int(response.headers['Content-Range'].split()[1].split('-')[0])
+    except (KeyError, IndexError, ValueError):
+        return None
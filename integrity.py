@@ -0,0 +1,205 @@
+"""Проверка целостности загруженных релизов
+
+Ожидаемый SHA-256 архива берется из поля digest ассета GitHub или из
+опубликованного вместе с релизом файла контрольных сумм (<архив>.sha256,
+SHA256SUMS). Проверенные файлы хранилища записываются в общий для всех
+версий журнал releases/blobs/verified.json вместе с размером и временем
+изменения: пока они не изменились, повторное хеширование перед установкой
+не требуется.
+"""
+
+import os
+import json
+import zlib
+import hashlib
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from jsonfile import write_json
+
+VERIFIED_NAME = "verified.json"
+CHECKSUM_ASSETS = ("SHA256SUMS", "SHA256SUMS.txt", "checksums.txt")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class IntegrityError(Exception):
+    """Файл не прошел проверку целостности"""
+
+
+def file_sha256(path, check_cancelled=None):
+    """SHA-256 файла на диске"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            if check_cancelled:
+                check_cancelled()
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def parse_checksum(text, filename):
+    """SHA-256 для filename из текста в формате sha256sum
+
+    Файл из одной строки с единственным хешем считается относящимся
+    к filename.
+    """
+    lines = [line.split() for line in text.splitlines() if line.strip()]
+    for parts in lines:
+        if len(parts) >= 2 and parts[-1].lstrip('*') == filename:
+            return parts[0].lower()
+    if len(lines) == 1 and len(lines[0]) == 1:
+        return lines[0][0].lower()
+    return None
+
+
+def expected_checksum(asset, assets, fetch_text):
+    """Опубликованный SHA-256 ассета или None, если релиз его не содержит
+
+    fetch_text(url) загружает небольшой текстовый ассет с контрольными суммами.
+    """
+    digest = asset.get('digest') or ''
+    if digest.startswith('sha256:'):
+        return digest.split(':', 1)[1].lower()
+
+    by_name = {a['name']: a for a in assets}
+    for name in (f"{asset['name']}.sha256", *CHECKSUM_ASSETS):
+        if name in by_name:
+            checksum = parse_checksum(fetch_text(by_name[name]['browser_download_url']),
+                                      asset['name'])
+            if checksum:
+                return checksum
+    return None
+
+
+def check_archive_members(zip_path, max_workers=4, check_cancelled=None):
+    """Проверка CRC всех файлов архива в несколько потоков
+
+    Распаковка и CRC32 в zlib отпускают GIL, поэтому большие архивы
+    проверяются параллельно. Каждый поток открывает архив отдельно.
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        members = sorted((info for info in archive.infolist() if not info.is_dir()),
+                         key=lambda info: info.file_size, reverse=True)
+    if not members:
+        return
+
+    # Раскладываем файлы по потокам жадно по размеру
+    groups = [[] for _ in range(max(1, min(max_workers, len(members))))]
+    loads = [0] * len(groups)
+    for info in members:
+        i = loads.index(min(loads))
+        groups[i].append(info)
+        loads[i] += info.file_size
+
+    def check_group(group):
+        with zipfile.ZipFile(zip_path) as archive:
+            for info in group:
+                crc = 0
+                with archive.open(info) as stream:
+                    for block in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+                        if check_cancelled:
+                            check_cancelled()
+                        crc = zlib.crc32(block, crc)
+                if crc != info.CRC:
+                    raise IntegrityError(f"Поврежден файл {info.filename} в архиве")
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+            for future in [pool.submit(check_group, group) for group in groups]:
+                future.result()
+    except zipfile.BadZipFile as e:
+        raise IntegrityError(f"Архив поврежден: {e}")
+
+
+class VerifiedFiles:
+    """Журнал проверенных файлов каталога релиза
+
+    С autosave=False изменения сохраняются только вызовом save: так при
+    проверке или записи многих файлов журнал читается и пишется один раз.
+    """
+
+    def __init__(self, directory, autosave=True):
+        self.path = os.path.join(directory, VERIFIED_NAME)
+        self.autosave = autosave
+        self._dirty = False
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def recorded_sha256(self, path):
+        """SHA-256, записанный при последней проверке файла"""
+        with self._lock:
+            return self._entries.get(os.path.basename(path), {}).get('sha256')
+
+    def sha256(self, path):
+        """SHA-256 файла, если он проверен и не изменялся с момента проверки"""
+        with self._lock:
+            entry = self._entries.get(os.path.basename(path))
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_size != entry['size'] or stat.st_mtime_ns != entry['mtime_ns']:
+            return None
+        return entry['sha256']
+
+    def mark(self, path, sha256):
+        stat = os.stat(path)
+        with self._lock:
+            self._entries[os.path.basename(path)] = {
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha256': sha256,
+            }
+            self._changed()
+
+    def forget(self, path):
+        with self._lock:
+            if self._entries.pop(os.path.basename(path), None) is not None:
+                self._changed()
+
+    def save(self):
+        """Сохранение журнала, если он изменился"""
+        with self._lock:
+            if self._dirty:
+                write_json(self.path, self._entries, indent=1)
+                self._dirty = False
+
+    def _changed(self):
+        self._dirty = True
+        if self.autosave:
+            write_json(self.path, self._entries, indent=1)
+            self._dirty = False
+
+
+def ensure_verified(path, expected_sha256=None, check_cancelled=None, verified=None):
+    """Проверка файла релиза перед установкой
+
+    Если журнал подтверждает, что файл не менялся, проверка мгновенная.
+    Иначе файл хешируется заново и сравнивается с ожидаемым (или ранее
+    записанным) SHA-256, а для zip-архива дополнительно проверяются CRC
+    всех входящих файлов. verified - уже открытый журнал каталога файла
+    (VerifiedFiles), чтобы не читать его заново для каждого файла.
+    """
+    if verified is None:
+        verified = VerifiedFiles(os.path.dirname(path))
+    known = verified.sha256(path)
+    if known is not None and expected_sha256 in (None, known):
+        return known
+
+    expected_sha256 = expected_sha256 or verified.recorded_sha256(path)
+
+    sha256 = file_sha256(path, check_cancelled)
+    if expected_sha256 and sha256 != expected_sha256:
+        verified.forget(path)
+        raise IntegrityError(f"Контрольная сумма {os.path.basename(path)} не совпадает")
+    if zipfile.is_zipfile(path):
+        check_archive_members(path, check_cancelled=check_cancelled)
+    verified.mark(path, sha256)
+    return sha256
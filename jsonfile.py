@@ -0,0 +1,37 @@
+"""Атомарная запись файлов данных (индексы, кэши, счетчики)
+
+Файл пишется во временный файл с уникальным именем в том же каталоге
+и заменяет прежний через os.replace, поэтому читатель никогда не видит
+файл наполовину, а несколько процессов и потоков, сохраняющих один файл
+одновременно, не мешают друг другу: побеждает последняя запись.
+"""
+
+import os
+import json
+import tempfile
+
+# Права файлов данных: mkstemp создает файл доступным только владельцу,
+# а, например, updater.prom читает node_exporter от другого пользователя
+FILE_MODE = 0o644
+
+
+def write_text(path, text):
+    """Атомарная запись текста в файл path"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp",
+                                    dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_json(path, data, indent=None):
+    """Атомарная запись данных JSON в файл path"""
+    write_text(path, json.dumps(data, indent=indent))
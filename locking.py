@@ -0,0 +1,87 @@
+"""Блокировка каталога данных между процессами
+
+Несколько копий программы (например, графический интерфейс и фоновая
+загрузка из консоли) могут работать с одним каталогом данных. Загрузка
+релизов выполняется под блокировкой файла, чтобы один и тот же архив не
+загружался дважды и индексы хранилища не перезаписывались одновременно.
+Блокировка снимается операционной системой при завершении процесса.
+"""
+
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+POLL_INTERVAL = 0.1
+
+
+class LockBusy(Exception):
+    """Блокировка удерживается другим процессом или потоком"""
+
+
+class FileLock:
+    """Блокировка файла (flock в Unix, msvcrt.locking в Windows)
+
+    Используется как контекстный менеджер. С blocking=False при занятой
+    блокировке сразу выбрасывается LockBusy, иначе ожидание повторяется
+    до освобождения, с проверкой отмены через check_cancelled.
+
+    По умолчанию блокировка исключительная. С shared=True ее могут
+    одновременно держать несколько читателей, а исключительная ждет, пока
+    они не освободят файл. В Windows разделяемой блокировки нет, и
+    shared=True действует как исключительная.
+
+    Общие для нескольких процессов файлы данных (индексы хранилищ, кэш
+    устройств, счетчики) изменяются под такой блокировкой по одной схеме:
+    файл перечитывается, изменяется и записывается целиком, поэтому
+    процессы не затирают изменения друг друга.
+    """
+
+    def __init__(self, path, blocking=True, check_cancelled=None, shared=False):
+        self.path = path
+        self.blocking = blocking
+        self.shared = shared
+        self.check_cancelled = check_cancelled
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._file = open(self.path, 'a+b')
+        try:
+            while not self._try_lock():
+                if not self.blocking:
+                    raise LockBusy(self.path)
+                if self.check_cancelled:
+                    self.check_cancelled()
+                time.sleep(POLL_INTERVAL)
+        except BaseException:
+            self._file.close()
+            self._file = None
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+        return False
+
+    def _try_lock(self):
+        try:
+            if fcntl is not None:
+                mode = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+                fcntl.flock(self._file.fileno(), mode | fcntl.LOCK_NB)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
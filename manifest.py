@@ -0,0 +1,162 @@
+"""Манифест содержимого релиза и план дифференциального обновления
+
+Манифест хранится в releases/<версия>/manifest.json и содержит для каждого
+файла размер, SHA-256 и CRC32. Для образов прошивки (.bin, .hex) также
+хранятся CRC32 блоков фиксированного размера, чтобы передавать на устройство
+только изменившиеся блоки.
+
+Устройство по команде "hashes" сообщает в том же формате состояние
+установленных файлов; сравнение манифеста с ним дает план обновления.
+"""
+
+import os
+import json
+import zlib
+import hashlib
+
+from jsonfile import write_json
+
+MANIFEST_NAME = "manifest.json"
+BLOCK_SIZE = 4096
+BLOCK_EXTENSIONS = ('.bin', '.hex')
+
+# Поблочная передача выгодна, только если меняется не весь образ
+PATCH_THRESHOLD = 0.5
+
+
+def hash_stream(stream, rel_path, block_size=BLOCK_SIZE):
+    """Описание одного файла для манифеста за один проход чтения"""
+    sha256 = hashlib.sha256()
+    crc = 0
+    size = 0
+    blocks = [] if rel_path.lower().endswith(BLOCK_EXTENSIONS) else None
+    for block in iter(lambda: stream.read(block_size), b''):
+        sha256.update(block)
+        crc = zlib.crc32(block, crc)
+        size += len(block)
+        if blocks is not None:
+            blocks.append(f"{zlib.crc32(block):08x}")
+
+    entry = {'size': size, 'sha256': sha256.hexdigest(), 'crc32': f"{crc:08x}"}
+    if blocks is not None:
+        entry['blocks'] = blocks
+    return entry
+
+
+def build_manifest(source, files, block_size=BLOCK_SIZE, progress=None):
+    """Манифест для файлов [(путь в релизе, размер), ...] из источника релиза
+
+    progress вызывается после каждого файла с числом обработанных байт
+    и общим объемом.
+    """
+    entries = {}
+    total_size = sum(size for _, size in files)
+    done = 0
+    for rel_path, size in files:
+        with source.open(rel_path) as stream:
+            entries[rel_path] = hash_stream(stream, rel_path, block_size)
+        done += size
+        if progress:
+            progress(done, total_size)
+    return {'block_size': block_size, 'files': entries}
+
+
+def load_manifest(release_dir):
+    """Чтение манифеста релиза, None если его нет или он поврежден"""
+    try:
+        with open(os.path.join(release_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(release_dir, manifest):
+    path = os.path.join(release_dir, MANIFEST_NAME)
+    write_json(path, manifest, indent=1)
+    return path
+
+
+class UpdateEntry:
+    """Файл, который нужно передать на устройство
+
+    ranges равен None для передачи файла целиком, иначе это список
+    (смещение, длина) изменившихся участков.
+    """
+
+    def __init__(self, rel_path, size, ranges=None, crc32=None):
+        self.rel_path = rel_path
+        self.size = size
+        self.ranges = ranges
+        self.crc32 = crc32
+
+    @property
+    def transfer_size(self):
+        if self.ranges is None:
+            return self.size
+        return sum(length for _, length in self.ranges)
+
+
+class UpdatePlan:
+    """Список файлов и участков, которые отличаются на устройстве"""
+
+    def __init__(self, entries, total_files, total_size):
+        self.entries = entries
+        self.total_files = total_files
+        self.total_size = total_size
+
+    @property
+    def transfer_size(self):
+        return sum(entry.transfer_size for entry in self.entries)
+
+    def __str__(self):
+        return (f"изменено файлов: {len(self.entries)} из {self.total_files}, "
+                f"к передаче {self.transfer_size} из {self.total_size} байт")
+
+
+def changed_ranges(new_blocks, old_blocks, size, block_size):
+    """Участки файла, блоки которых отличаются; соседние блоки объединяются"""
+    ranges = []
+    for i, block_crc in enumerate(new_blocks):
+        if i < len(old_blocks) and old_blocks[i] == block_crc:
+            continue
+        offset = i * block_size
+        length = min(block_size, size - offset)
+        if ranges and ranges[-1][0] + ranges[-1][1] == offset:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+        else:
+            ranges.append((offset, length))
+    return ranges
+
+
+def plan_update(files, manifest=None, device_state=None):
+    """План обновления: какие файлы и участки передавать на устройство
+
+    Без манифеста или без ответа устройства передаются все файлы целиком.
+    Файлы с совпадающим SHA-256 пропускаются, у образов прошивки при
+    совпадающем размере блока передаются только изменившиеся блоки.
+    """
+    entries = []
+    total_size = 0
+    device_files = (device_state or {}).get('files', {})
+    same_blocks = manifest is not None and device_state is not None and \
+        device_state.get('block_size') == manifest['block_size']
+
+    for rel_path, size in files:
+        total_size += size
+        info = manifest['files'].get(rel_path) if manifest else None
+        if info is None:
+            entries.append(UpdateEntry(rel_path, size))
+            continue
+
+        current = device_files.get(rel_path)
+        if current is not None and current.get('sha256') == info['sha256']:
+            continue
+
+        entry = UpdateEntry(rel_path, size, crc32=int(info['crc32'], 16))
+        if same_blocks and current is not None and 'blocks' in info and 'blocks' in current:
+            ranges = changed_ranges(info['blocks'], current['blocks'], size, manifest['block_size'])
+            if sum(length for _, length in ranges) < size * PATCH_THRESHOLD:
+                entry.ranges = ranges
+        entries.append(entry)
+
+    return UpdatePlan(entries, len(files), total_size)
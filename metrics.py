@@ -0,0 +1,277 @@
+"""Время этапов обновления, счетчики и их выгрузка
+
+Каждый этап (запрос к API, загрузка, проверка хешей, перенос в хранилище,
+резервная копия, сравнение файлов на устройстве, передача) измеряется
+и записывается в журнал событий metrics/events.jsonl - по одному объекту
+JSON в строке. Туда же попадают итоги операций, в том числе ошибки.
+
+Счетчики (байты и время HTTP и последовательного порта, кадры и повторы
+по портам, число и длительность этапов) накапливаются в metrics.json
+между запусками и выгружаются в текстовом формате Prometheus в
+updater.prom - его может читать textfile collector node_exporter.
+При выгрузке к сохраненным счетчикам прибавляются приращения этого
+процесса с прошлой выгрузки, а не записываются его итоговые значения.
+
+Сглаженная длительность этапов используется как вес этапа в общем
+прогрессе операции вместо фиксированного деления шкалы.
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+from errors import OperationCancelled
+from jsonfile import write_json, write_text
+from locking import FileLock
+
+STATE_NAME = "metrics.json"
+LOCK_NAME = ".lock"
+EVENTS_NAME = "events.jsonl"
+PROMETHEUS_NAME = "updater.prom"
+# Журнал событий больше этого размера переименовывается в events.jsonl.1
+MAX_EVENTS_SIZE = 10 * 1024 * 1024
+
+# Коэффициент сглаживания средней длительности этапа
+SMOOTHING = 0.3
+# Длительность этапов, с, пока они ни разу не измерены
+DEFAULT_PHASE_SECONDS = {
+    'api': 0.5,
+    'download': 5.0,
+    'hash': 1.0,
+    'extract': 2.0,
+    'backup': 3.0,
+    'device_verify': 0.5,
+    'transfer': 20.0,
+}
+
+HELP = {
+    'updater_phase_seconds_total': "Суммарная длительность этапа, с",
+    'updater_phase_runs_total': "Число выполнений этапа",
+    'updater_phase_last_seconds': "Длительность последнего выполнения этапа, с",
+    'updater_operations_total': "Операции по результату",
+    'updater_http_bytes_total': "Загружено по HTTP, байт",
+    'updater_http_seconds_total': "Время загрузки по HTTP, с",
+    'updater_serial_payload_bytes_total': "Передано данных файлов по порту, байт",
+    'updater_serial_wire_bytes_total': "Передано по линии с заголовками и повторами, байт",
+    'updater_serial_seconds_total': "Время передачи по порту, с",
+    'updater_serial_frames_total': "Передано кадров",
+    'updater_serial_retransmits_total': "Повторно переданных кадров",
+}
+
+GAUGES = {'updater_phase_last_seconds'}
+
+
+def _series(name, labels):
+    """Имя временного ряда Prometheus с метками"""
+    labels = {key: value for key, value in labels.items() if value is not None}
+    if not labels:
+        return name
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return name + "{" + ",".join(f'{key}="{value}"'
+                                  for key, value in zip(labels, escaped)) + "}"
+
+
+class ProgressPlan:
+    """Деление шкалы прогресса операции между этапами по их длительности"""
+
+    def __init__(self, operation, weights):
+        self.operation = operation
+        total = sum(weights.values()) or 1
+        self.ranges = {}
+        start = 0
+        for index, (phase, weight) in enumerate(weights.items()):
+            end = 100 if index == len(weights) - 1 else start + round(weight * 100 / total)
+            self.ranges[phase] = (start, end - start)
+            start = end
+
+    def report(self, phase, done, total):
+        self.operation.report_fraction(done, total, *self.ranges[phase])
+
+    def callback(self, phase):
+        """Функция прогресса (done, total) для этапа phase"""
+        return lambda done, total: self.report(phase, done, total)
+
+    def finish(self, phase):
+        self.report(phase, 1, 1)
+
+
+class Metrics:
+    """Таймеры этапов, счетчики и журнал событий в каталоге path"""
+
+    def __init__(self, path):
+        self.path = path
+        self.state_path = os.path.join(path, STATE_NAME)
+        self.events_path = os.path.join(path, EVENTS_NAME)
+        self.prometheus_path = os.path.join(path, PROMETHEUS_NAME)
+        self.lock_path = os.path.join(path, LOCK_NAME)
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        state = self._load()
+        self._counters = state['counters']
+        self._durations = state['durations']
+        # Изменения с последней выгрузки: приращения счетчиков, значения
+        # показателей (gauge) и уточненные длительности этапов
+        self._deltas = {}
+        self._values = {}
+        self._measured = set()
+
+    def add(self, name, value=1, **labels):
+        """Увеличение счетчика name с метками labels"""
+        key = _series(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._deltas[key] = self._deltas.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = _series(name, labels)
+        with self._lock:
+            self._counters[key] = value
+            self._values[key] = value
+
+    def event(self, kind, **fields):
+        """Запись события в журнал"""
+        record = {'time': round(time.time(), 3), 'event': kind}
+        record.update((key, value) for key, value in fields.items() if value is not None)
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            try:
+                if os.path.getsize(self.events_path) > MAX_EVENTS_SIZE:
+                    os.replace(self.events_path, f"{self.events_path}.1")
+            except OSError:
+                pass
+            with open(self.events_path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+    @contextmanager
+    def phase(self, name, port=None, **fields):
+        """Измерение этапа name; успешные измерения уточняют его вес в прогрессе"""
+        started = time.perf_counter()
+        result = 'ok'
+        try:
+            yield
+        except OperationCancelled:
+            result = 'cancelled'
+            raise
+        except Exception:
+            result = 'error'
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            self.add('updater_phase_seconds_total', seconds, phase=name)
+            self.add('updater_phase_runs_total', phase=name)
+            self.set('updater_phase_last_seconds', seconds, phase=name)
+            if result == 'ok':
+                with self._lock:
+                    previous = self._durations.get(name)
+                    self._durations[name] = seconds if previous is None else \
+                        previous + SMOOTHING * (seconds - previous)
+                    self._measured.add(name)
+            self.event('phase', phase=name, port=port, seconds=round(seconds, 4),
+                       result=result, **fields)
+
+    @contextmanager
+    def operation(self, name, port=None):
+        """Итог операции в журнале и выгрузка счетчиков по ее завершении"""
+        started = time.perf_counter()
+        result, error = 'ok', None
+        try:
+            yield
+        except OperationCancelled:
+            result = 'cancelled'
+            raise
+        except Exception as e:
+            result, error = 'error', str(e)
+            raise
+        finally:
+            self.add('updater_operations_total', operation=name, result=result)
+            self.event('operation', operation=name, port=port, result=result, error=error,
+                       seconds=round(time.perf_counter() - started, 4))
+            self.flush()
+
+    def record_download(self, size, seconds):
+        self.add('updater_http_bytes_total', size)
+        self.add('updater_http_seconds_total', seconds)
+        self.event('download', bytes=size, seconds=round(seconds, 4),
+                   throughput=round(size / seconds) if seconds else None)
+
+    def record_transfer(self, port, stats, direction='send'):
+        """Счетчики передачи по порту из TransferStats"""
+        self.add('updater_serial_payload_bytes_total', stats.payload_bytes, port=port)
+        self.add('updater_serial_wire_bytes_total', stats.wire_bytes, port=port)
+        self.add('updater_serial_seconds_total', stats.elapsed, port=port)
+        self.add('updater_serial_frames_total', stats.frames, port=port)
+        self.add('updater_serial_retransmits_total', stats.retransmits, port=port)
+        self.event('transfer', port=port, direction=direction, bytes=stats.payload_bytes,
+                   wire_bytes=stats.wire_bytes, seconds=round(stats.elapsed, 4),
+                   throughput=round(stats.throughput), retransmits=stats.retransmits)
+
+    def weights(self, phases):
+        """Веса этапов для ProgressPlan: сглаженные измеренные длительности"""
+        with self._lock:
+            return {phase: self._durations.get(phase, DEFAULT_PHASE_SECONDS.get(phase, 1.0))
+                    for phase in phases}
+
+    def plan(self, operation, phases):
+        return ProgressPlan(operation, self.weights(phases))
+
+    def flush(self):
+        """Сохранение счетчиков и выгрузка в формате Prometheus
+
+        Приращения этого процесса прибавляются к сохраненным счетчикам,
+        поэтому счетчики не уменьшаются при работе нескольких процессов.
+        """
+        with self._lock:
+            deltas, values = self._deltas, self._values
+            durations = {name: self._durations[name] for name in self._measured}
+            self._deltas, self._values, self._measured = {}, {}, set()
+        try:
+            with FileLock(self.lock_path):
+                state = self._load()
+                counters = state['counters']
+                for key, value in deltas.items():
+                    counters[key] = counters.get(key, 0) + value
+                counters.update(values)
+                state['durations'].update(durations)
+                # Через временный файл: node_exporter не должен прочитать файл наполовину
+                write_json(self.state_path, state, indent=1)
+                write_text(self.prometheus_path, self.prometheus_text(counters))
+        except BaseException:
+            # Несохраненные изменения войдут в следующую выгрузку
+            with self._lock:
+                for key, value in deltas.items():
+                    self._deltas[key] = self._deltas.get(key, 0) + value
+                for key, value in values.items():
+                    self._values.setdefault(key, value)
+                self._measured.update(durations)
+            raise
+        with self._lock:
+            # Изменения, сделанные во время выгрузки, остаются поверх сохраненных
+            for key, value in self._deltas.items():
+                counters[key] = counters.get(key, 0) + value
+            counters.update(self._values)
+            state['durations'].update((name, self._durations[name]) for name in self._measured)
+            self._counters = counters
+            self._durations = state['durations']
+
+    def _load(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+            return {'counters': dict(state['counters']), 'durations': dict(state['durations'])}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {'counters': {}, 'durations': {}}
+
+    def prometheus_text(self, counters=None):
+        if counters is None:
+            with self._lock:
+                counters = dict(self._counters)
+        lines = []
+        for name in sorted({key.split('{')[0] for key in counters}):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {'gauge' if name in GAUGES else 'counter'}")
+            for key in sorted(k for k in counters if k.split('{')[0] == name):
+                lines.append(f"{key} {counters[key]}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,122 @@
+"""Фоновая загрузка новых релизов до того, как оператор нажмет "Установить"
+
+Prefetcher периодически проверяет каталог релизов и заранее загружает,
+проверяет и переносит в хранилище новейшую версию, так что проверка
+обновлений находит ее уже готовой и установка начинается сразу.
+
+Период проверки случайно смещается (jitter), чтобы станции, запущенные
+одновременно, не обращались к GitHub в одну и ту же секунду. Скорость
+загрузки ограничивается, чтобы не занимать канал. При исчерпании лимита
+запросов GitHub следующая проверка откладывается до его сброса. Если
+релиз уже загружает другая копия программы с тем же каталогом данных или
+идет установка на устройства, проверка пропускается.
+"""
+
+import time
+import random
+import threading
+
+from core import Operation, describe_error
+from errors import OperationCancelled
+
+DEFAULT_INTERVAL = 3600
+DEFAULT_JITTER = 0.1
+# Повтор после сетевой ошибки: от ERROR_DELAY, вдвое дольше с каждой ошибкой
+ERROR_DELAY = 60
+# Запас запросов к API, который фоновая загрузка оставляет интерактивным проверкам
+MIN_RATE_LIMIT = 5
+
+
+class Prefetcher:
+    """Периодическая загрузка новейшего релиза в хранилище
+
+    on_staged(Release) вызывается после того, как релиз готов к установке,
+    on_status(str) - с сообщениями о ходе загрузки. Обратные вызовы
+    выполняются в потоке run().
+    """
+
+    def __init__(self, core, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER, max_rate=None,
+                 on_staged=None, on_status=None):
+        self.core = core
+        self.interval = interval
+        self.jitter = jitter
+        self.max_rate = max_rate
+        self.on_staged = on_staged or (lambda release: None)
+        self.on_status = on_status or (lambda message: None)
+        self.staged_version = None
+        self._errors = 0
+        self._paused = False
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+
+    def pause(self):
+        """Приостановка проверок (текущая загрузка завершается)"""
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+        self._wake_event.set()
+
+    def stop(self):
+        """Остановка, в том числе прерывание идущей загрузки"""
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def check_cancelled(self):
+        if self._stop_event.is_set():
+            raise OperationCancelled()
+
+    def run_once(self):
+        """Одна проверка; возвращает загруженный Release или None
+
+        None означает, что хранилище релизов занято: релиз загружает другой
+        процесс или идет установка на устройства.
+        """
+        from locking import LockBusy
+
+        operation = Operation(status=self.on_status, check_cancelled=self.check_cancelled)
+        try:
+            release = self.core.fetch_release(operation, max_rate=self.max_rate, blocking=False)
+        except LockBusy:
+            self.on_status("Хранилище релизов занято другой загрузкой или установкой")
+            return None
+        if release.version != self.staged_version:
+            self.staged_version = release.version
+            self.on_staged(release)
+        return release
+
+    def next_delay(self):
+        """Пауза до следующей проверки с учетом смещения и лимита запросов"""
+        delay = self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+        http = self.core.http
+        if http.rate_limit_remaining is not None and http.rate_limit_remaining < MIN_RATE_LIMIT \
+                and http.rate_limit_reset:
+            delay = max(delay, http.rate_limit_reset - time.time())
+        return delay
+
+    def run(self, should_stop=None):
+        """Цикл проверок до вызова stop() или should_stop()"""
+        from http_client import RateLimitError
+
+        while not self._stop_event.is_set() and not (should_stop and should_stop()):
+            if self._paused:
+                self._wake_event.wait(self.interval)
+                self._wake_event.clear()
+                continue
+
+            try:
+                self.run_once()
+                self._errors = 0
+                delay = self.next_delay()
+            except OperationCancelled:
+                break
+            except RateLimitError as e:
+                self.on_status(f"Фоновая загрузка отложена: {e}")
+                delay = max(e.retry_after, 1)
+            except Exception as e:
+                self.on_status(f"Ошибка фоновой загрузки: {describe_error(e)}")
+                delay = min(self.interval, ERROR_DELAY * 2 ** self._errors)
+                self._errors += 1
+
+            self._wake_event.wait(delay)
+            self._wake_event.clear()
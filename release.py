@@ -0,0 +1,140 @@
+"""Файлы релиза: распакованный каталог, zip-архив без распаковки
+или хранилище релизов
+
+Источник релиза предоставляет список файлов [(путь в релизе, размер), ...]
+и открытие файла на чтение потоком. Для архива список строится по
+центральному каталогу zip, а файлы читаются прямо из архива буферами
+ограниченного размера, поэтому расход памяти и диска не зависит от объема
+релиза. Для хранилища список берется из манифеста версии.
+
+Релиз может состоять из архивов для разных плат (см. boards.py): тогда
+for_board выбирает файлы для платы конкретного устройства.
+"""
+
+import os
+import zipfile
+import threading
+
+from errors import UpdateError
+
+
+class DirectorySource:
+    """Релиз, распакованный в каталог"""
+
+    def __init__(self, directory, exclude=()):
+        self.directory = directory
+        self.exclude = set(exclude)
+
+    def list_files(self):
+        files = []
+        for root, dirs, filenames in os.walk(self.directory):
+            for filename in filenames:
+                file_path = os.path.join(root, filename)
+                rel_path = os.path.relpath(file_path, self.directory).replace(os.sep, '/')
+                if rel_path not in self.exclude:
+                    files.append((rel_path, os.path.getsize(file_path)))
+        return files
+
+    def open(self, rel_path):
+        return open(os.path.join(self.directory, *rel_path.split('/')), 'rb')
+
+    def __str__(self):
+        return self.directory
+
+
+class ArchiveSource:
+    """Релиз, читаемый напрямую из zip-архива
+
+    Каждый поток открывает архив один раз и дальше использует свой
+    экземпляр ZipFile, поэтому параллельные установки не мешают друг другу.
+    """
+
+    def __init__(self, zip_path):
+        self.zip_path = zip_path
+        self._local = threading.local()
+
+    def _archive(self):
+        archive = getattr(self._local, 'archive', None)
+        if archive is None:
+            archive = self._local.archive = zipfile.ZipFile(self.zip_path, 'r')
+        return archive
+
+    def list_files(self):
+        """Список файлов по центральному каталогу архива"""
+        return [(info.filename, info.file_size)
+                for info in self._archive().infolist() if not info.is_dir()]
+
+    def open(self, rel_path):
+        return self._archive().open(rel_path, 'r')
+
+    def close(self):
+        """Закрытие архива, открытого текущим потоком"""
+        archive = getattr(self._local, 'archive', None)
+        if archive is not None:
+            archive.close()
+            self._local.archive = None
+
+    def __str__(self):
+        return self.zip_path
+
+
+class BlobSource:
+    """Релиз из хранилища: файлы находятся по SHA-256 из манифеста версии"""
+
+    def __init__(self, store, directory, manifest):
+        self.store = store
+        self.directory = directory
+        self.manifest = manifest
+
+    def list_files(self):
+        return [(rel_path, info['size']) for rel_path, info in self.manifest['files'].items()]
+
+    def open(self, rel_path):
+        return open(self.store.blob_path(self.manifest['files'][rel_path]['sha256']), 'rb')
+
+    def __str__(self):
+        return self.directory
+
+
+class Release:
+    """Загруженный релиз: версия, источник файлов, их манифест и хранилище
+
+    bundles - релизы из архивов для отдельных плат {плата: Release}. Если
+    общего архива в релизе нет, source равен None, а files пуст.
+    """
+
+    def __init__(self, version, directory, source, files, manifest=None, store=None, board=None,
+                 bundles=None):
+        self.version = version
+        self.directory = directory
+        self.source = source
+        self.files = files
+        self.manifest = manifest
+        self.store = store
+        self.board = board
+        self.bundles = bundles or {}
+
+    def for_board(self, board):
+        """Релиз для платы board: ее собственный архив или общий"""
+        bundle = self.bundles.get(board)
+        if bundle is not None:
+            return bundle
+        if self.source is None:
+            raise UpdateError(f"В релизе {self.version} нет архива для платы "
+                              f"{board or 'без идентификатора USB'}")
+        return self
+
+    def parts(self):
+        """Загруженные архивы релиза: общий (если есть) и архивы плат"""
+        return ([self] if self.source is not None else []) + list(self.bundles.values())
+
+    def verify(self, check_cancelled=None):
+        """Проверка файлов релиза перед прошивкой (мгновенная, если они не менялись)"""
+        if self.store is not None and self.manifest is not None:
+            self.store.verify(self.manifest, check_cancelled)
+        for bundle in self.bundles.values():
+            bundle.verify(check_cancelled)
+
+    @property
+    def total_size(self):
+        return sum(size for _, size in self.files)
@@ -0,0 +1,283 @@
+"""Хранилище релизов с адресацией по содержимому
+
+Каждый уникальный файл релизов хранится один раз в releases/blobs/<sha256>,
+а каталог releases/<версия>/ содержит только manifest.json со ссылками на
+него (SHA-256 каждого файла). Файлы, не изменившиеся между версиями, на
+диске не дублируются. При необходимости дерево файлов версии собирается
+в ее каталоге из копий при записи (reflink) или жестких ссылок на файлы
+хранилища, не занимая места.
+
+releases/index.json - индекс версий: имя и SHA-256 архива, число и объем
+файлов, время последнего использования. Поиск версии - обращение к словарю,
+без обхода каталогов. Старые версии вытесняются по давности использования,
+кроме защищенных (установленных на устройствах и целей отката).
+
+Архив релиза для отдельной платы хранится как версия с ее именем в
+метаданных сборки (2.0.0+uno, см. release_key); при вытеснении архивы
+одной версии для разных плат считаются одной версией.
+"""
+
+import os
+import json
+import time
+import shutil
+import threading
+
+from semantic_version import Version
+
+from integrity import IntegrityError, VerifiedFiles, ensure_verified
+from jsonfile import write_json
+from manifest import BLOCK_SIZE, hash_stream, load_manifest, save_manifest
+
+INDEX_NAME = "index.json"
+BLOBS_DIR = "blobs"
+DEFAULT_KEEP = 3
+
+# ioctl FICLONE (Linux): копия файла с общими блоками на Btrfs, XFS и др.
+FICLONE = 0x40049409
+
+
+def release_key(version, board=None):
+    """Ключ хранилища для архива версии: общего или для платы board"""
+    if board is None:
+        return str(version)
+    separator = '.' if Version(str(version)).build else '+'
+    return f"{version}{separator}{board}"
+
+
+def base_version(key):
+    """Версия без метаданных сборки, то есть без платы"""
+    return str(Version(str(key)).truncate('prerelease'))
+
+
+def link_or_copy(src, dst):
+    """Файл dst с содержимым src без расхода места, если это возможно
+
+    Сначала пробуется reflink (изменение копии не затронет хранилище),
+    затем жесткая ссылка, в крайнем случае обычное копирование.
+    """
+    try:
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return
+    except (ImportError, OSError):
+        if os.path.exists(dst):
+            os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class _TeeReader:
+    """Поток, копирующий прочитанные данные в файл"""
+
+    def __init__(self, stream, out):
+        self.stream = stream
+        self.out = out
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.out.write(data)
+        return data
+
+
+class ReleaseStore:
+    """Версии релизов и общие для них файлы"""
+
+    def __init__(self, root):
+        self.root = root
+        self.blobs_dir = os.path.join(root, BLOBS_DIR)
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self._lock = threading.Lock()
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        self.reload()
+
+    def reload(self):
+        """Повторное чтение индекса (его мог изменить другой процесс)"""
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        with self._lock:
+            self._index = index
+
+    def release_dir(self, version):
+        return os.path.join(self.root, str(version))
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blobs_dir, sha256)
+
+    def get(self, version):
+        """Запись индекса о версии или None, если ее нет в хранилище"""
+        with self._lock:
+            return self._index.get(str(version))
+
+    def versions(self):
+        """Версии в хранилище от новых к старым"""
+        with self._lock:
+            names = list(self._index)
+        return sorted((Version(name) for name in names), reverse=True)
+
+    def manifest(self, version):
+        return load_manifest(self.release_dir(version))
+
+    def add_archive(self, version, source, archive_name, archive_sha256, progress=None):
+        """Разбор архива релиза в хранилище, возвращает манифест версии
+
+        Файлы читаются из источника source (ArchiveSource) один раз: по ходу
+        чтения считаются хеши для манифеста и пишется временный файл, который
+        становится файлом хранилища, если такого содержимого там еще нет.
+        """
+        files = source.list_files()
+        # Журнал проверенных файлов читается и сохраняется один раз на архив
+        verified = VerifiedFiles(self.blobs_dir, autosave=False)
+        total_size = sum(size for _, size in files)
+        entries = {}
+        done = 0
+        try:
+            for rel_path, size in files:
+                tmp_path = os.path.join(self.blobs_dir, f".{threading.get_ident()}.tmp")
+                try:
+                    with source.open(rel_path) as stream, open(tmp_path, 'wb') as out:
+                        entry = hash_stream(_TeeReader(stream, out), rel_path)
+                    blob = self.blob_path(entry['sha256'])
+                    if verified.sha256(blob) == entry['sha256']:
+                        os.remove(tmp_path)
+                    else:
+                        os.replace(tmp_path, blob)
+                        verified.mark(blob, entry['sha256'])
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                entries[rel_path] = entry
+                done += size
+                if progress:
+                    progress(done, total_size)
+        finally:
+            verified.save()
+
+        release_dir = self.release_dir(version)
+        os.makedirs(release_dir, exist_ok=True)
+        manifest = {'block_size': BLOCK_SIZE, 'files': entries}
+        save_manifest(release_dir, manifest)
+        with self._lock:
+            self._index[str(version)] = {
+                'archive': archive_name,
+                'archive_sha256': archive_sha256,
+                'files': len(entries),
+                'size': total_size,
+                'last_used': time.time(),
+            }
+            self._save()
+        return manifest
+
+    def materialize(self, version, manifest, replace=False):
+        """Дерево файлов версии в ее каталоге из ссылок на файлы хранилища
+
+        Уже существующие файлы нужного размера сохраняются, если не задан replace.
+        """
+        release_dir = self.release_dir(version)
+        for rel_path, info in manifest['files'].items():
+            dst = os.path.join(release_dir, *rel_path.split('/'))
+            if not replace and os.path.exists(dst) and os.path.getsize(dst) == info['size']:
+                continue
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if os.path.exists(dst):
+                os.remove(dst)
+            link_or_copy(self.blob_path(info['sha256']), dst)
+
+    def verify(self, manifest, check_cancelled=None):
+        """Проверка файлов хранилища, на которые ссылается манифест
+
+        Файл, не изменявшийся после записи в хранилище, не хешируется заново.
+        """
+        verified = VerifiedFiles(self.blobs_dir, autosave=False)
+        try:
+            for sha256 in {info['sha256'] for info in manifest['files'].values()}:
+                blob = self.blob_path(sha256)
+                if not os.path.exists(blob):
+                    raise IntegrityError(f"Файл {sha256[:12]} отсутствует в хранилище")
+                ensure_verified(blob, sha256, check_cancelled, verified)
+        finally:
+            verified.save()
+
+    def touch(self, version):
+        """Отметка об использовании версии для вытеснения по давности"""
+        with self._lock:
+            entry = self._index.get(str(version))
+            if entry is not None:
+                entry['last_used'] = time.time()
+                self._save()
+
+    def forget(self, version):
+        """Удаление версии из индекса (например, если ее файлы повреждены)"""
+        with self._lock:
+            if self._index.pop(str(version), None) is not None:
+                self._save()
+
+    def evict(self, keep=DEFAULT_KEEP, protected=()):
+        """Удаление давно не использованных версий и файлов без ссылок
+
+        Остаются keep последних использованных версий и все версии из
+        protected, каждая - вместе с архивами для всех плат. Возвращает
+        список удаленных версий.
+        """
+        protected = {base_version(version) for version in protected}
+        with self._lock:
+            by_use = sorted(self._index, key=lambda v: self._index[v]['last_used'], reverse=True)
+            recent = []
+            for key in by_use:
+                if base_version(key) not in recent:
+                    recent.append(base_version(key))
+            protected.update(recent[:keep])
+            evicted = [v for v in by_use if base_version(v) not in protected]
+            for version in evicted:
+                del self._index[version]
+            if evicted:
+                self._save()
+            kept = list(self._index)
+
+        # Каталоги версий, загруженных до появления хранилища (полный архив
+        # и распакованные файлы), тоже удаляются
+        evicted += [name for name in self._unindexed_dirs(kept + evicted)
+                    if base_version(name) not in protected]
+
+        for version in evicted:
+            shutil.rmtree(self.release_dir(version), ignore_errors=True)
+        if evicted:
+            self._collect_garbage(kept)
+        return evicted
+
+    def _unindexed_dirs(self, indexed):
+        names = []
+        for name in os.listdir(self.root):
+            if name in indexed or not os.path.isdir(os.path.join(self.root, name)):
+                continue
+            try:
+                Version(name)
+            except ValueError:
+                continue
+            names.append(name)
+        return names
+
+    def _collect_garbage(self, versions):
+        """Удаление файлов хранилища, на которые не ссылается ни одна версия"""
+        referenced = set()
+        for version in versions:
+            manifest = self.manifest(version)
+            if manifest is not None:
+                referenced.update(info['sha256'] for info in manifest['files'].values())
+
+        verified = VerifiedFiles(self.blobs_dir, autosave=False)
+        for name in os.listdir(self.blobs_dir):
+            if len(name) == 64 and name not in referenced:
+                path = self.blob_path(name)
+                verified.forget(path)
+                os.remove(path)
+        verified.save()
+
+    def _save(self):
+        write_json(self.index_path, self._index, indent=1)
@@ -0,0 +1,102 @@
+"""Хранилище резервных копий: дедупликация и поиск цели отката"""
+
+import os
+import gzip
+import json
+
+import pytest
+
+from backups import BackupStore
+from integrity import IntegrityError
+
+
+@pytest.fixture
+def backups(tmp_path):
+    return BackupStore(str(tmp_path / "backups"), identify=lambda port: f"id-{port}")
+
+
+def _backup(store, port, version, image):
+    with store.writer(port, version) as writer:
+        writer.write(image)
+    return writer.record
+
+
+def _stored_images(store):
+    return sorted(name for name in os.listdir(store.root) if name.endswith(".bin.gz"))
+
+
+def test_backup_is_compressed_and_readable(backups):
+    image = b"\xff" * 100000
+    record = _backup(backups, "COM1", "1.0.0", image)
+    assert record['size'] == len(image)
+    assert record['stored'] < len(image) / 10
+    with backups.open(record) as stream:
+        assert stream.read() == image
+    backups.verify(record)
+
+
+def test_identical_images_are_stored_once(backups):
+    _backup(backups, "COM1", "1.0.0", b"image")
+    _backup(backups, "COM1", "1.0.0", b"image")
+    _backup(backups, "COM2", "1.0.0", b"image")
+    assert len(_stored_images(backups)) == 1
+    _backup(backups, "COM1", "1.1.0", b"other image")
+    assert len(_stored_images(backups)) == 2
+
+
+def test_latest_and_find_by_device_and_version(backups):
+    first = _backup(backups, "COM1", "1.0.0", b"one")
+    second = _backup(backups, "COM1", "1.1.0", b"two")
+    _backup(backups, "COM2", "2.0.0", b"three")
+
+    assert backups.latest("COM1")['sha256'] == second['sha256']
+    assert backups.find("COM1", "1.0.0")['sha256'] == first['sha256']
+    assert backups.find("COM1", "2.0.0") is None
+    assert backups.latest("COM3") is None
+
+    # Индекс читается заново другим экземпляром (другим процессом)
+    reopened = BackupStore(backups.root, identify=backups.identify)
+    assert reopened.find("COM1", "1.1.0")['sha256'] == second['sha256']
+
+
+def test_shared_image_keeps_each_device_metadata(backups):
+    first = _backup(backups, "COM1", "1.0.0", b"image")
+    _backup(backups, "COM2", "1.2.0", b"image")
+    _backup(backups, "COM1", "1.1.0", b"image")
+
+    latest = backups.latest("COM2")
+    assert (latest['port'], latest['version'], latest['identity']) == ("COM2", "1.2.0", "id-COM2")
+    assert backups.latest("COM1")['version'] == "1.1.0"
+    found = backups.find("COM1", "1.0.0")
+    assert (found['port'], found['version'], found['created']) == \
+        ("COM1", "1.0.0", first['created'])
+    assert found['sha256'] == latest['sha256']
+
+
+def test_index_of_previous_format_is_read(backups):
+    _backup(backups, "COM1", "1.0.0", b"image")
+    sha256 = backups.latest("COM1")['sha256']
+    with open(backups.index_path, 'w', encoding='utf-8') as f:
+        json.dump({'devices': {'id-COM1': {'latest': sha256, 'versions': {'1.0.0': sha256}}},
+                   'backups': {sha256: {'sha256': sha256, 'size': 5, 'stored': 25,
+                                        'identity': 'id-COM1', 'port': "COM1",
+                                        'version': "1.0.0", 'created': 1.0}}}, f)
+    record = backups.find("COM1", "1.0.0")
+    assert (record['port'], record['version'], record['size']) == ("COM1", "1.0.0", 5)
+
+
+def test_failed_backup_leaves_no_files(backups):
+    with pytest.raises(RuntimeError):
+        with backups.writer("COM1", "1.0.0") as writer:
+            writer.write(b"partial")
+            raise RuntimeError("обрыв связи")
+    assert os.listdir(backups.root) == []
+    assert backups.latest("COM1") is None
+
+
+def test_damaged_backup_fails_verification(backups):
+    record = _backup(backups, "COM1", "1.0.0", b"image" * 1000)
+    with gzip.open(backups.path(record['sha256']), 'wb') as f:
+        f.write(b"other")
+    with pytest.raises(IntegrityError):
+        backups.verify(record)
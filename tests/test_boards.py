@@ -0,0 +1,60 @@
+"""Выбор архивов релиза для плат подключенных устройств"""
+
+from boards import asset_board, board_id, select_assets
+
+
+def _assets(*names):
+    return [{'name': name, 'size': 1} for name in names]
+
+
+def _names(selected):
+    return {board: asset['name'] for board, asset in selected.items()}
+
+
+ASSETS = _assets("firmware.zip", "firmware-uno.zip", "firmware_mega.zip", "CHANGELOG.md")
+
+
+def test_board_id_from_usb_identity():
+    assert board_id("2341:0043:8573") == "uno"
+    assert board_id("1a86:7523:") == "usb-1a86-7523"
+    assert board_id("/dev/ttyS0") is None
+    assert board_id(None) is None
+
+
+def test_asset_board_prefers_longest_suffix():
+    assert asset_board("firmware-uno.zip") == "uno"
+    assert asset_board("firmware-USB-1A86-7523.zip") == "usb-1a86-7523"
+    assert asset_board("firmware.zip") is None
+    # Дата в имени архива не принимается за VID-PID
+    assert asset_board("fw-2024-0115.zip") is None
+    assert asset_board("fw_2024-0115.zip", ["usb-1a86-7523"]) is None
+    assert asset_board("firmware-pro-micro.zip", ["pro-micro"]) == "pro-micro"
+
+
+def test_boards_with_own_archives():
+    assert _names(select_assets(ASSETS, ["uno", "mega"])) == {
+        'uno': "firmware-uno.zip", 'mega': "firmware_mega.zip"}
+
+
+def test_generic_archive_for_other_boards():
+    assert _names(select_assets(ASSETS, ["uno", "leonardo"])) == {
+        'uno': "firmware-uno.zip", None: "firmware.zip"}
+    # Устройство без идентификатора USB получает общий архив
+    assert _names(select_assets(ASSETS, [None])) == {None: "firmware.zip"}
+
+
+def test_without_devices():
+    assert _names(select_assets(ASSETS)) == {None: "firmware.zip"}
+    assert _names(select_assets(_assets("firmware-uno.zip", "firmware-mega.zip"))) == {
+        'uno': "firmware-uno.zip", 'mega': "firmware-mega.zip"}
+    assert select_assets(_assets("CHANGELOG.md"), ["uno"]) == {}
+
+
+def test_board_without_any_matching_archive():
+    assert select_assets(_assets("firmware-uno.zip"), ["mega"]) == {}
+
+
+def test_dated_archive_is_generic():
+    assets = _assets("fw-2024-0115.zip", "fw-usb-1a86-7523.zip")
+    assert _names(select_assets(assets, ["usb-1a86-7523", "uno"])) == {
+        'usb-1a86-7523': "fw-usb-1a86-7523.zip", None: "fw-2024-0115.zip"}
@@ -0,0 +1,57 @@
+"""Путь обновления по каталогу релизов с ограничениями "Requires:\""""
+
+import pytest
+from semantic_version import Version
+
+from catalog import ReleaseCatalog
+from github_stub import ReleaseServer
+from http_client import HttpClient
+
+
+@pytest.fixture
+def server():
+    with ReleaseServer() as server:
+        yield server
+
+
+def _catalog(server, tmp_path, releases):
+    """Каталог после загрузки релизов [(тег, описание, предварительный)]"""
+    for tag, body, prerelease in releases:
+        server.add_release(tag, {"update.zip": tag.encode()}, body=body, prerelease=prerelease)
+    http = HttpClient(str(tmp_path / "http_cache.json"))
+    catalog = ReleaseCatalog(http, server.api_url, str(tmp_path / "catalog.json"))
+    catalog.refresh()
+    return catalog
+
+
+def _versions(path):
+    return None if path is None else [str(version) for version in path]
+
+
+def test_direct_upgrade_to_newest(server, tmp_path):
+    catalog = _catalog(server, tmp_path, [("v1.0.0", "", False), ("v1.1.0", "", False),
+                                          ("v1.2.0", "", False)])
+    assert _versions(catalog.upgrade_path(Version("1.0.0"))) == ["1.2.0"]
+    assert catalog.upgrade_path(Version("1.2.0")) == []
+
+
+def test_upgrade_path_goes_through_required_versions(server, tmp_path):
+    catalog = _catalog(server, tmp_path, [
+        ("v1.0.0", "", False),
+        ("v1.4.0", "", False),
+        ("v1.5.0", "", False),
+        ("v2.0.0", "Исправления\nRequires: >=1.4.0", False),
+        ("v2.1.0", "Requires: >=2.0.0", False),
+        ("v3.0.0-rc.1", "", True),
+    ])
+    # Из промежуточных версий равной длины пути выбирается более новая
+    assert _versions(catalog.upgrade_path(Version("1.0.0"))) == ["1.5.0", "2.0.0", "2.1.0"]
+    assert _versions(catalog.upgrade_path(Version("1.4.0"), Version("2.0.0"))) == ["2.0.0"]
+    assert _versions(catalog.upgrade_path(Version("2.0.0"), prerelease=True)) == ["3.0.0-rc.1"]
+
+
+def test_unreachable_target(server, tmp_path):
+    catalog = _catalog(server, tmp_path, [("v1.0.0", "", False),
+                                          ("v2.0.0", "Requires: >=1.4.0", False)])
+    assert catalog.upgrade_path(Version("1.0.0")) is None
+    assert _versions(catalog.upgrade_path(Version("1.4.0"))) == ["2.0.0"]
@@ -0,0 +1,134 @@
+"""Сжатые кадры: deflate по блокам, обычные кадры для несжимаемых данных"""
+
+import io
+import zlib
+import random
+
+import pytest
+
+from device import Device
+from emulator import DeviceEmulator
+from manifest import build_manifest
+from release import DirectorySource
+from transfer import (ACK, COMPRESSED_BLOCK_SIZE, COMPRESSION_SAMPLE, FRAME_DATA, FRAME_DEFLATE,
+                      FRAME_END, SerialTransfer, decode_frame, encode_reply)
+
+
+class _AckingPort:
+    """Порт, который подтверждает каждый кадр и запоминает его"""
+
+    def __init__(self):
+        self.baudrate = 921600
+        self.timeout = 1
+        self.frames = []
+        self._sent = bytearray()
+        self._replies = bytearray()
+
+    def write(self, data):
+        self._sent += data
+        while True:
+            frame, used = decode_frame(self._sent)
+            del self._sent[:used]
+            if frame is None:
+                return len(data)
+            self.frames.append(frame[:4])
+            self._replies += encode_reply(ACK, frame[1])
+
+    def read(self, size=1):
+        data = bytes(self._replies[:size])
+        del self._replies[:size]
+        return data
+
+    @property
+    def in_waiting(self):
+        return len(self._replies)
+
+
+def _inflate(payload):
+    """Распаковка кадра с ограничением буфера устройства"""
+    inflater = zlib.decompressobj(-9)
+    data = inflater.decompress(payload, COMPRESSED_BLOCK_SIZE)
+    assert inflater.eof, "кадр распаковывается больше чем в COMPRESSED_BLOCK_SIZE байт"
+    return data
+
+
+def _send(data, codec="deflate:9"):
+    """Кадры данных, которыми передается data: [(тип, смещение, данные)]"""
+    port = _AckingPort()
+    link = SerialTransfer(port)
+    link.codec = codec
+    link.send_file(io.BytesIO(data), len(data))
+    assert port.frames[-1][0] == FRAME_END
+    return [(frame_type, offset, payload) for frame_type, _, offset, payload in port.frames[:-1]]
+
+
+def _reassemble(frames, size):
+    data = bytearray(size)
+    for frame_type, offset, payload in frames:
+        if frame_type == FRAME_DEFLATE:
+            payload = _inflate(payload)
+        data[offset:offset + len(payload)] = payload
+    return bytes(data)
+
+
+TEXT = b"".join(f"line {i}: key=value\n".encode() for i in range(5000))
+NOISE = random.Random(7).randbytes(64 * 1024)
+
+
+def test_compressible_data_is_sent_in_deflate_frames():
+    frames = _send(TEXT)
+    assert {frame_type for frame_type, _, _ in frames} == {FRAME_DEFLATE}
+    assert sum(len(payload) for _, _, payload in frames) < len(TEXT) / 3
+    # Каждый кадр сжат отдельно и распаковывается по своему смещению
+    assert [offset for _, offset, _ in frames] == \
+        list(range(0, len(TEXT), COMPRESSED_BLOCK_SIZE))
+    assert _reassemble(frames, len(TEXT)) == TEXT
+
+
+def test_incompressible_data_is_sent_raw():
+    frames = _send(NOISE)
+    assert {frame_type for frame_type, _, _ in frames} == {FRAME_DATA}
+    assert _reassemble(frames, len(NOISE)) == NOISE
+
+
+def test_compression_stops_after_unsuccessful_sample():
+    data = NOISE[:COMPRESSION_SAMPLE] + TEXT
+    frames = _send(data)
+    # После образца, который не сжался, сжатие больше не пробуется
+    assert all(frame_type == FRAME_DATA for frame_type, offset, _ in frames
+               if offset >= COMPRESSION_SAMPLE)
+    assert _reassemble(frames, len(data)) == data
+
+
+def test_mixed_block_is_split_into_compressed_and_raw_frames():
+    block = TEXT[:COMPRESSED_BLOCK_SIZE // 2] + NOISE[:COMPRESSED_BLOCK_SIZE // 2]
+    frames = _send(block)
+    assert [frame_type for frame_type, _, _ in frames] == [FRAME_DEFLATE, FRAME_DATA, FRAME_DATA]
+    assert _reassemble(frames, len(block)) == block
+
+
+def test_frames_never_inflate_beyond_device_buffer():
+    data = bytes(256 * 1024)
+    frames = _send(data)
+    for frame_type, _, payload in frames:
+        assert frame_type == FRAME_DEFLATE
+        assert len(_inflate(payload)) <= COMPRESSED_BLOCK_SIZE
+    assert _reassemble(frames, len(data)) == data
+
+
+def test_without_codec_frames_are_raw():
+    assert {frame_type for frame_type, _, _ in _send(TEXT, codec=None)} == {FRAME_DATA}
+
+
+@pytest.mark.parametrize("compression", [True, False])
+def test_install_with_negotiated_compression(tmp_path, compression):
+    files = {"config.txt": TEXT, "fw.bin": NOISE}
+    for rel_path, data in files.items():
+        (tmp_path / rel_path).write_bytes(data)
+    source = DirectorySource(str(tmp_path))
+    listed = sorted(source.list_files())
+    with DeviceEmulator("1.0.0", compression=compression) as emulator:
+        device = Device(emulator.listen())
+        stats = device.install(device.plan_update(listed, build_manifest(source, listed)), source)
+        assert emulator.files == files
+    assert (stats.encoded_bytes < stats.payload_bytes) == compression
@@ -0,0 +1,49 @@
+"""Опрос версии устройства с повторами и адаптивным временем ожидания"""
+
+import pytest
+
+import device as device_module
+from discovery import INITIAL_TIMEOUT, Discovery, IdentityCache
+from emulator import DeviceEmulator
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Число открытий порта: каждое перезагружает плату Arduino"""
+    ports = []
+    open_port = device_module.open_port
+
+    def counting_open_port(port, *args, **kwargs):
+        ports.append(port)
+        return open_port(port, *args, **kwargs)
+
+    monkeypatch.setattr(device_module, 'open_port', counting_open_port)
+    return ports
+
+
+def _discovery(tmp_path):
+    return Discovery(IdentityCache(str(tmp_path / "devices.json")))
+
+
+def test_slow_device_is_retried_in_one_session(tmp_path, opened):
+    # Ответ приходит позже первого времени ожидания
+    with DeviceEmulator("1.2.0", latency=INITIAL_TIMEOUT * 0.7) as emulator:
+        port = emulator.listen()
+        discovery = _discovery(tmp_path)
+        result = discovery.probe_port(port)
+    assert result.error is None
+    assert str(result.version) == "1.2.0"
+    assert opened == [port]
+    # Задержка считается от первого запроса и увеличивает время ожидания
+    assert result.rtt > INITIAL_TIMEOUT
+    assert discovery.cache.timeout(port).value > INITIAL_TIMEOUT
+    assert str(discovery.known_version(port)) == "1.2.0"
+
+
+def test_silent_device_reports_timeout(tmp_path, opened):
+    with DeviceEmulator() as emulator:
+        emulator._commands.pop('version')
+        port = emulator.listen()
+        result = _discovery(tmp_path).probe_port(port)
+    assert isinstance(result.error, TimeoutError)
+    assert opened == [port]
@@ -0,0 +1,193 @@
+"""Условные запросы и докачка HttpClient на локальном ReleaseServer"""
+
+import os
+import sys
+import time
+import random
+import hashlib
+import subprocess
+
+import pytest
+
+import http_client
+from errors import OperationCancelled
+from github_stub import ReleaseServer
+from http_client import HttpClient
+
+
+@pytest.fixture
+def server():
+    with ReleaseServer() as server:
+        yield server
+
+
+@pytest.fixture
+def client(tmp_path):
+    return HttpClient(str(tmp_path / "http_cache.json"))
+
+
+def _cancel_after(size):
+    """check_cancelled, прерывающий загрузку после примерно size байт"""
+    state = {'done': 0}
+
+    def progress(done, total):
+        state['done'] = done
+
+    def check_cancelled():
+        if state['done'] >= size:
+            raise OperationCancelled()
+
+    return progress, check_cancelled
+
+
+def _settled_bytes(server):
+    """Объем отданных данных после завершения ответов на прерванные запросы"""
+    sent = -1
+    while sent != server.bytes_sent:
+        sent = server.bytes_sent
+        time.sleep(0.2)
+    return sent
+
+
+def test_not_modified_returns_cached_body(server, client):
+    server.add_release("v1.0.0", {"update.zip": b"data"})
+    url = f"{server.api_url}?per_page=100&page=1"
+    body, changed = client.get_json(url)
+    assert changed and body[0]['tag_name'] == "v1.0.0"
+
+    again, changed = client.get_json(url)
+    assert not changed
+    assert again == body
+
+    server.add_release("v1.1.0", {"update.zip": b"data2"})
+    body, changed = client.get_json(url)
+    assert changed and body[0]['tag_name'] == "v1.1.0"
+
+
+def test_single_stream_download_resumes_with_range(server, client, tmp_path):
+    data = random.Random(2).randbytes(1024 * 1024)
+    release = server.add_release("v1.0.0", {"update.zip": data})
+    url = release['assets'][0]['browser_download_url']
+    dest = str(tmp_path / "update.zip")
+    sha256 = hashlib.sha256(data).hexdigest()
+
+    progress, check_cancelled = _cancel_after(256 * 1024)
+    with pytest.raises(OperationCancelled):
+        client.download(url, dest, len(data), sha256, progress, check_cancelled)
+    partial = os.path.getsize(f"{dest}.part")
+    assert 0 < partial < len(data)
+
+    sent = _settled_bytes(server)
+    downloaded, result = client.download(url, dest, len(data), sha256)
+    assert downloaded and result == sha256
+    # Повторно запрошен только остаток файла
+    assert server.bytes_sent - sent == len(data) - partial
+    with open(dest, 'rb') as f:
+        assert f.read() == data
+    assert not os.path.exists(f"{dest}.part")
+
+
+def test_segmented_download_resumes_each_segment(server, client, tmp_path, monkeypatch):
+    monkeypatch.setattr(http_client, 'SEGMENTED_MIN_SIZE', 1024 * 1024)
+    monkeypatch.setattr(http_client, 'MIN_SEGMENT_SIZE', 256 * 1024)
+    data = random.Random(3).randbytes(2 * 1024 * 1024)
+    release = server.add_release("v1.0.0", {"update.zip": data})
+    url = release['assets'][0]['browser_download_url']
+    dest = str(tmp_path / "update.zip")
+    sha256 = hashlib.sha256(data).hexdigest()
+
+    progress, check_cancelled = _cancel_after(512 * 1024)
+    with pytest.raises(OperationCancelled):
+        client.download(url, dest, len(data), sha256, progress, check_cancelled)
+    state = http_client._load_state(f"{dest}.part.json")
+    assert len(state['segments']) == 4
+    fetched = sum(position - start for start, _, position in state['segments'])
+    assert 0 < fetched < len(data)
+
+    sent = _settled_bytes(server)
+    downloaded, result = client.download(url, dest, len(data), sha256)
+    assert downloaded and result == sha256
+    assert server.bytes_sent - sent == len(data) - fetched
+    with open(dest, 'rb') as f:
+        assert f.read() == data
+    assert not os.path.exists(f"{dest}.part.json")
+
+
+def test_segmented_download_resumes_after_process_crash(server, client, tmp_path):
+    data = random.Random(4).randbytes(16 * 1024 * 1024)
+    release = server.add_release("v1.0.0", {"update.zip": data})
+    url = release['assets'][0]['browser_download_url']
+    dest = str(tmp_path / "update.zip")
+    sha256 = hashlib.sha256(data).hexdigest()
+
+    # Процесс завершается аварийно посреди загрузки, без обработки исключений
+    code = (
+        "import os, sys\n"
+        f"sys.path.insert(0, {os.path.dirname(os.path.dirname(os.path.abspath(__file__)))!r})\n"
+        "from http_client import HttpClient\n"
+        "def progress(done, total):\n"
+        "    if done >= 10 * 1024 * 1024:\n"
+        "        os._exit(1)\n"
+        f"HttpClient({str(tmp_path / 'child_cache.json')!r}).download("
+        f"{url!r}, {dest!r}, {len(data)}, {sha256!r}, progress)\n"
+    )
+    assert subprocess.run([sys.executable, '-c', code], timeout=60).returncode == 1
+    state = http_client._load_state(f"{dest}.part.json")
+    fetched = sum(position - start for start, _, position in state['segments'])
+    assert fetched >= http_client.STATE_SAVE_INTERVAL
+
+    sent = _settled_bytes(server)
+    downloaded, result = client.download(url, dest, len(data), sha256)
+    assert downloaded and result == sha256
+    assert server.bytes_sent - sent == len(data) - fetched
+
+
+def test_segmented_download_restarts_when_file_changes(server, client, tmp_path, monkeypatch):
+    monkeypatch.setattr(http_client, 'SEGMENTED_MIN_SIZE', 1024 * 1024)
+    monkeypatch.setattr(http_client, 'MIN_SEGMENT_SIZE', 256 * 1024)
+    old = random.Random(5).randbytes(2 * 1024 * 1024)
+    new = random.Random(6).randbytes(len(old))
+    release = server.add_release("v1.0.0", {"update.zip": old})
+    url = release['assets'][0]['browser_download_url']
+    dest = str(tmp_path / "update.zip")
+
+    progress, check_cancelled = _cancel_after(512 * 1024)
+    with pytest.raises(OperationCancelled):
+        client.download(url, dest, len(old), None, progress, check_cancelled)
+    old_etag = http_client._load_state(f"{dest}.part.json")['etag']
+    server.add_release("v1.0.0", {"update.zip": new})
+
+    # Файл изменился сразу после запроса HEAD: части отвечают 200 вместо 206
+    session = client.session
+    heads = []
+
+    class StaleHead:
+        def head(self, *args, **kwargs):
+            response = session.head(*args, **kwargs)
+            if not heads:
+                response.headers['ETag'] = old_etag
+            heads.append(response)
+            return response
+
+        def get(self, *args, **kwargs):
+            return session.get(*args, **kwargs)
+
+    client.session = StaleHead()
+    downloaded, result = client.download(url, dest, len(new), hashlib.sha256(new).hexdigest())
+    assert downloaded and result == hashlib.sha256(new).hexdigest()
+    assert len(heads) == 2
+    with open(dest, 'rb') as f:
+        assert f.read() == new
+
+
+def test_existing_file_is_not_downloaded_again(server, client, tmp_path):
+    data = b"firmware" * 1000
+    release = server.add_release("v1.0.0", {"update.zip": data})
+    url = release['assets'][0]['browser_download_url']
+    dest = str(tmp_path / "update.zip")
+    sha256 = hashlib.sha256(data).hexdigest()
+    assert client.download(url, dest, len(data), sha256) == (True, sha256)
+
+    requests = server.requests
+    assert client.download(url, dest, len(data), sha256) == (False, sha256)
+    assert server.requests == requests
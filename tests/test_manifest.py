@@ -0,0 +1,108 @@
+"""План дифференциального обновления: файлы целиком или изменившиеся блоки"""
+
+import random
+
+import pytest
+
+from device import Device
+from emulator import DeviceEmulator
+from manifest import BLOCK_SIZE, build_manifest, changed_ranges, plan_update
+from release import DirectorySource
+
+
+def _image(blocks, seed=0):
+    return random.Random(seed).randbytes(blocks * BLOCK_SIZE)
+
+
+def _changed(data, *blocks):
+    data = bytearray(data)
+    for block in blocks:
+        data[block * BLOCK_SIZE] ^= 0xFF
+    return bytes(data)
+
+
+def _source(directory, files):
+    directory.mkdir(exist_ok=True)
+    for rel_path, data in files.items():
+        (directory / rel_path).write_bytes(data)
+    source = DirectorySource(str(directory))
+    return source, sorted(source.list_files())
+
+
+def _plan(tmp_path, new_files, device_files, device_block_size=BLOCK_SIZE):
+    """План для релиза new_files и устройства, на котором уже есть device_files"""
+    source, files = _source(tmp_path / "new", new_files)
+    device_source, device_list = _source(tmp_path / "device", device_files)
+    return plan_update(files, build_manifest(source, files),
+                       build_manifest(device_source, device_list, device_block_size))
+
+
+def test_changed_ranges_merges_neighbouring_blocks():
+    new = ['a', 'b', 'c', 'd', 'e']
+    old = ['a', 'x', 'x', 'd', 'x']
+    assert changed_ranges(new, old, 4 * 1024 + 100, 1024) == [(1024, 2048), (4096, 100)]
+    # Блоки сверх старого файла всегда передаются
+    assert changed_ranges(new, old[:2], 5 * 1024, 1024) == [(1024, 4096)]
+
+
+def test_few_changed_blocks_are_sent_as_patch(tmp_path):
+    old = _image(16)
+    plan = _plan(tmp_path, {"fw.bin": _changed(old, 3, 4, 10)}, {"fw.bin": old})
+    [entry] = plan.entries
+    assert entry.ranges == [(3 * BLOCK_SIZE, 2 * BLOCK_SIZE), (10 * BLOCK_SIZE, BLOCK_SIZE)]
+    assert plan.transfer_size == 3 * BLOCK_SIZE
+
+
+def test_mostly_changed_image_is_sent_whole(tmp_path):
+    old = _image(16)
+    plan = _plan(tmp_path, {"fw.bin": _changed(old, *range(8))}, {"fw.bin": old})
+    [entry] = plan.entries
+    assert entry.ranges is None
+    assert plan.transfer_size == len(old)
+
+
+def test_unchanged_missing_and_non_image_files(tmp_path):
+    old = _image(4)
+    plan = _plan(tmp_path, {"fw.bin": old, "config.txt": b"b=2", "new.txt": b"new"},
+                 {"fw.bin": old, "config.txt": b"b=1"})
+    assert {entry.rel_path: entry.ranges for entry in plan.entries} == {
+        "config.txt": None, "new.txt": None}
+
+
+def test_shrunk_image_sends_only_changed_blocks(tmp_path):
+    old = _image(16)
+    new = _changed(old, 2)[:10 * BLOCK_SIZE + 100]
+    plan = _plan(tmp_path, {"fw.bin": new}, {"fw.bin": old})
+    [entry] = plan.entries
+    # Последний неполный блок отличается от прежнего полного
+    assert entry.ranges == [(2 * BLOCK_SIZE, BLOCK_SIZE), (10 * BLOCK_SIZE, 100)]
+    assert entry.size == len(new)
+
+
+def test_other_device_block_size_sends_whole_file(tmp_path):
+    old = _image(16)
+    plan = _plan(tmp_path, {"fw.bin": _changed(old, 3)}, {"fw.bin": old},
+                 device_block_size=1024)
+    [entry] = plan.entries
+    assert entry.ranges is None
+
+
+def test_no_device_state_sends_everything(tmp_path):
+    source, files = _source(tmp_path, {"fw.bin": _image(2), "a.txt": b"a"})
+    plan = plan_update(files, build_manifest(source, files), None)
+    assert [entry.ranges for entry in plan.entries] == [None, None]
+
+
+@pytest.mark.parametrize("blocks, cut", [((1, 7), 16 * BLOCK_SIZE), ((2,), 9 * BLOCK_SIZE + 17),
+                                         ((0,), 6 * BLOCK_SIZE)])
+def test_patched_image_on_device_matches_release(tmp_path, blocks, cut):
+    old = _image(16, seed=1)
+    new = _changed(old, *blocks)[:cut]
+    source, files = _source(tmp_path, {"fw.bin": new})
+    manifest = build_manifest(source, files)
+    with DeviceEmulator("1.0.0", files={"fw.bin": old}) as emulator:
+        device = Device(emulator.listen())
+        plan = device.plan_update(files, manifest)
+        assert plan.entries[0].ranges is not None
+        device.install(plan, source)
+        assert emulator.files["fw.bin"] == new
@@ -0,0 +1,65 @@
+"""Выгрузка счетчиков несколькими процессами в общий каталог метрик"""
+
+import json
+import multiprocessing
+
+from metrics import Metrics
+
+
+def _counters(path):
+    with open(path / "metrics.json", encoding='utf-8') as f:
+        return json.load(f)['counters']
+
+
+def _work(path, count):
+    metrics = Metrics(path)
+    for _ in range(count):
+        metrics.add('updater_http_bytes_total', 10)
+        with metrics.phase('hash'):
+            pass
+        metrics.flush()
+
+
+def test_flush_adds_increments_of_each_instance(tmp_path):
+    # Оба экземпляра загрузили счетчики до выгрузок друг друга, как два процесса
+    first, second = Metrics(str(tmp_path)), Metrics(str(tmp_path))
+    first.add('updater_http_bytes_total', 100)
+    first.flush()
+    second.add('updater_http_bytes_total', 5)
+    second.flush()
+    assert _counters(tmp_path)['updater_http_bytes_total'] == 105
+
+    # Повторная выгрузка без новых приращений ничего не прибавляет
+    first.flush()
+    assert _counters(tmp_path)['updater_http_bytes_total'] == 105
+    assert first.prometheus_text().count("updater_http_bytes_total 105") == 1
+
+
+def test_gauges_and_durations_take_last_value(tmp_path):
+    first, second = Metrics(str(tmp_path)), Metrics(str(tmp_path))
+    first.set('updater_phase_last_seconds', 3.0, phase='hash')
+    first.flush()
+    second.set('updater_phase_last_seconds', 1.0, phase='hash')
+    second.flush()
+    assert _counters(tmp_path)['updater_phase_last_seconds{phase="hash"}'] == 1.0
+
+    with second.phase('download'):
+        pass
+    second.flush()
+    weight = second.weights(['download'])['download']
+    assert Metrics(str(tmp_path)).weights(['download']) == {'download': weight}
+
+
+def test_counters_of_concurrent_processes_add_up(tmp_path):
+    processes = [multiprocessing.Process(target=_work, args=(str(tmp_path), 50))
+                 for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+    counters = _counters(tmp_path)
+    assert counters['updater_http_bytes_total'] == 4 * 50 * 10
+    assert counters['updater_phase_runs_total{phase="hash"}'] == 4 * 50
+    prometheus = (tmp_path / "updater.prom").read_text(encoding='utf-8')
+    assert "updater_http_bytes_total 2000\n" in prometheus
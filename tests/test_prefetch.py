@@ -0,0 +1,104 @@
+"""Фоновая загрузка: подготовка релиза, пропуск при блокировке и паузы"""
+
+import io
+import zipfile
+
+import pytest
+
+from core import UpdaterCore
+from github_stub import ReleaseServer
+from locking import FileLock
+from prefetch import ERROR_DELAY, Prefetcher
+
+
+def _archive(version):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr("version.txt", version)
+        archive.writestr("firmware.bin", b"\xff" * 1024)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def server():
+    with ReleaseServer() as server:
+        server.add_release("v1.0.0", {"update.zip": _archive("1.0.0")})
+        yield server
+
+
+class _Waits:
+    """Замена ожидания между проверками: запоминает паузы и останавливает цикл"""
+
+    def __init__(self, prefetcher, count):
+        self.prefetcher = prefetcher
+        self.count = count
+        self.delays = []
+
+    def wait(self, delay):
+        self.delays.append(delay)
+        if len(self.delays) >= self.count:
+            self.prefetcher.stop()
+
+    def set(self):
+        pass
+
+    def clear(self):
+        pass
+
+
+def _run(prefetcher, count):
+    waits = _Waits(prefetcher, count)
+    prefetcher._wake_event = waits
+    prefetcher.run()
+    return waits.delays
+
+
+def test_new_release_is_staged_once(server, tmp_path):
+    staged = []
+    prefetcher = Prefetcher(UpdaterCore(str(tmp_path), api_url=server.api_url),
+                            on_staged=staged.append)
+    assert str(prefetcher.run_once().version) == "1.0.0"
+    prefetcher.run_once()
+    assert [str(release.version) for release in staged] == ["1.0.0"]
+
+    server.add_release("v1.1.0", {"update.zip": _archive("1.1.0")})
+    prefetcher.run_once()
+    assert [str(release.version) for release in staged] == ["1.0.0", "1.1.0"]
+
+
+def test_check_is_skipped_while_another_process_downloads(server, tmp_path):
+    core = UpdaterCore(str(tmp_path), api_url=server.api_url)
+    messages = []
+    prefetcher = Prefetcher(core, on_status=messages.append)
+    with FileLock(core.lock_path):
+        assert prefetcher.run_once() is None
+    assert "занято" in messages[-1]
+    assert prefetcher.staged_version is None
+    assert str(prefetcher.run_once().version) == "1.0.0"
+
+
+def test_rate_limit_postpones_next_check(tmp_path):
+    with ReleaseServer(rate_limit=3) as server:
+        server.add_release("v1.0.0", {"update.zip": _archive("1.0.0")})
+        prefetcher = Prefetcher(UpdaterCore(str(tmp_path), api_url=server.api_url),
+                                interval=10, jitter=0)
+        prefetcher.run_once()
+        # Осталось меньше запаса запросов: проверка откладывается до сброса лимита
+        assert prefetcher.next_delay() > 3000
+
+
+def test_exhausted_rate_limit_waits_for_reset(tmp_path):
+    with ReleaseServer(rate_limit=0) as server:
+        messages = []
+        prefetcher = Prefetcher(UpdaterCore(str(tmp_path), api_url=server.api_url),
+                                interval=10, on_status=messages.append)
+        [delay] = _run(prefetcher, 1)
+    assert delay > 3000
+    assert "отложена" in messages[-1]
+
+
+def test_errors_back_off_exponentially(server, tmp_path):
+    core = UpdaterCore(str(tmp_path), api_url=f"{server.url}/repos/missing/repo/releases")
+    prefetcher = Prefetcher(core, interval=1000)
+    assert _run(prefetcher, 4) == [ERROR_DELAY, 2 * ERROR_DELAY, 4 * ERROR_DELAY,
+                                   8 * ERROR_DELAY]
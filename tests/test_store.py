@@ -0,0 +1,119 @@
+"""Вытеснение версий из хранилища релизов"""
+
+import io
+import os
+import types
+import zipfile
+
+import pytest
+from semantic_version import Version
+
+import store as store_module
+from release import DirectorySource
+from store import ReleaseStore, release_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Время последнего использования версий - по порядку операций"""
+    now = [1000.0]
+
+    def time():
+        now[0] += 1
+        return now[0]
+
+    monkeypatch.setattr(store_module, 'time', types.SimpleNamespace(time=time))
+
+
+@pytest.fixture
+def releases(tmp_path, clock):
+    return ReleaseStore(str(tmp_path / "releases"))
+
+
+def _add(store, tmp_path, key, files):
+    source_dir = tmp_path / "src" / key
+    for rel_path, data in files.items():
+        path = source_dir / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return store.add_archive(key, DirectorySource(str(source_dir)), f"{key}.zip", "0" * 64)
+
+
+def _zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for rel_path, data in files.items():
+            archive.writestr(rel_path, data)
+    return buffer.getvalue()
+
+
+def _blobs(store):
+    return {name for name in os.listdir(store.blobs_dir) if len(name) == 64}
+
+
+def test_evict_keeps_recent_and_protected_versions(releases, tmp_path):
+    shared = b"shared library"
+    for version in ("1.0.0", "1.1.0", "1.2.0", "1.3.0"):
+        _add(releases, tmp_path, version, {"lib.bin": shared, "main.bin": version.encode()})
+    unique = releases.manifest("1.1.0")['files']['main.bin']['sha256']
+
+    evicted = releases.evict(keep=2, protected=[Version("1.0.0")])
+    assert evicted == ["1.1.0"]
+    assert releases.versions() == [Version("1.3.0"), Version("1.2.0"), Version("1.0.0")]
+    # Файл только удаленной версии удален, общий остался
+    blobs = _blobs(releases)
+    assert unique not in blobs
+    assert releases.manifest("1.0.0")['files']['lib.bin']['sha256'] in blobs
+    assert len(blobs) == 4
+    assert not os.path.exists(releases.release_dir("1.1.0"))
+
+
+def test_evict_counts_board_archives_as_one_version(releases, tmp_path):
+    for key in ("0.9.0", release_key("1.0.0"), release_key("1.0.0", "uno"),
+                release_key("2.0.0", "mega"), release_key("2.0.0", "uno")):
+        _add(releases, tmp_path, key, {"main.bin": key.encode()})
+
+    evicted = releases.evict(keep=1)
+    assert sorted(evicted) == ["0.9.0", "1.0.0", "1.0.0+uno"]
+    assert {str(v) for v in releases.versions()} == {"2.0.0+mega", "2.0.0+uno"}
+
+
+def test_evict_protects_all_boards_of_protected_version(releases, tmp_path):
+    for key in ("1.0.0+mega", "1.0.0+uno", "1.5.0", "2.0.0+uno"):
+        _add(releases, tmp_path, key, {"main.bin": key.encode()})
+
+    # Защищена версия, установленная на плате uno, но вместе с ней
+    # сохраняется и архив для mega
+    evicted = releases.evict(keep=1, protected=[Version("1.0.0+uno")])
+    assert evicted == ["1.5.0"]
+    assert {str(v) for v in releases.versions()} == {"1.0.0+mega", "1.0.0+uno", "2.0.0+uno"}
+    assert len(_blobs(releases)) == 3
+
+
+def test_install_keeps_release_files_from_other_processes(tmp_path):
+    from core import Operation, UpdaterCore
+    from emulator import DeviceEmulator
+    from github_stub import ReleaseServer
+    from locking import LockBusy
+
+    files = {"config.txt": b"a=1", "fw.bin": os.urandom(64 * 1024)}
+    busy = []
+
+    def progress(value):
+        # Вытеснение в другом процессе требует исключительной блокировки
+        try:
+            with core.releases_lock(blocking=False):
+                busy.append(False)
+        except LockBusy:
+            busy.append(True)
+
+    with ReleaseServer() as server, DeviceEmulator("1.0.0") as emulator:
+        server.add_release("v1.1.0", {"update.zip": _zip(files)})
+        core = UpdaterCore(str(tmp_path), api_url=server.api_url)
+        release = core.fetch_release()
+        core.install(emulator.listen(), release, Operation(progress=progress))
+        assert emulator.files == files
+    assert True in busy
+    # После установки блокировка освобождена
+    with core.releases_lock(blocking=False):
+        pass
@@ -0,0 +1,231 @@
+"""Протокол передачи кадрами: окно, повтор по NAK и завершающий кадр
+
+Стороны соединены парой портов в памяти; фильтр записи порта позволяет
+исказить или потерять отдельный кадр или ответ.
+"""
+
+import io
+import time
+import random
+import threading
+
+import pytest
+
+from transfer import (ACK, CAN, FRAME_DATA, HEADER, NAK, REPLY, SerialTransfer, TransferError,
+                      decode_frame, encode_reply)
+
+
+class _Port:
+    """Сторона пары портов с интерфейсом serial.Serial
+
+    filter(data) вызывается для каждой записи и возвращает данные, которые
+    действительно уйдут на другую сторону (b'' - потеря).
+    """
+
+    def __init__(self):
+        self.baudrate = 921600
+        self.timeout = 1
+        self.filter = None
+        self.peer = None
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+
+    def write(self, data):
+        if self.filter is not None:
+            data = self.filter(bytes(data))
+        with self.peer._cond:
+            self.peer._buffer += data
+            self.peer._cond.notify_all()
+        return len(data)
+
+    def read(self, size=1):
+        with self._cond:
+            self._cond.wait_for(lambda: self._buffer, self.timeout)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+    @property
+    def in_waiting(self):
+        with self._cond:
+            return len(self._buffer)
+
+    def pending_bytes(self):
+        with self._cond:
+            return bytes(self._buffer)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._buffer.clear()
+
+
+def _port_pair():
+    host, device = _Port(), _Port()
+    host.peer, device.peer = device, host
+    return host, device
+
+
+def _frames(data):
+    """Кадры в потоке байт: [(тип, seq, смещение, данные)]"""
+    frames = []
+    buffer = bytearray(data)
+    while True:
+        frame, used = decode_frame(buffer)
+        del buffer[:used]
+        if frame is None:
+            return frames
+        frames.append(frame[:4])
+
+
+def _receive(link, size, result):
+    """Прием файла в потоке: в result попадают данные или исключение"""
+    out = io.BytesIO()
+    try:
+        link.receive_file(out, size)
+        result['data'] = out.getvalue()
+        result['closed'] = link.wait_close()
+    except Exception as e:
+        result['error'] = e
+
+
+def _start_receiver(port, size, **kwargs):
+    result = {}
+    thread = threading.Thread(target=_receive, args=(SerialTransfer(port, **kwargs), size, result),
+                              daemon=True)
+    thread.start()
+    return thread, result
+
+
+def _send(port, data, **kwargs):
+    link = SerialTransfer(port, **kwargs)
+    stats = link.send_file(io.BytesIO(data), len(data))
+    link.close()
+    return stats
+
+
+DATA = random.Random(1).randbytes(20 * 1024 + 100)
+
+
+def test_window_keeps_several_frames_unacknowledged():
+    host, device = _port_pair()
+    result = {}
+    sender = threading.Thread(
+        target=lambda: result.update(stats=_send(host, DATA, window=4, ack_timeout=2.0)),
+        daemon=True)
+    sender.start()
+    time.sleep(0.3)
+    # Без ответов устройства отправлено ровно окно кадров
+    sent = _frames(device.pending_bytes())
+    assert [frame[0] for frame in sent] == [FRAME_DATA] * 4
+    assert [frame[2] for frame in sent] == [0, 1024, 2048, 3072]
+
+    receiver, received = _start_receiver(device, len(DATA))
+    sender.join(10)
+    receiver.join(10)
+    assert received['data'] == DATA
+    assert received['closed']
+    assert result['stats'].retransmits == 0
+    assert result['stats'].payload_bytes == len(DATA)
+
+
+def test_nak_retransmits_only_corrupted_frame():
+    host, device = _port_pair()
+    corrupted = []
+
+    def corrupt_second_frame(data):
+        frames = _frames(data)
+        if frames and frames[0][1] == 1 and not corrupted:
+            corrupted.append(data)
+            data = bytearray(data)
+            data[HEADER.size] ^= 0xFF
+        return bytes(data)
+
+    host.filter = corrupt_second_frame
+    receiver, received = _start_receiver(device, len(DATA))
+    # Таймаут больше времени теста: повтор может вызвать только NAK
+    stats = _send(host, DATA, ack_timeout=30.0)
+    receiver.join(10)
+    assert corrupted
+    assert received['data'] == DATA
+    assert stats.retransmits == 1
+
+
+def test_lost_end_ack_is_acknowledged_again():
+    host, device = _port_pair()
+    dropped = []
+
+    def drop_first_end_ack(data):
+        if len(data) == REPLY.size and not dropped:
+            kind, seq, _ = REPLY.unpack(data)
+            if kind == ACK and seq == len(DATA) // 1024 + 1:
+                dropped.append(seq)
+                return b''
+        return data
+
+    device.filter = drop_first_end_ack
+    receiver, received = _start_receiver(device, len(DATA))
+    stats = _send(host, DATA, ack_timeout=0.2)
+    receiver.join(10)
+    assert dropped
+    assert received['data'] == DATA
+    # Повтор завершающего кадра подтвержден получателем, уже ждущим закрытия
+    assert received['closed']
+    assert stats.retransmits == 1
+
+
+def test_corrupted_reply_does_not_acknowledge_another_frame():
+    host, device = _port_pair()
+    corrupted = []
+
+    def corrupt_nak(data):
+        # NAK на кадр 1 с искаженным номером выглядел бы как ACK на кадр 3
+        if len(data) == REPLY.size and not corrupted and REPLY.unpack(data)[:2] == (NAK, 1):
+            corrupted.append(data)
+            return encode_reply(ACK, 3)[:3] + data[3:]
+        return data
+
+    def corrupt_second_frame(data):
+        if corrupted or _frames(data)[0][1] != 1:
+            return data
+        return data[:HEADER.size] + bytes([data[HEADER.size] ^ 0xFF]) + data[HEADER.size + 1:]
+
+    host.filter = corrupt_second_frame
+    device.filter = corrupt_nak
+    receiver, received = _start_receiver(device, len(DATA))
+    stats = _send(host, DATA, ack_timeout=0.2)
+    receiver.join(10)
+    assert corrupted
+    assert received['data'] == DATA
+    # Кадр 1 повторен по таймауту, кадр 3 подтвержден своим ответом
+    assert stats.retransmits == 1
+
+
+def test_stray_can_byte_is_ignored():
+    host, device = _port_pair()
+    injected = []
+
+    def inject_can(data):
+        if not injected and len(data) == REPLY.size:
+            injected.append(data)
+            return bytes([CAN, 0x12, 0x34]) + data
+        return data
+
+    device.filter = inject_can
+    receiver, received = _start_receiver(device, len(DATA))
+    _send(host, DATA, ack_timeout=0.2)
+    receiver.join(10)
+    assert injected
+    assert received['data'] == DATA
+
+
+def test_end_with_wrong_size_cancels_transfer():
+    host, device = _port_pair()
+    receiver, received = _start_receiver(device, len(DATA) + 1)
+    with pytest.raises(TransferError):
+        _send(host, DATA, ack_timeout=0.2)
+    receiver.join(10)
+    assert isinstance(received['error'], TransferError)
+
@@ -0,0 +1,608 @@
+"""Протокол передачи файлов на устройство по последовательному порту
+
+Каждый кадр имеет вид
+
+    SOF(1) | тип(1) | seq(2) | offset(4) | длина(2) | данные | CRC32(4)
+
+(little-endian, CRC32 считается по заголовку и данным). Устройство отвечает
+на каждый кадр пятью байтами: ACK, NAK или CAN, номер кадра и его инверсия
+(seq ^ 0xFFFF) для проверки. Ответ с неверной проверкой отбрасывается, как
+кадр с неверной CRC32: искаженный номер не подтвердит другой кадр окна,
+а случайный байт CAN на линии не прервет передачу. CAN означает неустранимую
+ошибку (например, не совпала CRC32 всего файла в завершающем кадре)
+и прерывает передачу.
+
+Передатчик держит окно из нескольких неподтвержденных кадров, поэтому линия
+не простаивает в ожидании ответа, и повторяет только кадры с NAK или истекшим
+таймаутом. Смещение в заголовке позволяет устройству записывать кадры
+по месту независимо от порядка их прихода.
+
+Если устройство согласилось на сжатие (команда "codec"), данные передаются
+кадрами FRAME_DEFLATE: raw deflate с окном 2^9 = 512 байт, каждый кадр
+сжат независимо и распаковывается не более чем в COMPRESSED_BLOCK_SIZE
+байт по смещению из заголовка. Кадры, которые сжатие не уменьшает,
+передаются как обычные FRAME_DATA.
+
+Резервная копия выгружается с устройства теми же кадрами в обратную
+сторону: устройство передает кадры FRAME_DATA и FRAME_END, хост отвечает
+ACK, NAK или CAN.
+
+После согласования скорости текстовых строк больше нет: число файлов,
+заголовки файлов и размер образа передаются кадрами FRAME_HEADER, а сеанс
+завершается кадром FRAME_CLOSE. Служебные кадры (FRAME_HEADER, FRAME_END,
+FRAME_CLOSE) подтверждаются так же, как данные. Если подтверждение
+потерялось и отправитель повторил служебный кадр, когда получатель уже
+ждет следующего, повтор подтверждается снова, а не принимается за новый
+кадр.
+"""
+
+import time
+import struct
+import zlib
+
+import serial
+
+DEFAULT_BAUDRATE = 9600
+TRANSFER_BAUDRATES = (921600, 460800, 230400, 115200)
+COMPRESSION_CODECS = ("deflate:9",)
+
+# Максимальный объем распакованных данных одного кадра (буфер устройства)
+COMPRESSED_BLOCK_SIZE = 4096
+# Кадр с большей длиной данных не отправляется ни одной из сторон
+MAX_PAYLOAD = COMPRESSED_BLOCK_SIZE
+# Если на первых COMPRESSION_SAMPLE байтах файла сжатие экономит меньше
+# 10%, остаток файла передается без сжатия
+COMPRESSION_SAMPLE = 16 * 1024
+COMPRESSION_MIN_GAIN = 0.9
+
+SOF = 0xA5
+FRAME_DATA = 0x01
+FRAME_END = 0x02
+FRAME_DEFLATE = 0x03
+FRAME_HEADER = 0x04
+FRAME_CLOSE = 0x05
+CONTROL_FRAMES = (FRAME_END, FRAME_HEADER, FRAME_CLOSE)
+
+ACK = 0x06
+NAK = 0x15
+CAN = 0x18
+
+HEADER = struct.Struct('<BBHIH')
+TRAILER = struct.Struct('<I')
+REPLY = struct.Struct('<BHH')
+END_PAYLOAD = struct.Struct('<II')
+
+# Таймаут одного чтения порта: ожидание ответа идет циклом до своего срока,
+# чтобы не перенастраивать порт (tcsetattr) перед каждым чтением
+POLL_TIMEOUT = 0.02
+
+
+class TransferError(Exception):
+    """Ошибка передачи данных на устройство"""
+
+
+def open_port(port, baudrate=DEFAULT_BAUDRATE, timeout=1):
+    """Открытие порта по имени устройства или URL pyserial (loop://, socket://...)"""
+    return serial.serial_for_url(port, baudrate=baudrate, timeout=timeout)
+
+
+def deflate_raw(data, wbits=9):
+    """Сжатие без заголовка zlib с окном 2^wbits байт"""
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -wbits)
+    return compressor.compress(data) + compressor.flush()
+
+
+def encode_frame(frame_type, seq, offset, payload):
+    """Сборка кадра с контрольной суммой"""
+    header = HEADER.pack(SOF, frame_type, seq, offset, len(payload))
+    crc = zlib.crc32(payload, zlib.crc32(header))
+    return header + payload + TRAILER.pack(crc)
+
+
+def encode_reply(kind, seq):
+    """Ответ на кадр: ACK, NAK или CAN с номером кадра и его проверкой"""
+    return REPLY.pack(kind, seq, seq ^ 0xFFFF)
+
+
+def decode_frame(buffer):
+    """Разбор кадра в начале буфера
+
+    Возвращает (кадр, число использованных байт), где кадр - кортеж
+    (тип, seq, offset, данные, crc_ok) или None, если данных пока недостаточно.
+    Для кадра с неверной CRC использованным считается только байт SOF, чтобы
+    получатель мог ответить NAK и продолжить поиск следующего кадра.
+    Заголовок с длиной больше MAX_PAYLOAD (искаженный или байт SOF внутри
+    данных) пропускается сразу, без ожидания несуществующего хвоста кадра.
+    """
+    start = buffer.find(bytes([SOF]))
+    while start >= 0:
+        if len(buffer) - start < HEADER.size:
+            return None, start
+        _, frame_type, seq, offset, length = HEADER.unpack_from(buffer, start)
+        if length <= MAX_PAYLOAD:
+            break
+        start = buffer.find(bytes([SOF]), start + 1)
+    if start < 0:
+        return None, len(buffer)
+
+    end = start + HEADER.size + length + TRAILER.size
+    if len(buffer) < end:
+        return None, start
+
+    payload = bytes(buffer[start + HEADER.size:end - TRAILER.size])
+    crc, = TRAILER.unpack_from(buffer, end - TRAILER.size)
+    if zlib.crc32(buffer[start:end - TRAILER.size]) != crc:
+        return (frame_type, seq, offset, payload, False), start + 1
+    return (frame_type, seq, offset, payload, True), end
+
+
+def _frame_size(buffer):
+    """Полный размер кадра в начале буфера или размер заголовка, если он еще не принят"""
+    if len(buffer) < HEADER.size:
+        return HEADER.size
+    return HEADER.size + HEADER.unpack_from(buffer)[4] + TRAILER.size
+
+
+class TransferStats:
+    """Статистика передачи: объем, повторы и эффективная скорость
+
+    payload_bytes - объем доставленных данных файлов, encoded_bytes - их
+    объем в кадрах после сжатия, time_saved - оценка сэкономленного сжатием
+    времени. files заполняется списком (путь, статистика файла) для отчета
+    по файлам.
+    """
+
+    def __init__(self):
+        self.payload_bytes = 0
+        self.encoded_bytes = 0
+        self.wire_bytes = 0
+        self.frames = 0
+        self.retransmits = 0
+        self.elapsed = 0.0
+        self.time_saved = 0.0
+        self.files = []
+
+    @property
+    def throughput(self):
+        """Полезная скорость передачи, байт/с"""
+        return self.payload_bytes / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def ratio(self):
+        """Доля объема данных после сжатия"""
+        return self.encoded_bytes / self.payload_bytes if self.payload_bytes else 1.0
+
+    def merge(self, other):
+        self.payload_bytes += other.payload_bytes
+        self.encoded_bytes += other.encoded_bytes
+        self.wire_bytes += other.wire_bytes
+        self.frames += other.frames
+        self.retransmits += other.retransmits
+        self.elapsed += other.elapsed
+        self.time_saved += other.time_saved
+
+    def report(self):
+        """Отчет по файлам: объем, степень сжатия и сэкономленное время"""
+        return "\n".join(f"{path}: {stats.payload_bytes} байт, сжатие {stats.ratio:.0%}, "
+                         f"сэкономлено {stats.time_saved:.1f} с"
+                         for path, stats in self.files)
+
+    def __str__(self):
+        text = (f"{self.payload_bytes} байт за {self.elapsed:.1f} с "
+                f"({self.throughput / 1024:.1f} КБ/с, повторов: {self.retransmits}")
+        if self.encoded_bytes < self.payload_bytes:
+            text += f", сжатие {self.ratio:.0%}, сэкономлено {self.time_saved:.1f} с"
+        return text + ")"
+
+
+class _PendingFrame:
+    """Отправленный, но еще не подтвержденный кадр"""
+
+    __slots__ = ('data', 'length', 'encoded', 'sent_at', 'retries')
+
+    def __init__(self, data, length, encoded):
+        self.data = data
+        self.length = length
+        self.encoded = encoded
+        self.sent_at = 0.0
+        self.retries = 0
+
+
+class SerialTransfer:
+    """Передача файлов со скользящим окном и выборочным повтором кадров"""
+
+    def __init__(self, ser, chunk_size=1024, window=8, ack_timeout=0.5, max_retries=5,
+                 check_cancelled=None):
+        self.ser = ser
+        self.chunk_size = chunk_size
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+        self.check_cancelled = check_cancelled
+        self.stats = TransferStats()
+        self.codec = None
+        self._seq = 0
+        self._reply_buffer = bytearray()
+        self._frame_buffer = bytearray()
+        # Последний подтвержденный служебный кадр: (тип, seq)
+        self._last_control = None
+
+    def negotiate_baudrate(self, baudrates=TRANSFER_BAUDRATES):
+        """Согласование скорости порта с устройством
+
+        Хост предлагает список скоростей, устройство отвечает "ok <скорость>"
+        на текущей скорости, после чего обе стороны переключаются. Если
+        устройство отказалось, не ответило или ответило непонятно, скорость
+        не меняется.
+        """
+        self.ser.write(f"baud {','.join(str(b) for b in baudrates)}\n".encode())
+        reply = self.ser.readline().decode(errors='replace').split()
+        if len(reply) != 2 or reply[0] != 'ok' or not reply[1].isdigit() \
+                or int(reply[1]) not in baudrates:
+            return self.ser.baudrate
+
+        self.ser.flush()
+        self.ser.baudrate = int(reply[1])
+        self.ser.reset_input_buffer()
+        return self.ser.baudrate
+
+    def negotiate_compression(self, codecs=COMPRESSION_CODECS):
+        """Согласование сжатия данных (до согласования скорости)
+
+        Хост предлагает "codec <кодек>,...", устройство отвечает "ok <кодек>"
+        или отказом. Возвращает выбранный кодек или None для передачи без сжатия.
+        """
+        self.ser.write(f"codec {','.join(codecs)}\n".encode())
+        reply = self.ser.readline().decode(errors='replace').split()
+        if len(reply) == 2 and reply[0] == 'ok' and reply[1] in codecs:
+            self.codec = reply[1]
+        else:
+            self.codec = None
+        return self.codec
+
+    def send_file(self, stream, size, progress=None, ranges=None, file_crc=None):
+        """Передача size байт из потока stream
+
+        Если задан ranges - список (смещение, длина) по возрастанию смещений,
+        передаются только эти участки, а file_crc должен содержать CRC32
+        итогового файла целиком. progress вызывается с числом подтвержденных
+        устройством байт. Возвращает статистику передачи этого файла.
+        """
+        stats = TransferStats()
+        started = time.monotonic()
+        self._set_poll_timeout()
+        if ranges is None:
+            ranges = [(0, size)]
+            crc = 0
+        elif file_crc is None:
+            raise ValueError("Для передачи участков файла нужна CRC32 всего файла")
+        chunks = self._encode_chunks(stream, ranges)
+        chunk = next(chunks, None)
+        acked = 0
+        pending = {}
+
+        while chunk is not None or pending:
+            if self.check_cancelled:
+                self.check_cancelled()
+
+            # Заполняем окно новыми кадрами
+            while chunk is not None and len(pending) < self.window:
+                frame_type, offset, payload, data = chunk
+                if file_crc is None:
+                    crc = zlib.crc32(data, crc)
+                seq = self._next_seq()
+                pending[seq] = _PendingFrame(encode_frame(frame_type, seq, offset, payload),
+                                             len(data), len(payload))
+                self._send(pending[seq], stats, retransmit=False)
+                chunk = next(chunks, None)
+
+            reply = self._read_reply(pending)
+            if reply is not None:
+                kind, seq = reply
+                if kind == ACK:
+                    frame = pending.pop(seq)
+                    acked += frame.length
+                    stats.payload_bytes += frame.length
+                    stats.encoded_bytes += frame.encoded
+                    if progress:
+                        progress(acked)
+                else:
+                    self._send(pending[seq], stats, retransmit=True)
+
+            self._resend_expired(pending, stats)
+
+        # Завершающий кадр с размером и CRC32 всего файла
+        self._send_control(FRAME_END, END_PAYLOAD.pack(size, crc if file_crc is None else file_crc),
+                           stats)
+        stats.elapsed = time.monotonic() - started
+        # Сэкономленное время - передача несжатых байт на текущей скорости (8N1)
+        stats.time_saved = (stats.payload_bytes - stats.encoded_bytes) * 10 / self.ser.baudrate
+        self.stats.merge(stats)
+        return stats
+
+    def receive_file(self, out, size, progress=None):
+        """Прием от устройства файла размером size байт в поток out
+
+        Данные пишутся в out строго по порядку смещений, кадры, пришедшие
+        раньше предыдущих, ждут в буфере. Повторно присланные кадры
+        подтверждаются снова, но не записываются. progress вызывается с числом
+        принятых по порядку байт. Возвращает статистику приема.
+        """
+        stats = TransferStats()
+        started = time.monotonic()
+        early = {}
+        position = 0
+        crc = 0
+
+        while True:
+            frame_type, seq, offset, payload = self.read_frame(stats)
+            if frame_type == FRAME_DATA:
+                if offset >= position and offset + len(payload) <= size:
+                    early[offset] = payload
+                while position in early:
+                    data = early.pop(position)
+                    out.write(data)
+                    crc = zlib.crc32(data, crc)
+                    position += len(data)
+                    stats.payload_bytes += len(data)
+                    stats.encoded_bytes += len(data)
+                    if progress:
+                        progress(position)
+                self.ack(frame_type, seq)
+            elif frame_type == FRAME_END:
+                if payload != END_PAYLOAD.pack(size, crc) or position != size:
+                    self.ser.write(encode_reply(CAN, seq))
+                    raise TransferError("Контрольная сумма принятого файла не совпадает")
+                self.ack(frame_type, seq)
+                break
+            else:
+                self.ser.write(encode_reply(CAN, seq))
+                raise TransferError(f"Неизвестный тип кадра: {frame_type}")
+
+        stats.elapsed = time.monotonic() - started
+        self.stats.merge(stats)
+        return stats
+
+    def send_header(self, text):
+        """Строка заголовка (число файлов, путь и размер файла) кадром с CRC32"""
+        payload = text.encode('utf-8')
+        if len(payload) > MAX_PAYLOAD:
+            raise TransferError(f"Слишком длинный заголовок: {text[:40]}...")
+        stats = TransferStats()
+        self._set_poll_timeout()
+        self._send_control(FRAME_HEADER, payload, stats)
+        self.stats.merge(stats)
+
+    def receive_header(self):
+        """Прием строки, отправленной send_header"""
+        stats = TransferStats()
+        frame_type, seq, _, payload = self.read_frame(stats)
+        self.stats.merge(stats)
+        if frame_type != FRAME_HEADER:
+            self.ser.write(encode_reply(CAN, seq))
+            raise TransferError(f"Вместо заголовка получен кадр типа {frame_type}")
+        self.ack(frame_type, seq)
+        return payload.decode('utf-8', errors='replace')
+
+    def close(self):
+        """Завершение сеанса передачи
+
+        Все файлы к этому моменту уже подтверждены, кадр только сообщает
+        получателю, что повторов завершающего кадра больше не будет, поэтому
+        его неподтверждение не считается ошибкой.
+        """
+        stats = TransferStats()
+        self._set_poll_timeout()
+        try:
+            self._send_control(FRAME_CLOSE, b'', stats)
+        except TransferError:
+            pass
+        self.stats.merge(stats)
+
+    def wait_close(self):
+        """Ожидание завершения сеанса отправителем (close)
+
+        До него повторы последнего служебного кадра подтверждаются снова.
+        Возвращает False, если завершение не пришло.
+        """
+        try:
+            frame_type, seq, _, _ = self.read_frame(TransferStats())
+        except TransferError:
+            return False
+        if frame_type != FRAME_CLOSE:
+            return False
+        self.ack(frame_type, seq)
+        return True
+
+    def ack(self, frame_type, seq):
+        """Подтверждение кадра; служебный кадр запоминается, чтобы подтвердить его повтор"""
+        self.ser.write(encode_reply(ACK, seq))
+        if frame_type in CONTROL_FRAMES:
+            self._last_control = (frame_type, seq)
+
+    def read_frame(self, stats):
+        """Следующий кадр с верной CRC32: (тип, seq, смещение, данные)
+
+        На кадр с неверной CRC32 отвечает NAK, на повтор последнего
+        подтвержденного служебного кадра - снова ACK. Если отправитель
+        молчит дольше, чем длятся все его повторы, выбрасывает TransferError.
+        """
+        self._set_poll_timeout()
+        buffer = self._frame_buffer
+        last_data = head_since = time.monotonic()
+        while True:
+            if self.check_cancelled:
+                self.check_cancelled()
+
+            frame, used = decode_frame(buffer)
+            if used:
+                del buffer[:used]
+                head_since = time.monotonic()
+            if frame is not None:
+                frame_type, seq, offset, payload, crc_ok = frame
+                stats.frames += 1
+                if not crc_ok:
+                    stats.retransmits += 1
+                    self.ser.write(encode_reply(NAK, seq))
+                elif (frame_type, seq) == self._last_control:
+                    # Подтверждение потерялось, и отправитель повторил кадр
+                    self.ser.write(encode_reply(ACK, seq))
+                else:
+                    return frame_type, seq, offset, payload
+                continue
+
+            # Остаток текущего кадра одним чтением: in_waiting у socket://
+            # сообщает только о наличии данных (0 или 1), а не об их объеме
+            data = self.ser.read(max(_frame_size(buffer) - len(buffer), self.ser.in_waiting))
+            now = time.monotonic()
+            if data:
+                if not buffer:
+                    head_since = now
+                buffer += data
+                stats.wire_bytes += len(data)
+                last_data = now
+            elif now - last_data > self.ack_timeout * (self.max_retries + 1):
+                raise TransferError("Передающая сторона перестала отвечать")
+            # Кадр, который не пришел за время его передачи по линии (8N1)
+            # и таймаут, начинается с искаженного заголовка или с байта SOF
+            # внутри данных - ищем следующий, повторы отправителя идут после него
+            if buffer and now - head_since > \
+                    self.ack_timeout + _frame_size(buffer) * 10 / self.ser.baudrate:
+                del buffer[:1]
+                head_since = now
+
+    def _encode_chunks(self, stream, ranges):
+        """Данные кадров файла: (тип кадра, смещение, полезная нагрузка, исходные данные)
+
+        Без сжатия участки режутся на куски по chunk_size. Со сжатием блоки
+        по COMPRESSED_BLOCK_SIZE сжимаются независимо, чтобы устройство
+        могло распаковать кадр, пришедший не по порядку.
+        """
+        if self.codec is None:
+            for offset, data in self._read_chunks(stream, ranges, self.chunk_size):
+                yield FRAME_DATA, offset, data, data
+            return
+
+        wbits = int(self.codec.split(':')[1])
+        raw_total = encoded_total = 0
+        for offset, data in self._read_chunks(stream, ranges, COMPRESSED_BLOCK_SIZE):
+            if raw_total >= COMPRESSION_SAMPLE and encoded_total > raw_total * COMPRESSION_MIN_GAIN:
+                # Файл практически не сжимается - не тратим время на попытки
+                for start in range(0, len(data), self.chunk_size):
+                    piece = data[start:start + self.chunk_size]
+                    yield FRAME_DATA, offset + start, piece, piece
+                continue
+            for chunk in self._compress_block(offset, data, wbits):
+                raw_total += len(chunk[3])
+                encoded_total += len(chunk[2])
+                yield chunk
+
+    def _compress_block(self, offset, data, wbits):
+        """Кадры для одного блока данных
+
+        Блок передается сжатым, если сжатые данные помещаются в кадр и меньше
+        исходных; иначе половины блока обрабатываются по отдельности.
+        """
+        packed = deflate_raw(data, wbits)
+        if len(packed) <= self.chunk_size and len(packed) < len(data):
+            yield FRAME_DEFLATE, offset, packed, data
+        elif len(data) <= self.chunk_size:
+            yield FRAME_DATA, offset, data, data
+        else:
+            half = len(data) // 2
+            yield from self._compress_block(offset, data[:half], wbits)
+            yield from self._compress_block(offset + half, data[half:], wbits)
+
+    def _read_chunks(self, stream, ranges, chunk_size):
+        """Чтение участков потока кусками по chunk_size: (смещение, данные)
+
+        Промежутки между участками пропускаются через seek, а для потоков
+        без произвольного доступа - чтением с отбрасыванием данных.
+        """
+        position = 0
+        for start, length in ranges:
+            if start > position:
+                if stream.seekable():
+                    stream.seek(start)
+                else:
+                    skip = start - position
+                    while skip:
+                        skipped = len(stream.read(min(skip, 64 * 1024)))
+                        if not skipped:
+                            break
+                        skip -= skipped
+                position = start
+
+            end = start + length
+            while position < end:
+                data = stream.read(min(chunk_size, end - position))
+                if not data:
+                    raise TransferError(f"Файл короче ожидаемого: {position} из {end} байт")
+                yield position, data
+                position += len(data)
+
+    def _send_control(self, frame_type, payload, stats):
+        """Служебный кадр с ожиданием подтверждения"""
+        seq = self._next_seq()
+        frame = encode_frame(frame_type, seq, 0, payload)
+        pending = {seq: _PendingFrame(frame, 0, 0)}
+        self._send(pending[seq], stats, retransmit=False)
+        while True:
+            reply = self._read_reply(pending)
+            if reply is not None:
+                if reply[0] == ACK:
+                    return
+                self._send(pending[seq], stats, retransmit=True)
+            self._resend_expired(pending, stats)
+
+    def _set_poll_timeout(self):
+        # Присваивание timeout перенастраивает порт, поэтому только при изменении
+        if self.ser.timeout != POLL_TIMEOUT:
+            self.ser.timeout = POLL_TIMEOUT
+
+    def _next_seq(self):
+        seq = self._seq
+        self._seq = (self._seq + 1) & 0xFFFF
+        return seq
+
+    def _send(self, frame, stats, retransmit):
+        if retransmit:
+            frame.retries += 1
+            stats.retransmits += 1
+            if frame.retries > self.max_retries:
+                raise TransferError("Превышено число повторных отправок кадра")
+        self.ser.write(frame.data)
+        frame.sent_at = time.monotonic()
+        stats.frames += 1
+        stats.wire_bytes += len(frame.data)
+
+    def _resend_expired(self, pending, stats):
+        now = time.monotonic()
+        for frame in pending.values():
+            if now - frame.sent_at >= self.ack_timeout:
+                self._send(frame, stats, retransmit=True)
+
+    def _read_reply(self, pending):
+        """Чтение одного ответа устройства на кадры из окна
+
+        Ждет не дольше, чем осталось до таймаута самого старого кадра.
+        Посторонние байты, ответы с неверной проверкой номера и ответы на уже
+        подтвержденные кадры пропускаются.
+        """
+        deadline = min(frame.sent_at for frame in pending.values()) + self.ack_timeout
+        buffer = self._reply_buffer
+        while True:
+            while len(buffer) >= REPLY.size:
+                kind, seq, check = REPLY.unpack_from(buffer)
+                if kind not in (ACK, NAK, CAN) or check != seq ^ 0xFFFF:
+                    del buffer[0]
+                    continue
+                del buffer[:REPLY.size]
+                if kind == CAN:
+                    raise TransferError("Устройство прервало передачу")
+                if seq in pending:
+                    return kind, seq
+
+            if time.monotonic() >= deadline:
+                return None
+            buffer += self.ser.read(max(REPLY.size - len(buffer), self.ser.in_waiting))
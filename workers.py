@@ -0,0 +1,220 @@
+import time
+import threading
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from core import Operation, describe_error
+from discovery import PortMonitor
+from errors import OperationCancelled, UpdateError
+from fleet import DEFAULT_MAX_WORKERS
+from prefetch import DEFAULT_INTERVAL, DEFAULT_JITTER, Prefetcher
+
+
+class ProgressThrottle:
+    """Ограничение частоты сигналов прогресса
+
+    Сигнал отправляется только при изменении значения и не чаще одного раза
+    за interval секунд; крайние значения 0 и 100 пропускаются всегда.
+    """
+
+    def __init__(self, emit, interval=0.1):
+        self.emit = emit
+        self.interval = interval
+        self._last_value = None
+        self._last_time = 0.0
+
+    def __call__(self, value):
+        value = max(0, min(100, int(value)))
+        if value == self._last_value:
+            return
+        now = time.monotonic()
+        if value not in (0, 100) and now - self._last_time < self.interval:
+            return
+        self._last_value = value
+        self._last_time = now
+        self.emit(value)
+
+
+class Worker(QThread):
+    """Базовый фоновый обработчик операции
+
+    Подклассы реализуют execute(); результат или ошибка возвращаются
+    в GUI-поток через сигналы, отмена - через requestInterruption().
+    """
+
+    progress = pyqtSignal(int)
+    status = pyqtSignal(str)
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    error_prefix = ""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.report_progress = ProgressThrottle(self.progress.emit)
+        self.operation = Operation(self.report_progress, self.status.emit, self.check_cancelled)
+
+    def cancel(self):
+        """Запрос отмены операции"""
+        self.requestInterruption()
+
+    def check_cancelled(self):
+        """Прерывание операции, если пользователь запросил отмену"""
+        if self.isInterruptionRequested():
+            raise OperationCancelled()
+
+    def run(self):
+        try:
+            result = self.execute()
+        except OperationCancelled:
+            self.cancelled.emit()
+        except UpdateError as e:
+            self.failed.emit(str(e))
+        except Exception as e:
+            self.failed.emit(self.describe_error(e))
+        else:
+            self.succeeded.emit(result)
+
+    def execute(self):
+        raise NotImplementedError
+
+    def describe_error(self, error):
+        """Текст сообщения для непредвиденной ошибки"""
+        return describe_error(error, self.error_prefix)
+
+
+class CheckUpdatesWorker(Worker):
+    """Проверка и загрузка последнего релиза с GitHub"""
+
+    error_prefix = "Ошибка проверки обновлений: "
+
+    def __init__(self, core, parent=None):
+        super().__init__(parent)
+        self.core = core
+
+    def execute(self):
+        return self.core.fetch_release(self.operation)
+
+
+class InstallWorker(Worker):
+    """Резервное копирование и установка обновления на устройство"""
+
+    error_prefix = "Ошибка установки обновления: "
+
+    def __init__(self, core, port, release, parent=None):
+        super().__init__(parent)
+        self.core = core
+        self.port = port
+        self.release = release
+
+    def execute(self):
+        return self.core.install(self.port, self.release, self.operation)
+
+
+class RollbackWorker(Worker):
+    """Восстановление последней резервной копии на устройстве"""
+
+    error_prefix = "Ошибка отката версии: "
+
+    def __init__(self, core, port, parent=None):
+        super().__init__(parent)
+        self.core = core
+        self.port = port
+
+    def execute(self):
+        return self.core.rollback(self.port, self.operation)
+
+
+class FleetWorker(Worker):
+    """Параллельное обновление всех выбранных устройств"""
+
+    port_progress = pyqtSignal(str, int)
+    port_status = pyqtSignal(str, str)
+
+    error_prefix = "Ошибка группового обновления: "
+
+    def __init__(self, core, ports, release, max_workers=DEFAULT_MAX_WORKERS, parent=None):
+        super().__init__(parent)
+        self.core = core
+        self.ports = list(ports)
+        self.release = release
+        self.max_workers = max_workers
+        self._port_percent = dict.fromkeys(self.ports, 0)
+        self._progress_lock = threading.Lock()
+        self._port_throttles = {
+            port: ProgressThrottle(lambda value, port=port: self.port_progress.emit(port, value))
+            for port in self.ports
+        }
+
+    def execute(self):
+        return self.core.fleet(self.ports, self.release, self.operation, self.max_workers,
+                               on_port_progress=self.on_port_progress,
+                               on_port_status=self.port_status.emit)
+
+    def on_port_progress(self, port, done, total):
+        """Прогресс одного порта; общий прогресс - среднее по всем портам"""
+        percent = done * 100 // total if total else 100
+        with self._progress_lock:
+            self._port_percent[port] = percent
+            self._port_throttles[port](percent)
+            self.report_progress(sum(self._port_percent.values()) // len(self.ports))
+
+
+class PortMonitorWorker(QThread):
+    """Отслеживание подключения устройств и опрос их версий в фоне
+
+    Сигналы передают в GUI-поток изменения списка портов (список PortInfo,
+    добавленные PortInfo, имена отключенных портов) и результаты опроса.
+    """
+
+    ports_changed = pyqtSignal(object, object, object)
+    probed = pyqtSignal(object)
+
+    def __init__(self, discovery, parent=None):
+        super().__init__(parent)
+        self.monitor = PortMonitor(discovery, self.ports_changed.emit, self.probed.emit)
+
+    def request_probe(self, ports=None):
+        self.monitor.request_probe(ports)
+
+    def pause(self):
+        self.monitor.pause()
+
+    def resume(self):
+        self.monitor.resume()
+
+    def stop(self):
+        self.monitor.stop()
+
+    def run(self):
+        self.monitor.run()
+
+
+class PrefetchWorker(QThread):
+    """Фоновая загрузка новых релизов по расписанию
+
+    staged передает в GUI-поток релиз, готовый к установке, status -
+    сообщения о ходе и ошибках загрузки.
+    """
+
+    staged = pyqtSignal(object)
+    status = pyqtSignal(str)
+
+    def __init__(self, core, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER, max_rate=None,
+                 parent=None):
+        super().__init__(parent)
+        self.prefetcher = Prefetcher(core, interval, jitter, max_rate,
+                                     self.staged.emit, self.status.emit)
+
+    def pause(self):
+        self.prefetcher.pause()
+
+    def resume(self):
+        self.prefetcher.resume()
+
+    def stop(self):
+        self.prefetcher.stop()
+
+    def run(self):
+        self.prefetcher.run()